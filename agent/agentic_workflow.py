@@ -1,45 +1,169 @@
 
-from utils.model_loader import ModelLoader
-from prompt_library.prompt import SYSTEM_PROMPT
+import json
+import time
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.messages import SystemMessage, ToolMessage
+from utils.model_router import ModelRouter, STRONG
+from prompt_library.prompt import build_system_prompt
 from langgraph.graph import StateGraph, MessagesState, END, START
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 from tools.calendar_tool import CalendarTool
+from utils.tracing import registry, span, traced
+from exception import CalendarAuthError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tools that change the calendar. Running one invalidates memoized read results.
+MUTATING_TOOLS = {"create_event", "update_event", "move_event", "delete_event", "delete_events_in_range", "quick_add_event"}
+# Answers that change without any call in the request (job progress): never served from the memo
+UNCACHED_TOOLS = {"get_job_status"}
+
+BUDGET_EXHAUSTED_PROMPT = SystemMessage(content=(
+    "The step budget for this request is exhausted. Do not call any more tools. "
+    "Answer the user now using only the information already gathered above, and say "
+    "briefly what could not be completed."
+))
+
+
+class AgentState(MessagesState):
+    """Messages plus per-request budget and tool memo bookkeeping."""
+    steps: int
+    started_at: float
+    tool_cache: Dict[str, str]
+    tool_calls: int
+    duplicate_tool_calls: int
+    budget_exhausted: bool
+    # Per-request prompt context (see prompt_library/prompt.py)
+    timezone: Optional[str]
+    thread_summary: Optional[str]
+
+
+def tool_call_key(name: str, args: Dict[str, Any]) -> str:
+    """Stable key for a tool call: same name and arguments give the same key."""
+    return f"{name}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+def initial_state(question: str, history: Sequence[Any] = (), timezone: Optional[str] = None,
+                  thread_summary: Optional[str] = None) -> Dict[str, Any]:
+    """Fresh per-request state; resets the budget even when a checkpointer restores older state.
+    `history` holds earlier turns of the conversation, oldest first; `thread_summary` covers the
+    turns before those. Both, and the user's time zone, go into the system prompt suffix."""
+    return {
+        "messages": [*history, question],
+        "steps": 0,
+        "started_at": time.time(),
+        "tool_cache": {},
+        "tool_calls": 0,
+        "duplicate_tool_calls": 0,
+        "budget_exhausted": False,
+        "timezone": timezone,
+        "thread_summary": thread_summary,
+    }
+
 
 class GraphBuilder():
-    def __init__(self,model_provider: str = "groq"):
-        self.model_loader = ModelLoader(model_provider=model_provider)
-        self.llm = self.model_loader.load_llm()
+    def __init__(self,model_provider: Optional[str] = None, router: ModelRouter = None, calendar_tool: CalendarTool = None):
+        # Fast model for tool selection / intermediate steps, strong model for the final answer,
+        # with failover across the providers configured in config.yaml
+        self.router = router or ModelRouter(preferred_provider=model_provider)
+        agent_config = self.router.config.get("agent") or {}
+        self.max_steps = int(agent_config.get("max_steps", 8))
+        self.max_seconds = float(agent_config.get("max_seconds", 60))
         self.tools = []
-        self.calendar_tools = CalendarTool()
+        self.calendar_tools = calendar_tool or CalendarTool()
         self.tools.extend(self.calendar_tools.calendar_tool_list)
-        self.llm_with_tools = self.llm.bind_tools(tools=self.tools)
+        self.tools_by_name = {t.name: t for t in self.tools}
+        self.router.bind_tools(self.tools)
         self.graph = None
-        self.system_prompt = SYSTEM_PROMPT
 
-    def agent_function(self, state: MessagesState):
+    def budget_exhausted(self, state: AgentState) -> bool:
+        steps = state.get("steps", 0)
+        started_at = state.get("started_at") or time.time()
+        return steps + 1 >= self.max_steps or time.time() - started_at >= self.max_seconds
+
+    def agent_function(self, state: AgentState):
         """Main agent function. Maintains short-term memory of last 8 messages (user and AI)."""
         messages = state["messages"]
         # Keep only the last 8 messages for short-term memory
         if len(messages) > 8:
             messages = messages[-8:]
-        input_question = [self.system_prompt] + messages
-        response = self.llm_with_tools.invoke(input_question)
+        # Rebuilt per call: static cacheable prefix + fresh clock, time zone and thread summary in the suffix
+        input_question = [build_system_prompt(state.get("timezone"), state.get("thread_summary"))] + messages
+        exhausted = self.budget_exhausted(state)
+        if exhausted:
+            # Last allowed step: force a final answer without tools
+            response = self.router.invoke(input_question + [BUDGET_EXHAUSTED_PROMPT], tier=STRONG, with_tools=False)
+        else:
+            response = self.router.invoke_step(input_question)
         # Update state with new message, again keeping only last 8
         new_messages = messages + [response]
         if len(new_messages) > 8:
             new_messages = new_messages[-8:]
-        return {"messages": new_messages}
+        return {
+            "messages": new_messages,
+            "steps": state.get("steps", 0) + 1,
+            "started_at": state.get("started_at") or time.time(),
+            "budget_exhausted": exhausted,
+        }
+
+    def tool_function(self, state: AgentState):
+        """Run the requested tools, answering repeated calls (same name and arguments) from the per-request memo."""
+        last_message = state["messages"][-1]
+        cache = dict(state.get("tool_cache") or {})
+        duplicates = state.get("duplicate_tool_calls", 0)
+        results = []
+        for call in last_message.tool_calls:
+            key = tool_call_key(call["name"], call["args"])
+            failed = False
+            if key in cache:
+                duplicates += 1
+                registry.inc("scheduler_tool_memo_hits_total", {"tool": call["name"]})
+                content = cache[key] + "\n\n(Memoized: this tool was already called with the same arguments for this request. Use this result instead of calling it again.)"
+            else:
+                tool = self.tools_by_name.get(call["name"])
+                failed = tool is None
+                if tool is None:
+                    content = f"❌ Unknown tool: {call['name']}."
+                else:
+                    try:
+                        with span("tool", call["name"]):
+                            content = str(tool.invoke(call["args"]))
+                    except CalendarAuthError:
+                        # Not something the model can fix: the request fails with 401
+                        raise
+                    except Exception as e:
+                        # Invalid arguments or a failing tool: report it to the model (as ToolNode did) so it can retry
+                        logger.warning(f"Tool {call['name']} failed: {e!r}")
+                        content = f"Error: {e!r}\n Please fix your mistakes."
+                        failed = True
+                if call["name"] in MUTATING_TOOLS:
+                    # Reads made before a write may now be stale
+                    cache = {k: v for k, v in cache.items() if k.split(":", 1)[0] in MUTATING_TOOLS}
+                if not failed and call["name"] not in UNCACHED_TOOLS:
+                    cache[key] = content
+            results.append(ToolMessage(content=content, tool_call_id=call["id"], name=call["name"], status="error" if failed else "success"))
+        return {
+            "messages": results,
+            "tool_cache": cache,
+            "tool_calls": state.get("tool_calls", 0) + len(last_message.tool_calls),
+            "duplicate_tool_calls": duplicates,
+        }
+
+    def route_after_agent(self, state: AgentState):
+        if state.get("budget_exhausted"):
+            return END
+        return tools_condition(state)
 
     def build_graph(self):
-        graph_builder = StateGraph(MessagesState)
-        graph_builder.add_node("agent", self.agent_function)
-        graph_builder.add_node("tools", ToolNode(tools=self.tools))
+        graph_builder = StateGraph(AgentState)
+        graph_builder.add_node("agent", traced("node", "agent")(self.agent_function))
+        graph_builder.add_node("tools", traced("node", "tools")(self.tool_function))
         graph_builder.add_edge(START, "agent")
-        graph_builder.add_conditional_edges("agent", tools_condition)
+        graph_builder.add_conditional_edges("agent", self.route_after_agent, {"tools": "tools", END: END})
         graph_builder.add_edge("tools", "agent")
-        graph_builder.add_edge("agent", END)
         self.graph = graph_builder.compile()
         return self.graph
 
     def __call__(self):
-        return self.build_graph()
\ No newline at end of file
+        return self.build_graph()
@@ -0,0 +1,110 @@
+"""
+Event archive benchmark: seeds the in-memory Calendar fake with years of
+events, then answers whole-history searches and year-long durations through
+the calendar tools twice, once by listing events from the API and once from
+the memory-mapped archive (utils/event_archive.py). Reports latency, API calls,
+archive size and reopen time, and checks that both paths agree and that a
+change made through the client reaches the archive on the next query.
+
+Usage:
+    python -m benchmarks.archive_benchmark
+    python -m benchmarks.archive_benchmark --events 100000 --years 10 --latency-ms 40
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from tools.calendar_tool import CalendarTool
+from utils.calendar_api import GoogleCalendarAPI
+from utils.event_archive import EventArchive
+
+QUERIES = [
+    ("smart_event_search", {"description": "dentist", "search_recent": False}),
+    ("smart_event_search", {"description": "1:1 with Priya", "search_recent": False}),
+    # Only in descriptions ("Bring laptop"): the archive must match those too
+    ("smart_event_search", {"description": "laptop", "search_recent": False}),
+    ("get_events_duration", {"time_min": "{year}-01-01T00:00:00+00:00", "time_max": "{next_year}-01-01T00:00:00+00:00"}),
+]
+
+
+def time_query(tool, args, iterations: int):
+    timings, output = [], None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output = tool.invoke(args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), output
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--events", type=int, default=50000)
+    arg_parser.add_argument("--years", type=int, default=5)
+    arg_parser.add_argument("--iterations", type=int, default=5)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated API latency per call")
+    args = arg_parser.parse_args()
+
+    service = FakeCalendarService(latency=(lambda: args.latency_ms / 1000) if args.latency_ms else None)
+    anchor = datetime.datetime.now(datetime.timezone.utc)
+    seed_service(service, calendars=1, events_per_calendar=args.events, recurring_per_calendar=8, anchor=anchor, days=365 * args.years)
+    year = anchor.year - 1
+    queries = [(name, {key: value.format(year=year, next_year=year + 1) if isinstance(value, str) else value for key, value in query.items()})
+               for name, query in QUERIES]
+
+    plain_tools = {tool.name: tool for tool in CalendarTool(api=GoogleCalendarAPI(service=service)).calendar_tool_list}
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = EventArchive(tmp)
+        api = GoogleCalendarAPI(service=service, archive=archive)
+        archive_tools = {tool.name: tool for tool in CalendarTool(api=api).calendar_tool_list}
+
+        start = time.perf_counter()
+        archive.sync(api, "primary")
+        sync_seconds = time.perf_counter() - start
+        archive.close()
+        start = time.perf_counter()
+        archive = EventArchive(tmp)
+        reopen_ms = (time.perf_counter() - start) * 1000
+        api.archive = archive
+        api.event_cache.on_sync = archive.apply
+        archive.sync(api, "primary")
+        stats = archive.stats()
+        print(f"Archive: {stats['live_rows']} events, {stats['strings']} strings, {stats['bytes'] / 2 ** 20:.1f} MiB on disk; "
+              f"initial sync {sync_seconds:.1f}s, reopen {reopen_ms:.0f} ms")
+
+        print(f"{'query':<52} {'API ms':>9} {'calls':>6} {'archive ms':>11} {'calls':>6}")
+        for name, query in queries:
+            service.calls.clear()
+            plain_ms, plain_output = time_query(plain_tools[name], query, args.iterations)
+            plain_calls = sum(service.calls.values()) / args.iterations
+            service.calls.clear()
+            archive_ms, archive_output = time_query(archive_tools[name], query, args.iterations)
+            archive_calls = sum(service.calls.values()) / args.iterations
+            label = f"{name}({query.get('description') or year})"
+            print(f"{label:<52} {plain_ms:>9.1f} {plain_calls:>6.1f} {archive_ms:>11.1f} {archive_calls:>6.1f}")
+            if plain_output != archive_output:
+                failed = True
+                print(f"  MISMATCH\n    API:     {plain_output!r}\n    archive: {archive_output!r}")
+
+        # A write through the client marks the archive stale, so the next query syncs it incrementally
+        created = api.create_event("primary", {"summary": "Archive probe", "start": {"dateTime": f"{year}-03-03T10:00:00+00:00"},
+                                               "end": {"dateTime": f"{year}-03-03T11:00:00+00:00"}})
+        found = "Archive probe" in archive_tools["smart_event_search"].invoke({"description": "archive probe", "search_recent": False})
+        api.delete_event("primary", created["id"])
+        gone = "Archive probe" not in archive_tools["smart_event_search"].invoke({"description": "archive probe", "search_recent": False})
+        print(f"Writes visible to the archive on the next query: created={found} deleted={gone}")
+        failed = failed or not (found and gone)
+        archive.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
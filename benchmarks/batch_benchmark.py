@@ -0,0 +1,131 @@
+"""
+Batch and multi-worker benchmark, offline (in-memory Calendar fake, scripted
+chat model with a simulated per-call latency).
+
+Answers every scenario question once through sequential /query requests and
+once through a single /query/batch request, and reports wall time, throughput
+and whether the answers match. It then checks the state shared between worker
+processes (utils/shared_state.py): two Calendar clients with their own
+SharedState connection stand in for two workers, and a change written through
+one must reach the other's event cache on its next read.
+
+Usage:
+    python -m benchmarks.batch_benchmark
+    python -m benchmarks.batch_benchmark --llm-latency-ms 200 --repeat 4 --concurrency 16
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from benchmarks.run_benchmarks import SCENARIOS_PATH
+from benchmarks.scripted_llm import ScriptedChatModel, load_scenarios
+from utils.calendar_api import GoogleCalendarAPI
+from utils.shared_state import SharedState
+
+
+def build_graph(service: FakeCalendarService, scenarios, latency_seconds: float):
+    from agent.agentic_workflow import GraphBuilder
+    from tools.calendar_tool import CalendarTool
+    from utils.model_router import ModelRouter
+
+    llm = ScriptedChatModel.from_scenarios(scenarios, latency=(lambda: latency_seconds) if latency_seconds else None)
+    router = ModelRouter.from_llm(llm, provider="scripted", model_name="scripted")
+    return GraphBuilder(router=router, calendar_tool=CalendarTool(api=GoogleCalendarAPI(service=service)))()
+
+
+def compare_batch(graph, questions, concurrency: int) -> bool:
+    from fastapi.testclient import TestClient
+    from main import app, authenticated_user, get_graph
+
+    app.dependency_overrides[get_graph] = lambda: graph
+    # Act as the local user without an API key
+    app.dependency_overrides[authenticated_user] = lambda: None
+    try:
+        with TestClient(app) as client:
+            start = time.perf_counter()
+            sequential = []
+            for question in questions:
+                response = client.post("/query", json={"question": question})
+                response.raise_for_status()
+                sequential.append(response.json()["answer"])
+            sequential_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = client.post("/query/batch", json={"questions": questions, "max_concurrency": concurrency})
+            response.raise_for_status()
+            batch_seconds = time.perf_counter() - start
+            results = response.json()["results"]
+    finally:
+        app.dependency_overrides.pop(get_graph, None)
+        app.dependency_overrides.pop(authenticated_user, None)
+
+    batched = [result.get("answer") for result in results]
+    errors = [result["error"] for result in results if "error" in result]
+    print(f"{len(questions)} questions:")
+    print(f"  sequential /query  {sequential_seconds:>7.2f}s  {len(questions) / sequential_seconds:>7.1f} q/s")
+    print(f"  /query/batch       {batch_seconds:>7.2f}s  {len(questions) / batch_seconds:>7.1f} q/s  "
+          f"(concurrency {concurrency}, {sequential_seconds / batch_seconds:.1f}x)")
+    same = batched == sequential and not errors
+    print(f"  answers match: {same}" + (f", errors: {errors[:3]}" if errors else ""))
+    return same
+
+
+def check_shared_cache(service: FakeCalendarService) -> bool:
+    """Two workers' clients for the same user: a write through one is seen by the other's cache."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared_state.db")
+        first_state, second_state = SharedState(path), SharedState(path)
+        first = GoogleCalendarAPI(service=service, shared_state=first_state, cache_scope="user-a")
+        second = GoogleCalendarAPI(service=service, shared_state=second_state, cache_scope="user-a")
+        day = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=400)
+        time_min, time_max = day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()
+
+        first.event_cache.watch("primary")
+        watched_elsewhere = second.event_cache.is_watched("primary")
+        before = len(second.get_events("primary", time_min, time_max))
+        service.calls.clear()
+        second.get_events("primary", time_min, time_max)
+        cached_calls = sum(service.calls.values())
+
+        created = first.create_event("primary", {"summary": "Shared cache probe", "start": {"dateTime": (day + datetime.timedelta(hours=9)).isoformat()},
+                                                 "end": {"dateTime": (day + datetime.timedelta(hours=10)).isoformat()}})
+        after_create = len(second.get_events("primary", time_min, time_max))
+        first.delete_event("primary", created["id"])
+        after_delete = len(second.get_events("primary", time_min, time_max))
+        first_state.close()
+        second_state.close()
+
+    ok = watched_elsewhere and cached_calls == 0 and after_create == before + 1 and after_delete == before
+    print(f"Shared state across workers: watch visible={watched_elsewhere}, cached read API calls={cached_calls}, "
+          f"events {before} -> {after_create} after create -> {after_delete} after delete: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--events", type=int, default=2000, help="one-off events per calendar")
+    arg_parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="simulated latency of each model call")
+    arg_parser.add_argument("--repeat", type=int, default=2, help="times each scenario question appears in the batch")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    args = arg_parser.parse_args()
+
+    service = FakeCalendarService()
+    seed_service(service, calendars=2, events_per_calendar=args.events, recurring_per_calendar=8)
+    scenarios = load_scenarios(SCENARIOS_PATH)
+    questions = [scenario["question"] for scenario in scenarios] * args.repeat
+    graph = build_graph(service, scenarios, args.llm_latency_ms / 1000)
+
+    ok = compare_batch(graph, questions, args.concurrency)
+    ok = check_shared_cache(service) and ok
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
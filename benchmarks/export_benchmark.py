@@ -0,0 +1,106 @@
+"""
+Export benchmark: streams a large calendar from the in-memory Calendar fake
+through every export format and reports events/s, output size and peak
+memory, to check that exports stay flat in memory as calendars grow. It also
+checks that the partial-response selector fetches every field an export
+writes (the fake honours `fields` like the API does), that RFC3339 range
+bounds are used as given, and that unknown fields are rejected up front.
+
+Usage:
+    python -m benchmarks.export_benchmark
+    python -m benchmarks.export_benchmark --events 300000 --formats jsonl,parquet --fields id,summary,start,end
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Optional
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from utils.calendar_api import GoogleCalendarAPI
+from utils.event_export import FORMATS, export_events, parse_fields, project, resolve_range
+
+
+def run_export(api: GoogleCalendarAPI, fmt: str, fields, trace_memory: bool) -> Dict[str, Optional[float]]:
+    stats: Dict[str, int] = {}
+    size = 0
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for chunk in export_events(api, "primary", fmt=fmt, fields=fields, stats=stats):
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"events": stats["events"], "seconds": elapsed, "events_per_s": stats["events"] / elapsed if elapsed else 0.0,
+            "mib": size / 2 ** 20, "peak_mib": peak / 2 ** 20 if peak is not None else None}
+
+
+def check_projection(api: GoogleCalendarAPI) -> bool:
+    """Every value an export writes must have been fetched: compare against full events."""
+    full = [event for page in api.iter_event_pages("primary") for event in page]
+    expected_ics = sum(bool(event.get(key)) for event in full for key in ("description", "location"))
+    ics = b"".join(export_events(api, "primary", fmt="ics")).decode("utf-8").replace("\r\n ", "")
+    written_ics = sum(line.startswith(("DESCRIPTION:", "LOCATION:")) for line in ics.split("\r\n"))
+    fields = ["id", "summary", "location", "organizer.email"]
+    expected_rows = [project(event, fields, "primary") for event in full]
+    rows = [json.loads(line) for line in b"".join(export_events(api, "primary", fmt="jsonl", fields=fields)).splitlines()]
+    ok = written_ics == expected_ics and rows == expected_rows
+    print(f"Projection: ICS description/location {written_ics}/{expected_ics}, "
+          f"JSONL {','.join(fields)} {'complete' if rows == expected_rows else 'INCOMPLETE'}: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def check_request_validation() -> bool:
+    """Day bounds cover whole days, RFC3339 bounds are kept, unknown fields fail before anything streams."""
+    day_min, day_max = resolve_range("2025-03-01", "2025-03-02")
+    exact_min, exact_max = resolve_range("2025-03-01T09:00:00+00:00", "2025-03-01T17:30:00+00:00")
+    ranges_ok = (day_min.startswith("2025-03-01T00:00:00") and day_max.startswith("2025-03-02T23:59:59")
+                 and exact_min == "2025-03-01T09:00:00+00:00" and exact_max == "2025-03-01T17:30:00+00:00")
+    try:
+        parse_fields("id,summary,organizer.email,start,bogus")
+        fields_ok = False
+    except ValueError:
+        fields_ok = True
+    ok = ranges_ok and fields_ok
+    print(f"Request validation: ranges {'ok' if ranges_ok else f'WRONG ({exact_min} .. {exact_max})'}, "
+          f"unknown field {'rejected' if fields_ok else 'ACCEPTED'}: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--events", type=int, default=200000)
+    arg_parser.add_argument("--days", type=int, default=3650, help="spread events over this many days")
+    arg_parser.add_argument("--formats", default=",".join(FORMATS))
+    arg_parser.add_argument("--fields", help="projection applied to every format")
+    args = arg_parser.parse_args()
+
+    service = FakeCalendarService()
+    started = time.perf_counter()
+    seed_service(service, calendars=1, events_per_calendar=args.events, recurring_per_calendar=8, days=args.days)
+    print(f"Seeded {args.events} events in {time.perf_counter() - started:.1f}s")
+    api = GoogleCalendarAPI(service=service)
+    fields = parse_fields(args.fields)
+
+    print(f"{'format':<10} {'events':>9} {'events/s':>10} {'output MiB':>11} {'peak MiB':>9}")
+    for fmt in args.formats.split(","):
+        # Timed without tracemalloc (it slows allocation down), then once more for peak memory
+        timed = run_export(api, fmt, fields, trace_memory=False)
+        traced = run_export(api, fmt, fields, trace_memory=True)
+        print(f"{fmt:<10} {timed['events']:>9} {timed['events_per_s']:>10.0f} {timed['mib']:>11.1f} {traced['peak_mib']:>9.1f}")
+    print("\nPeak memory is Python allocations during the export, including the fake server's page handling.")
+    projection_ok = check_projection(api)
+    validation_ok = check_request_validation()
+    if not (projection_ok and validation_ok):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""
+In-memory stand-in for the Google Calendar v3 client returned by
+googleapiclient.discovery.build('calendar', 'v3').
+
+Only the surface used by utils/calendar_api.py is implemented, with the same
+call shape (`service.events().list(...).execute()`), pagination, recurring
+series expansion (singleEvents=True), incremental sync (syncToken, 410 on a bad
+token), partial responses (`fields`), watch channels, events.import with HTTP
+batches and 404 errors. An optional latency function simulates
+network time per request, and an optional notifier receives a push notification
+for every change to a watched calendar (see benchmarks/fake_push.py).
+"""
+import datetime
+import itertools
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dateutil import rrule
+
+UTC = datetime.timezone.utc
+DEFAULT_PAGE_SIZE = 250
+MAX_PAGE_SIZE = 2500
+# Open-ended recurring series are expanded this far past their first instance
+RECURRENCE_HORIZON = datetime.timedelta(days=730)
+
+
+class FakeHttpError(Exception):
+    """Mimics googleapiclient.errors.HttpError closely enough for the tools' error handling."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"<HttpError {status}: {reason}>")
+        self.status_code = status
+        self.resp = type("Resp", (), {"status": status, "reason": reason})()
+        self.reason = reason
+
+
+def parse_time(value: Dict[str, str]) -> datetime.datetime:
+    """Parse an event start/end dict ({'dateTime': ...} or {'date': ...}) to an aware datetime."""
+    if value.get("dateTime"):
+        dt = datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
+    return datetime.datetime.strptime(value["date"], "%Y-%m-%d").replace(tzinfo=UTC)
+
+
+def parse_bound(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    dt = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return (dt if dt.tzinfo else dt.replace(tzinfo=UTC)).timestamp()
+
+
+def partial_response(result: Dict[str, Any], fields: Optional[str]) -> Dict[str, Any]:
+    """Apply a partial-response selector such as 'nextPageToken,items(id,start)' the way the API does:
+    anything not selected is left out, including nextPageToken and nextSyncToken."""
+    if not fields:
+        return result
+    selected: Dict[str, Optional[List[str]]] = {}
+    for part in re.findall(r"(\w+)(?:\(([^)]*)\))?", fields):
+        name, nested = part
+        selected[name] = [key.split("/", 1)[0] for key in nested.split(",")] if nested else None
+    projected = {}
+    for name, nested in selected.items():
+        if name not in result:
+            continue
+        if nested is not None and isinstance(result[name], list):
+            projected[name] = [{key: item[key] for key in nested if key in item} for item in result[name]]
+        else:
+            projected[name] = result[name]
+    return projected
+
+
+class FakeRequest:
+    """Deferred call, executed like an googleapiclient HttpRequest."""
+
+    def __init__(self, service: "FakeCalendarService", method: str, func: Callable[[], Any]):
+        self.service = service
+        self.method = method
+        self.func = func
+
+    def execute(self, num_retries: int = 0) -> Any:
+        self.service.calls[self.method] += 1
+        if self.service.latency is not None:
+            time.sleep(self.service.latency())
+        with self.service.lock:
+            result = self.func()
+        # Deliver push notifications outside the lock: the receiver may call back into the service
+        self.service._flush_notifications()
+        return result
+
+
+class _CalendarListResource:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def list(self, pageToken: Optional[str] = None, maxResults: int = DEFAULT_PAGE_SIZE, **kwargs) -> FakeRequest:
+        def run():
+            items = list(self.service.calendars.values())
+            return self.service._paginate(items, pageToken, maxResults)
+        return FakeRequest(self.service, "calendarList.list", run)
+
+
+class _EventsResource:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def list(self, calendarId: str, timeMin: Optional[str] = None, timeMax: Optional[str] = None, singleEvents: bool = False,
+             orderBy: Optional[str] = None, pageToken: Optional[str] = None, maxResults: int = DEFAULT_PAGE_SIZE,
+             q: Optional[str] = None, syncToken: Optional[str] = None, fields: Optional[str] = None, **kwargs) -> FakeRequest:
+        def run():
+            if syncToken is not None:
+                items = self.service._changes_since(calendarId, syncToken, singleEvents)
+            else:
+                items = self.service._query(calendarId, parse_bound(timeMin), parse_bound(timeMax), singleEvents, q)
+            result = self.service._paginate(items, pageToken, maxResults)
+            # Like the real API, only unfiltered listings hand out a sync token, on their last page
+            if "nextPageToken" not in result and timeMin is None and timeMax is None and q is None:
+                result["nextSyncToken"] = str(self.service._versions[calendarId])
+            return partial_response(result, fields)
+        return FakeRequest(self.service, "events.list", run)
+
+    def get(self, calendarId: str, eventId: str, **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.get", lambda: dict(self.service._find(calendarId, eventId)))
+
+    def insert(self, calendarId: str, body: Dict[str, Any], **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.insert", lambda: self.service._insert(calendarId, body))
+
+    def update(self, calendarId: str, eventId: str, body: Dict[str, Any], **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.update", lambda: self.service._update(calendarId, eventId, body))
+
+    def delete(self, calendarId: str, eventId: str, **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.delete", lambda: self.service._delete(calendarId, eventId))
+
+    def import_(self, calendarId: str, body: Dict[str, Any], **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.import", lambda: self.service._import(calendarId, body))
+
+    def watch(self, calendarId: str, body: Dict[str, Any], **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "events.watch", lambda: self.service._watch(calendarId, body))
+
+
+class FakeBatchRequest:
+    """Mimics BatchHttpRequest: one round trip (one latency sample) for all added requests."""
+
+    def __init__(self, service: "FakeCalendarService", callback: Optional[Callable[[str, Any, Optional[Exception]], None]] = None):
+        self.service = service
+        self.callback = callback
+        self._requests: List[Tuple[str, FakeRequest, Optional[Callable]]] = []
+
+    def add(self, request: FakeRequest, callback: Optional[Callable] = None, request_id: Optional[str] = None) -> None:
+        self._requests.append((request_id or str(len(self._requests) + 1), request, callback))
+
+    def execute(self, http=None) -> None:
+        self.service.calls["batch"] += 1
+        if self.service.latency is not None:
+            time.sleep(self.service.latency())
+        for request_id, request, callback in self._requests:
+            self.service.calls[request.method] += 1
+            response, error = None, None
+            try:
+                with self.service.lock:
+                    response = request.func()
+            except FakeHttpError as e:
+                error = e
+            (callback or self.callback)(request_id, response, error)
+        self.service._flush_notifications()
+
+
+class _ChannelsResource:
+    def __init__(self, service: "FakeCalendarService"):
+        self.service = service
+
+    def stop(self, body: Dict[str, Any], **kwargs) -> FakeRequest:
+        return FakeRequest(self.service, "channels.stop", lambda: self.service._stop_channel(body))
+
+
+class FakeCalendarService:
+    """The `service` object: calendars, events and per-method call counts."""
+
+    def __init__(self, latency: Optional[Callable[[], float]] = None, notifier: Optional[Callable[[Dict[str, Any], str, int], None]] = None):
+        self.latency = latency
+        # Called as notifier(channel, resource_state, message_number) for each change to a watched calendar
+        self.notifier = notifier
+        self.lock = threading.RLock()
+        self.calls: Counter = Counter()
+        self.calendars: Dict[str, Dict[str, Any]] = {}
+        self.store: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Modified or cancelled (None) instances of recurring series, keyed by instance id
+        self.overrides: Dict[str, Dict[str, Optional[Dict[str, Any]]]] = {}
+        # Per-calendar expansion, sorted by start: (start_epoch, end_epoch, event)
+        self._instances: Dict[str, List[Tuple[float, float, Dict[str, Any]]]] = {}
+        self._ids = itertools.count(1)
+        # Incremental sync: per-calendar version counter, version of each stored event or
+        # override, and tombstones (instance id -> version) of deleted events
+        self._versions: Dict[str, int] = {}
+        self._changed: Dict[str, Dict[str, int]] = {}
+        self._tombstones: Dict[str, Dict[str, int]] = {}
+        self.watch_channels: Dict[str, Dict[str, Any]] = {}
+        self._pending_notifications: List[Tuple[Dict[str, Any], str, int]] = []
+        # iCalUID -> event id per calendar, for events.import
+        self._uids: Dict[str, Dict[str, str]] = {}
+
+    # --- googleapiclient surface -------------------------------------------------
+    def calendarList(self) -> _CalendarListResource:
+        return _CalendarListResource(self)
+
+    def events(self) -> _EventsResource:
+        return _EventsResource(self)
+
+    def channels(self) -> _ChannelsResource:
+        return _ChannelsResource(self)
+
+    def new_batch_http_request(self, callback: Optional[Callable] = None) -> FakeBatchRequest:
+        return FakeBatchRequest(self, callback)
+
+    # --- setup -------------------------------------------------------------------
+    def add_calendar(self, calendar_id: str, summary: str, access_role: str = "owner") -> None:
+        with self.lock:
+            self.calendars[calendar_id] = {"id": calendar_id, "summary": summary, "accessRole": access_role}
+            self.store.setdefault(calendar_id, {})
+            self.overrides.setdefault(calendar_id, {})
+            self._versions.setdefault(calendar_id, 0)
+            self._changed.setdefault(calendar_id, {})
+            self._tombstones.setdefault(calendar_id, {})
+            self._uids.setdefault(calendar_id, {})
+
+    # --- internals ---------------------------------------------------------------
+    def _calendar(self, calendar_id: str) -> Dict[str, Dict[str, Any]]:
+        if calendar_id not in self.store:
+            raise FakeHttpError(404, f"Calendar {calendar_id} not found")
+        return self.store[calendar_id]
+
+    def _paginate(self, items: List[Dict[str, Any]], page_token: Optional[str], max_results: Optional[int]) -> Dict[str, Any]:
+        page_size = min(max_results or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        offset = int(page_token) if page_token else 0
+        page = items[offset:offset + page_size]
+        result: Dict[str, Any] = {"kind": "calendar#events", "items": [dict(item) for item in page]}
+        if offset + page_size < len(items):
+            result["nextPageToken"] = str(offset + page_size)
+        return result
+
+    def _expand(self, calendar_id: str) -> List[Tuple[float, float, Dict[str, Any]]]:
+        instances = self._instances.get(calendar_id)
+        if instances is not None:
+            return instances
+        overrides = self.overrides.get(calendar_id, {})
+        instances = []
+        for event in self._calendar(calendar_id).values():
+            start, end = parse_time(event["start"]), parse_time(event["end"])
+            if not event.get("recurrence"):
+                instances.append((start.timestamp(), end.timestamp(), event))
+                continue
+            rule = rrule.rrulestr("\n".join(event["recurrence"]), dtstart=start, forceset=True)
+            duration = end - start
+            for occurrence in rule.between(start, start + RECURRENCE_HORIZON, inc=True):
+                instance_id = f"{event['id']}_{occurrence.astimezone(UTC).strftime('%Y%m%dT%H%M%SZ')}"
+                if instance_id in overrides:
+                    override = overrides[instance_id]
+                    if override is not None:
+                        instances.append((parse_time(override["start"]).timestamp(), parse_time(override["end"]).timestamp(), override))
+                    continue
+                instance = {k: v for k, v in event.items() if k != "recurrence"}
+                instance.update({
+                    "id": instance_id,
+                    "recurringEventId": event["id"],
+                    "originalStartTime": {"dateTime": occurrence.isoformat()},
+                    "start": {"dateTime": occurrence.isoformat(), "timeZone": event["start"].get("timeZone", "UTC")},
+                    "end": {"dateTime": (occurrence + duration).isoformat(), "timeZone": event["end"].get("timeZone", "UTC")},
+                })
+                instances.append((occurrence.timestamp(), (occurrence + duration).timestamp(), instance))
+        instances.sort(key=lambda item: (item[0], item[2]["id"]))
+        self._instances[calendar_id] = instances
+        return instances
+
+    def _query(self, calendar_id: str, time_min: Optional[float], time_max: Optional[float], single_events: bool, q: Optional[str]) -> List[Dict[str, Any]]:
+        if single_events:
+            candidates = self._expand(calendar_id)
+        else:
+            # Like the API, modified instances of a series are listed next to the series
+            events = list(self._calendar(calendar_id).values()) + [e for e in self.overrides.get(calendar_id, {}).values() if e is not None]
+            candidates = [(parse_time(e["start"]).timestamp(), parse_time(e["end"]).timestamp(), e) for e in events]
+        items = []
+        needle = q.lower() if q else None
+        for start, end, event in candidates:
+            if time_min is not None and end <= time_min:
+                continue
+            if time_max is not None and start >= time_max:
+                if single_events:
+                    break  # sorted by start
+                continue
+            if needle and not any(needle in (event.get(field) or "").lower() for field in ("summary", "description", "location")):
+                continue
+            items.append(event)
+        return items
+
+    def _changes_since(self, calendar_id: str, sync_token: str, single_events: bool) -> List[Dict[str, Any]]:
+        """Events changed after `sync_token`, deleted ones as {'id', 'status': 'cancelled'} stubs."""
+        self._calendar(calendar_id)
+        if not sync_token.isdigit() or int(sync_token) > self._versions[calendar_id]:
+            raise FakeHttpError(410, "Sync token is no longer valid, a full sync is required")
+        since = int(sync_token)
+        changed = {event_id for event_id, version in self._changed[calendar_id].items() if version > since}
+        items = []
+        if changed:
+            candidates = self._expand(calendar_id) if single_events else [(0, 0, e) for e in self._calendar(calendar_id).values()]
+            for _, _, event in candidates:
+                if event["id"] in changed or event.get("recurringEventId") in changed:
+                    items.append(event)
+        items.extend({"id": event_id, "status": "cancelled"} for event_id, version in self._tombstones[calendar_id].items() if version > since)
+        return items
+
+    def _record_change(self, calendar_id: str, event_id: str, deleted_ids: Optional[List[str]] = None) -> None:
+        self._versions[calendar_id] += 1
+        version = self._versions[calendar_id]
+        if deleted_ids is None:
+            self._changed[calendar_id][event_id] = version
+        else:
+            self._changed[calendar_id].pop(event_id, None)
+            for deleted_id in deleted_ids:
+                self._tombstones[calendar_id][deleted_id] = version
+        self._instances.pop(calendar_id, None)
+        for channel in self.watch_channels.values():
+            if channel["calendarId"] == calendar_id:
+                channel["messageNumber"] += 1
+                self._pending_notifications.append((channel, "exists", channel["messageNumber"]))
+
+    def _flush_notifications(self) -> None:
+        with self.lock:
+            pending, self._pending_notifications = self._pending_notifications, []
+        if self.notifier is not None:
+            for channel, state, number in pending:
+                self.notifier(channel, state, number)
+
+    def _watch(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        self._calendar(calendar_id)
+        ttl = float((body.get("params") or {}).get("ttl", 604800))
+        channel = {
+            "kind": "api#channel",
+            "id": body["id"],
+            "resourceId": f"res-{calendar_id}",
+            "resourceUri": f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events",
+            "token": body.get("token"),
+            "address": body.get("address"),
+            "expiration": str(int((time.time() + ttl) * 1000)),
+            "calendarId": calendar_id,
+            "messageNumber": 1,
+        }
+        self.watch_channels[channel["id"]] = channel
+        # The API confirms every new channel with a "sync" message
+        self._pending_notifications.append((channel, "sync", 1))
+        return {key: channel[key] for key in ("kind", "id", "resourceId", "resourceUri", "token", "expiration") if channel[key] is not None}
+
+    def _stop_channel(self, body: Dict[str, Any]) -> str:
+        channel = self.watch_channels.get(body.get("id"))
+        if channel is None or channel["resourceId"] != body.get("resourceId"):
+            raise FakeHttpError(404, f"Channel {body.get('id')} not found")
+        del self.watch_channels[channel["id"]]
+        return ""
+
+    def _find(self, calendar_id: str, event_id: str) -> Dict[str, Any]:
+        events = self._calendar(calendar_id)
+        if event_id in events:
+            return events[event_id]
+        if "_" in event_id:
+            for _, _, instance in self._expand(calendar_id):
+                if instance["id"] == event_id:
+                    return instance
+        raise FakeHttpError(404, f"Event {event_id} not found")
+
+    def _stamp(self, event: Dict[str, Any]) -> None:
+        now = datetime.datetime.now(UTC).isoformat()
+        event.setdefault("created", now)
+        event["updated"] = now
+        event.setdefault("status", "confirmed")
+
+    def _insert(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        events = self._calendar(calendar_id)
+        event = dict(body)
+        event.setdefault("id", f"evt{next(self._ids):08d}")
+        event.setdefault("iCalUID", f"{event['id']}@fake.calendar")
+        self._stamp(event)
+        events[event["id"]] = event
+        self._uids[calendar_id][event["iCalUID"]] = event["id"]
+        self._record_change(calendar_id, event["id"])
+        return dict(event)
+
+    def _import(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """events.import: create the event, or update the one that already has this iCalUID. With
+        originalStartTime, update that instance of the series with this iCalUID."""
+        self._calendar(calendar_id)
+        if not body.get("iCalUID"):
+            raise FakeHttpError(400, "Missing iCalUID")
+        existing_id = self._uids[calendar_id].get(body["iCalUID"])
+        if body.get("originalStartTime"):
+            if existing_id is None:
+                raise FakeHttpError(404, f"No series with iCalUID {body['iCalUID']}")
+            instance_id = f"{existing_id}_{parse_time(body['originalStartTime']).astimezone(UTC).strftime('%Y%m%dT%H%M%SZ')}"
+            return self._update(calendar_id, instance_id, dict(body, recurringEventId=existing_id))
+        if existing_id is not None and existing_id in self.store[calendar_id]:
+            return self._update(calendar_id, existing_id, body)
+        return self._insert(calendar_id, {key: value for key, value in body.items() if key != "id"})
+
+    def _update(self, calendar_id: str, event_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        events = self._calendar(calendar_id)
+        current = self._find(calendar_id, event_id)
+        event = dict(body, id=event_id, iCalUID=current.get("iCalUID"), created=current.get("created"))
+        self._stamp(event)
+        if event_id in events:
+            events[event_id] = event
+        else:
+            self.overrides[calendar_id][event_id] = event
+        self._record_change(calendar_id, event_id)
+        return dict(event)
+
+    def _delete(self, calendar_id: str, event_id: str) -> str:
+        events = self._calendar(calendar_id)
+        self._find(calendar_id, event_id)
+        if event_id in events:
+            # A deleted series cancels all of its instances
+            deleted_ids = [event_id]
+            if events[event_id].get("recurrence"):
+                deleted_ids += [i["id"] for _, _, i in self._expand(calendar_id) if i.get("recurringEventId") == event_id]
+            self._uids[calendar_id].pop(events[event_id].get("iCalUID"), None)
+            del events[event_id]
+        else:
+            deleted_ids = [event_id]
+            self.overrides[calendar_id][event_id] = None
+        self._record_change(calendar_id, event_id, deleted_ids)
+        return ""
+
+
+# --- realistic seed data --------------------------------------------------------
+
+PEOPLE = ["Alice", "Bob", "Priya", "John", "Mei", "Carlos", "Fatima", "Tom", "Sara", "Ken"]
+TITLES = [
+    "Project sync", "Design review", "Budget planning", "Interview: {person}", "Lunch with {person}",
+    "1:1 with {person}", "Customer call", "Dentist appointment", "Gym session", "Sprint planning",
+    "Doctor appointment", "Coffee with {person}", "Code review", "Quarterly review", "Team offsite prep",
+]
+LOCATIONS = ["", "", "Room 4.01", "Zoom", "Google Meet", "Canary Wharf office", "Cafe Nero", "City Gym", "Harley St Clinic"]
+RECURRING = [
+    ("Daily standup", "RRULE:FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR", 15),
+    ("Weekly 1:1 with {person}", "RRULE:FREQ=WEEKLY", 30),
+    ("Team retro", "RRULE:FREQ=WEEKLY;INTERVAL=2", 60),
+    ("Monthly all-hands", "RRULE:FREQ=MONTHLY;BYDAY=1TH", 60),
+]
+
+
+def seed_service(service: FakeCalendarService, calendars: int = 5, events_per_calendar: int = 2000, recurring_per_calendar: int = 8,
+                 anchor: Optional[datetime.datetime] = None, days: int = 365, seed: int = 7) -> Dict[str, List[str]]:
+    """Fill the fake with deterministic, realistic data centred on `anchor` (default: now).
+    Returns the seeded event ids per calendar."""
+    rng = random.Random(seed)
+    anchor = (anchor or datetime.datetime.now(UTC)).astimezone(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = anchor - datetime.timedelta(days=days // 2)
+    seeded: Dict[str, List[str]] = {}
+    for index in range(calendars):
+        calendar_id = "primary" if index == 0 else f"calendar-{index}@group.calendar.google.com"
+        service.add_calendar(calendar_id, "Primary" if index == 0 else f"Team calendar {index}")
+        ids = seeded.setdefault(calendar_id, [])
+        for _ in range(events_per_calendar):
+            day = first_day + datetime.timedelta(days=rng.randrange(days))
+            start = day + datetime.timedelta(hours=rng.randint(8, 17), minutes=rng.choice([0, 15, 30, 45]))
+            end = start + datetime.timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120]))
+            person = rng.choice(PEOPLE)
+            event = service._insert(calendar_id, {
+                "summary": rng.choice(TITLES).format(person=person),
+                "description": rng.choice(["", f"Agenda shared by {person}", "Bring laptop", "Follow up on action items"]),
+                "location": rng.choice(LOCATIONS),
+                "start": {"dateTime": start.isoformat(), "timeZone": "Europe/London"},
+                "end": {"dateTime": end.isoformat(), "timeZone": "Europe/London"},
+            })
+            ids.append(event["id"])
+        for _ in range(recurring_per_calendar):
+            title, rule, minutes = rng.choice(RECURRING)
+            start = first_day + datetime.timedelta(days=rng.randrange(30), hours=rng.randint(9, 16))
+            event = service._insert(calendar_id, {
+                "summary": title.format(person=rng.choice(PEOPLE)),
+                "start": {"dateTime": start.isoformat(), "timeZone": "Europe/London"},
+                "end": {"dateTime": (start + datetime.timedelta(minutes=minutes)).isoformat(), "timeZone": "Europe/London"},
+                "recurrence": [f"{rule};COUNT={rng.choice([26, 52, 120])}"],
+            })
+            ids.append(event["id"])
+    return seeded
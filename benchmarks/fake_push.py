@@ -0,0 +1,138 @@
+"""
+Local stand-in for Google Calendar push notifications.
+
+Without arguments, runs an offline end-to-end check: the FastAPI app with a
+WatchManager over the in-memory Calendar fake, whose changes are POSTed to
+/notifications/calendar the way Google would. It reports how many events.list
+calls reads cost with the push-invalidated cache versus plain listing.
+
+With --url, sends one fake notification to a running server instead (use the
+channel id and token stored in data/channels.db).
+
+Usage:
+    python -m benchmarks.fake_push
+    python -m benchmarks.fake_push --reads 200
+    python -m benchmarks.fake_push --url http://localhost:8000/notifications/calendar --channel-id ID --token TOKEN
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import urllib.request
+from typing import Any, Callable, Dict
+from urllib.parse import urlparse
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from utils.calendar_api import GoogleCalendarAPI
+from utils.datetime_utils import dt_handler
+
+WEBHOOK_ADDRESS = "https://scheduler.example.test/notifications/calendar"
+
+
+def notification_headers(channel: Dict[str, Any], state: str, message_number: int) -> Dict[str, str]:
+    """The headers Google sends with a push notification (the body is empty)."""
+    headers = {
+        "X-Goog-Channel-ID": channel["id"],
+        "X-Goog-Message-Number": str(message_number),
+        "X-Goog-Resource-ID": channel["resourceId"],
+        "X-Goog-Resource-State": state,
+        "X-Goog-Resource-URI": channel.get("resourceUri", ""),
+        "X-Goog-Channel-Expiration": channel.get("expiration", ""),
+    }
+    if channel.get("token"):
+        headers["X-Goog-Channel-Token"] = channel["token"]
+    return headers
+
+
+def test_client_notifier(client) -> Callable[[Dict[str, Any], str, int], None]:
+    """FakeCalendarService notifier that delivers to the app behind a TestClient."""
+    def notify(channel: Dict[str, Any], state: str, message_number: int) -> None:
+        client.post(urlparse(channel["address"]).path, headers=notification_headers(channel, state, message_number))
+    return notify
+
+
+def send_notification(url: str, channel: Dict[str, Any], state: str, message_number: int) -> int:
+    request = urllib.request.Request(url, data=b"", method="POST", headers=notification_headers(channel, state, message_number))
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def run_offline(reads: int) -> None:
+    from fastapi.testclient import TestClient
+    from main import app, authenticated_user, get_watch_manager
+    from utils.event_sync import ChannelStore, WatchManager
+
+    service = FakeCalendarService()
+    seed_service(service, calendars=1, events_per_calendar=2000, recurring_per_calendar=8)
+    api = GoogleCalendarAPI(service=service)
+    tomorrow = dt_handler.get_current_info()["tomorrow"]
+    time_min, time_max = dt_handler.get_date_range(tomorrow)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = WatchManager(ChannelStore(os.path.join(tmp, "channels.db")), lambda user_id: api, address=WEBHOOK_ADDRESS)
+        app.dependency_overrides[get_watch_manager] = lambda: manager
+        app.dependency_overrides[authenticated_user] = lambda: None
+        try:
+            with TestClient(app) as client:
+                service.notifier = test_client_notifier(client)
+                client.post("/calendars/primary/watch").raise_for_status()
+
+                service.calls.clear()
+                for _ in range(reads):
+                    before = len(api.get_events("primary", time_min, time_max))
+                cached_calls = service.calls["events.list"]
+
+                # Another client adds an event: Google pings the webhook, which syncs just this calendar
+                service.events().insert(calendarId="primary", body={
+                    "summary": "Added elsewhere",
+                    "start": {"dateTime": f"{tomorrow}T12:00:00+00:00"},
+                    "end": {"dateTime": f"{tomorrow}T12:30:00+00:00"},
+                }).execute()
+                after = api.get_events("primary", time_min, time_max)
+                seen = any(event.get("summary") == "Added elsewhere" for event in after)
+                sync_calls = service.calls["events.list"] - cached_calls
+
+                api.event_cache.unwatch("primary")
+                service.calls.clear()
+                for _ in range(reads):
+                    api.get_events("primary", time_min, time_max)
+                uncached_calls = service.calls["events.list"]
+        finally:
+            app.dependency_overrides.pop(get_watch_manager, None)
+            app.dependency_overrides.pop(authenticated_user, None)
+            manager.stop()
+
+    print(f"{reads} reads of tomorrow ({before} events):")
+    print(f"  push-invalidated cache: {cached_calls} events.list call(s) (initial full sync)")
+    print(f"  plain listing:          {uncached_calls} events.list call(s)")
+    print(f"External change visible after notification: {seen} ({sync_calls} incremental sync call(s))")
+    if not seen:
+        sys.exit(1)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--reads", type=int, default=100, help="reads per mode in the offline check")
+    arg_parser.add_argument("--url", help="send one notification to this webhook URL instead")
+    arg_parser.add_argument("--channel-id")
+    arg_parser.add_argument("--token")
+    arg_parser.add_argument("--resource-id", default="fake-resource")
+    arg_parser.add_argument("--state", default="exists", choices=["sync", "exists", "not_exists"])
+    arg_parser.add_argument("--message-number", type=int, default=2)
+    args = arg_parser.parse_args()
+
+    if args.url:
+        if not args.channel_id:
+            arg_parser.error("--channel-id is required with --url")
+        channel = {"id": args.channel_id, "resourceId": args.resource_id, "token": args.token,
+                   "expiration": datetime.datetime.now(datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")}
+        print(f"{args.url} -> HTTP {send_notification(args.url, channel, args.state, args.message_number)}")
+    else:
+        run_offline(args.reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Import benchmark: builds ICS and CSV files from the seeded Calendar fake,
+imports them into an empty fake calendar with simulated round-trip latency,
+and reports throughput per concurrency level. It also checks that a second
+run imports nothing (idempotency), that an import stopped halfway resumes
+from its checkpoint without duplicates, that a modified instance of a
+series (RECURRENCE-ID) replaces its occurrence instead of adding one, and
+that an Outlook series (Windows TZID, EXDATE in that zone) imports with its
+exceptions.
+
+Usage:
+    python -m benchmarks.import_benchmark
+    python -m benchmarks.import_benchmark --events 20000 --latency-ms 40 --concurrency 1,4,8
+"""
+import argparse
+import csv
+import io
+import os
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from utils.calendar_api import GoogleCalendarAPI
+from utils.event_export import export_events
+from utils.event_import import import_events
+
+
+class Interrupted(Exception):
+    pass
+
+
+def build_sources(events: int) -> dict:
+    source = FakeCalendarService()
+    seed_service(source, calendars=1, events_per_calendar=events, recurring_per_calendar=0)
+    api = GoogleCalendarAPI(service=source)
+    ics = b"".join(export_events(api, "primary", fmt="ics")).decode("utf-8")
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    writer.writerow(["Subject", "Start Date", "Start Time", "End Date", "End Time", "All Day Event", "Description", "Location"])
+    for page in api.iter_event_pages("primary"):
+        for event in page:
+            start, end = event["start"]["dateTime"], event["end"]["dateTime"]
+            writer.writerow([event["summary"], start[:10], start[11:16], end[:10], end[11:16], "False", event.get("description", ""), event.get("location", "")])
+    return {"ics": ics, "csv": rows.getvalue()}
+
+
+def empty_target(latency_ms: float):
+    target = FakeCalendarService(latency=(lambda: latency_ms / 1000) if latency_ms else None)
+    target.add_calendar("primary", "Import target")
+    return target, GoogleCalendarAPI(service=target)
+
+
+MODIFIED_SERIES_ICS = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+UID:weekly-sync
+DTSTART:20300107T090000Z
+DTEND:20300107T093000Z
+RRULE:FREQ=WEEKLY;COUNT=4
+SUMMARY:Weekly sync
+END:VEVENT
+BEGIN:VEVENT
+UID:weekly-sync
+RECURRENCE-ID:20300114T090000Z
+DTSTART:20300114T110000Z
+DTEND:20300114T113000Z
+SUMMARY:Weekly sync (moved)
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def check_modified_instance() -> bool:
+    target, api = empty_target(0)
+    import_events(api, io.StringIO(MODIFIED_SERIES_ICS), "ics")
+    rerun = import_events(api, io.StringIO(MODIFIED_SERIES_ICS), "ics")
+    starts = [event["start"]["dateTime"][:16] for event in api.get_events("primary", "2030-01-01T00:00:00Z", "2030-02-01T00:00:00Z")]
+    ok = starts == ["2030-01-07T09:00", "2030-01-14T11:00", "2030-01-21T09:00", "2030-01-28T09:00"] and not rerun.imported
+    print(f"Modified instance: occurrences {starts}, re-run imported {rerun.imported}: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+OUTLOOK_SERIES_ICS = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+UID:outlook-standup
+DTSTART;TZID=Eastern Standard Time:20300107T090000
+DTEND;TZID=Eastern Standard Time:20300107T091500
+RRULE:FREQ=WEEKLY;COUNT=4
+EXDATE;TZID=Eastern Standard Time:20300114T090000
+SUMMARY:Standup
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def check_outlook_series() -> bool:
+    target, api = empty_target(0)
+    report = import_events(api, io.StringIO(OUTLOOK_SERIES_ICS), "ics")
+    starts = [event["start"]["dateTime"] for event in api.get_events("primary", "2030-01-01T00:00:00Z", "2030-02-01T00:00:00Z")]
+    expected = [f"2030-01-{day}T09:00:00-05:00" for day in ("07", "21", "28")]
+    ok = report.imported == 1 and not report.invalid and starts == expected
+    print(f"Outlook series: imported {report.imported}, invalid {report.invalid}, occurrences {starts}: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--events", type=int, default=5000)
+    arg_parser.add_argument("--latency-ms", type=float, default=25, help="simulated round trip per (batch) request")
+    arg_parser.add_argument("--concurrency", default="1,4,8")
+    args = arg_parser.parse_args()
+
+    sources = build_sources(args.events)
+    print(f"{'format':<7} {'concurrency':>11} {'imported':>9} {'events/s':>9} {'batches':>8} {'re-run imported':>16}")
+    for fmt, text in sources.items():
+        for concurrency in [int(value) for value in args.concurrency.split(",")]:
+            target, api = empty_target(args.latency_ms)
+            report = import_events(api, io.StringIO(text), fmt, concurrency=concurrency)
+            rerun = import_events(api, io.StringIO(text), fmt, concurrency=concurrency)
+            print(f"{fmt:<7} {concurrency:>11} {report.imported:>9} {report.to_dict()['imported_per_s']:>9.0f} {report.batches:>8} {rerun.imported:>16}")
+            if report.failed or report.invalid or rerun.imported or report.imported != args.events:
+                print(f"  unexpected: {report.summary()} | re-run: {rerun.summary()}")
+
+    # Stop an import halfway, then resume it from the last checkpoint
+    target, api = empty_target(0)
+    state = {}
+    seen = {"records": 0}
+
+    def stop_halfway():
+        seen["records"] += 1
+        if seen["records"] > args.events // 2:
+            raise Interrupted()
+
+    try:
+        import_events(api, io.StringIO(sources["ics"]), "ics", on_checkpoint=state.update, check_cancelled=stop_halfway)
+    except Interrupted:
+        pass
+    first = len(target.store["primary"])
+    resumed = import_events(api, io.StringIO(sources["ics"]), "ics", checkpoint=state)
+    total = len(target.store["primary"])
+    print(f"\nResume: stopped after {first} events, checkpoint at record {state.get('position')}, "
+          f"resumed run imported {resumed.imported}, calendar now holds {total} (expected {args.events})")
+    check_modified_instance()
+    check_outlook_series()
+
+
+if __name__ == "__main__":
+    main()
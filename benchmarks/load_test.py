@@ -0,0 +1,300 @@
+"""
+Load test and concurrency profile of the FastAPI app, offline.
+
+Drives POST /query in-process (httpx over ASGI, so the app runs on the same
+event loop as the load generator) with a closed loop of N virtual users per
+concurrency level. The scenario questions are answered by the scripted chat
+model against the in-memory Calendar fake; both sleep for a latency drawn from
+a configurable distribution, the way blocking LLM and Google client calls tie
+up the worker threads.
+
+For every concurrency level it reports:
+- throughput and client-side p50/p95/p99 latency
+- queueing delay: from the request reaching the app to run_query starting in
+  a worker thread (threadpool saturation shows up here first)
+- event-loop blocking: lag of a 5 ms ticker running next to the app, i.e. time
+  the loop could not serve other requests (blocking calls on the loop, but also
+  worker threads holding the GIL)
+- per-stage time per request from the span histograms (graph nodes, LLM calls,
+  tools, Calendar API calls; stages nest, e.g. tools include their API calls)
+
+Results are saved as JSON and can be compared against a previous run, like
+run_benchmarks.py, so performance changes can be checked against a baseline.
+
+Latency distributions: "0" (none), "const:MS", "uniform:LOW_MS:HIGH_MS",
+"exp:MEAN_MS", "lognormal:MEDIAN_MS:SIGMA".
+
+Usage:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --concurrency 1,4,16,64 --duration 5 --llm-latency lognormal:300:0.5 --output load.json
+    python -m benchmarks.load_test --baseline load.json --tolerance 0.2
+    python -m benchmarks.load_test --threadpool 80 --calendar-latency uniform:20:120
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from benchmarks.run_benchmarks import SCENARIOS_PATH, percentile
+from benchmarks.scripted_llm import ScriptedChatModel, load_scenarios
+from utils.calendar_api import GoogleCalendarAPI
+from utils.tracing import SPAN_METRIC, registry
+
+# Ticker period of the event-loop monitor; lag beyond it is time the loop was blocked
+LOOP_TICK_SECONDS = 0.005
+
+# When each request reached the app; read in run_query's worker thread (run_in_threadpool copies the context)
+_arrived_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("arrived_at", default=None)
+
+
+def latency_distribution(spec: str, rng: random.Random) -> Optional[Callable[[], float]]:
+    """Parse a latency spec (see module docstring) into a sampler returning seconds."""
+    kind, _, rest = spec.partition(":")
+    try:
+        params = [float(value) for value in rest.split(":")] if rest else []
+    except ValueError:
+        params = None
+    if kind in ("0", "none", "") and not params:
+        return None
+    if kind == "const" and params and len(params) == 1:
+        return lambda: params[0] / 1000
+    if kind == "uniform" and params and len(params) == 2:
+        return lambda: rng.uniform(params[0], params[1]) / 1000
+    if kind == "exp" and params and len(params) == 1 and params[0] > 0:
+        return lambda: rng.expovariate(1000 / params[0])
+    if kind == "lognormal" and params and len(params) == 2 and params[0] > 0:
+        median, sigma = params
+        return lambda: rng.lognormvariate(math.log(median / 1000), sigma)
+    raise ValueError(f"bad latency distribution {spec!r}")
+
+
+def build_graph(args: argparse.Namespace, scenarios: List[Dict[str, Any]]):
+    from agent.agentic_workflow import GraphBuilder
+    from tools.calendar_tool import CalendarTool
+    from utils.model_router import ModelRouter
+
+    rng = random.Random(args.seed)
+    service = FakeCalendarService(latency=latency_distribution(args.calendar_latency, rng))
+    seed_service(service, calendars=args.calendars, events_per_calendar=args.events, recurring_per_calendar=8)
+    llm = ScriptedChatModel.from_scenarios(scenarios, latency=latency_distribution(args.llm_latency, rng))
+    router = ModelRouter.from_llm(llm, provider="scripted", model_name="scripted")
+    return service, GraphBuilder(router=router, calendar_tool=CalendarTool(api=GoogleCalendarAPI(service=service)))()
+
+
+def instrument(app, main_module, queue_delays: List[float]):
+    """Wrap the ASGI app to stamp arrival times and run_query to record how long each request
+    waited for a worker thread."""
+    run_query = main_module.run_query
+
+    def timed_run_query(*args, **kwargs):
+        arrived = _arrived_at.get()
+        if arrived is not None:
+            queue_delays.append(time.perf_counter() - arrived)
+        return run_query(*args, **kwargs)
+
+    main_module.run_query = timed_run_query
+
+    async def stamped(scope, receive, send):
+        token = _arrived_at.set(time.perf_counter())
+        try:
+            await app(scope, receive, send)
+        finally:
+            _arrived_at.reset(token)
+
+    def restore():
+        main_module.run_query = run_query
+    return stamped, restore
+
+
+async def monitor_loop(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_TICK_SECONDS)
+        lags.append(max(0.0, time.perf_counter() - start - LOOP_TICK_SECONDS))
+
+
+def span_totals() -> Dict[str, Dict[str, float]]:
+    """Span count and total seconds per kind:name (statuses merged)."""
+    totals: Dict[str, Dict[str, float]] = {}
+    for key, stats in registry.snapshot()["histograms"].get(SPAN_METRIC, {}).items():
+        labels = dict(key)
+        entry = totals.setdefault(f"{labels['kind']}:{labels['name']}", {"count": 0, "sum": 0.0})
+        entry["count"] += stats["count"]
+        entry["sum"] += stats["sum"]
+    return totals
+
+
+def stage_breakdown(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]], requests: int) -> Dict[str, Dict[str, float]]:
+    stages = {}
+    for name, entry in after.items():
+        count = entry["count"] - before.get(name, {}).get("count", 0)
+        if count and requests:
+            seconds = entry["sum"] - before.get(name, {}).get("sum", 0.0)
+            stages[name] = {"calls_per_request": count / requests, "ms_per_request": seconds * 1000 / requests}
+    return dict(sorted(stages.items(), key=lambda item: item[1]["ms_per_request"], reverse=True))
+
+
+async def run_level(client, questions: List[str], concurrency: int, duration: float) -> Dict[str, Any]:
+    """Closed loop: `concurrency` users each send their next question as soon as the previous answer arrives."""
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user(offset: int) -> None:
+        nonlocal errors
+        index = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.post("/query", json={"question": questions[index % len(questions)]})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+            index += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(offset) for offset in range(concurrency)))
+    return {"latencies": latencies, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+async def profile(args: argparse.Namespace, graph, questions: List[str]) -> Dict[str, Dict[str, Any]]:
+    import anyio.to_thread
+    import httpx
+    import main
+
+    if args.threadpool:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool
+    threads = anyio.to_thread.current_default_thread_limiter().total_tokens
+    main.app.dependency_overrides[main.get_graph] = lambda: graph
+    # Act as the local user without an API key
+    main.app.dependency_overrides[main.authenticated_user] = lambda: None
+    queue_delays: List[float] = []
+    app, restore = instrument(main.app, main, queue_delays)
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+            await run_level(client, questions, 1, min(1.0, args.duration))  # warm-up
+            for concurrency in args.concurrency:
+                queue_delays.clear()
+                lags: List[float] = []
+                stop = asyncio.Event()
+                monitor = asyncio.create_task(monitor_loop(stop, lags))
+                spans_before = span_totals()
+                level = await run_level(client, questions, concurrency, args.duration)
+                stop.set()
+                await monitor
+                latencies, requests = level["latencies"], len(level["latencies"])
+                results[f"concurrency:{concurrency}"] = {
+                    "concurrency": concurrency,
+                    "threadpool": threads,
+                    "requests": requests,
+                    "errors": level["errors"],
+                    "throughput_per_s": requests / level["elapsed"] if level["elapsed"] else 0.0,
+                    "p50_ms": percentile(latencies, 0.50) * 1000,
+                    "p95_ms": percentile(latencies, 0.95) * 1000,
+                    "p99_ms": percentile(latencies, 0.99) * 1000,
+                    "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+                    "queue_p50_ms": percentile(queue_delays, 0.50) * 1000,
+                    "queue_p99_ms": percentile(queue_delays, 0.99) * 1000,
+                    "loop_blocked_ms_per_s": sum(lags) * 1000 / level["elapsed"] if level["elapsed"] else 0.0,
+                    "loop_lag_max_ms": max(lags, default=0.0) * 1000,
+                    "stages": stage_breakdown(spans_before, span_totals(), requests),
+                }
+    finally:
+        restore()
+        main.app.dependency_overrides.pop(main.get_graph, None)
+        main.app.dependency_overrides.pop(main.authenticated_user, None)
+    return results
+
+
+def print_report(results: Dict[str, Dict[str, Any]], top_stages: int) -> None:
+    print(f"{'users':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queue p50':>10} {'queue p99':>10} "
+          f"{'loop blk ms/s':>14} {'max lag':>8} {'errors':>7}")
+    for stats in results.values():
+        print(f"{stats['concurrency']:>6} {stats['throughput_per_s']:>8.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} "
+              f"{stats['queue_p50_ms']:>10.2f} {stats['queue_p99_ms']:>10.2f} {stats['loop_blocked_ms_per_s']:>14.2f} "
+              f"{stats['loop_lag_max_ms']:>8.1f} {stats['errors']:>7}")
+
+    levels = list(results.values())
+    best = max(levels, key=lambda stats: stats["throughput_per_s"])
+    # Saturation: the first level whose throughput is within 10% of the best one
+    knee = next(stats for stats in levels if stats["throughput_per_s"] >= 0.9 * best["throughput_per_s"])
+    print(f"\nPeak {best['throughput_per_s']:.1f} req/s at {best['concurrency']} users; "
+          f"throughput flattens from about {knee['concurrency']} users (p50 {knee['p50_ms']:.0f} ms)")
+
+    print(f"\nPer-request stage time at {best['concurrency']} users (stages nest):")
+    for name, stage in list(best["stages"].items())[:top_stages]:
+        print(f"  {name:<40} {stage['ms_per_request']:>9.1f} ms  {stage['calls_per_request']:>5.1f} calls")
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous["throughput_per_s"] and stats["throughput_per_s"] < previous["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_per_s']:.1f} -> {stats['throughput_per_s']:.1f} req/s")
+        if previous["p50_ms"] and stats["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            change = stats["p50_ms"] / previous["p50_ms"] - 1
+            regressions.append(f"{name}: p50 {previous['p50_ms']:.1f}ms -> {stats['p50_ms']:.1f}ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 2, 4, 8, 16, 32, 64],
+                            help="comma-separated numbers of concurrent users")
+    arg_parser.add_argument("--duration", type=float, default=3.0, help="seconds per concurrency level")
+    arg_parser.add_argument("--llm-latency", default="lognormal:40:0.5", help="latency of each model call")
+    arg_parser.add_argument("--calendar-latency", default="lognormal:15:0.5", help="latency of each Calendar API request")
+    arg_parser.add_argument("--threadpool", type=int, default=0, help="worker threads for blocking calls (default: anyio's 40)")
+    arg_parser.add_argument("--calendars", type=int, default=5)
+    arg_parser.add_argument("--events", type=int, default=2000, help="one-off events per calendar")
+    arg_parser.add_argument("--seed", type=int, default=7)
+    arg_parser.add_argument("--top-stages", type=int, default=12)
+    arg_parser.add_argument("--output", help="write results as JSON")
+    arg_parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop / p50 increase before failing (fraction)")
+    args = arg_parser.parse_args()
+    for spec in (args.llm_latency, args.calendar_latency):
+        try:
+            latency_distribution(spec, random.Random())
+        except ValueError as e:
+            arg_parser.error(str(e))
+
+    scenarios = load_scenarios(SCENARIOS_PATH)
+    service, graph = build_graph(args, scenarios)
+    questions = [scenario["question"] for scenario in scenarios]
+    results = asyncio.run(profile(args, graph, questions))
+    print_report(results, args.top_stages)
+    print(f"\nFake Calendar API calls: {dict(service.calls)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"created": datetime.datetime.now().isoformat(), "config": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
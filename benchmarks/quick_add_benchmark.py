@@ -0,0 +1,139 @@
+"""
+Quick-add parser benchmark: parses every sentence in quick_add_corpus.json
+against the corpus' fixed "now" and reports accuracy per field (start/end,
+summary, location) and parse throughput. Mismatches are listed and make the
+run exit non-zero, so the corpus doubles as a regression check.
+
+For comparison it also times dateutil's fuzzy parser, which is what
+DateTimeHandler.parse_natural_language_date used before (dates only).
+
+A final check runs the quick_add_event tool against the fake calendar with a
+non-London request time zone (America/New_York) and verifies the event is
+booked, ranged and displayed in that zone.
+
+Usage:
+    python -m benchmarks.quick_add_benchmark
+    python -m benchmarks.quick_add_benchmark --repeat 200
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import warnings
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import pytz
+from dateutil import parser as dateutil_parser
+
+from benchmarks.fake_calendar import FakeCalendarService
+from tools.calendar_tool import CalendarTool
+from utils.calendar_api import GoogleCalendarAPI
+from utils.datetime_utils import dt_handler, use_timezone
+from utils.event_text_parser import parse_event_text
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "quick_add_corpus.json")
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def check_accuracy(cases, now):
+    hits = {"start/end": 0, "summary": 0, "location": 0}
+    mismatches = []
+    for case in cases:
+        parsed = parse_event_text(case["text"], now)
+        got = {"start/end": (_iso(parsed["start"]), _iso(parsed["end"])), "summary": parsed["summary"], "location": parsed["location"]}
+        expected = {"start/end": (case["start"], case["end"]), "summary": case["summary"], "location": case.get("location")}
+        for field in hits:
+            if got[field] == expected[field]:
+                hits[field] += 1
+            else:
+                mismatches.append((case["text"], field, got[field], expected[field]))
+    return hits, mismatches
+
+
+def check_request_timezone(tz_name: str = "America/New_York"):
+    """Book 'Dentist 3pm tomorrow' through the tool with tz_name bound; return a list of failures"""
+    service = FakeCalendarService()
+    service.add_calendar("primary", "Primary")
+    api = GoogleCalendarAPI(service=service)
+    quick_add = {tool.name: tool for tool in CalendarTool(api=api).calendar_tool_list}["quick_add_event"]
+    failures = []
+    with use_timezone(tz_name):
+        reply = quick_add.invoke({"text": "Dentist 3pm tomorrow"})
+        tomorrow = (dt_handler.now + datetime.timedelta(days=1)).date()
+        day_start, _ = dt_handler.get_date_range(tomorrow.isoformat())
+        utc_noon = dt_handler.format_datetime_for_display(f"{tomorrow.isoformat()}T12:00:00+00:00")
+    events = api.get_events("primary")
+    if len(events) != 1:
+        return [f"expected one event, got {len(events)}: {reply}"]
+    start = events[0]["start"]
+    expected_start = pytz.timezone(tz_name).localize(datetime.datetime.combine(tomorrow, datetime.time(15))).isoformat()
+    if start.get("timeZone") != tz_name or start.get("dateTime") != expected_start:
+        failures.append(f"event start {start}, expected {expected_start} in {tz_name}")
+    if "03:00 PM" not in reply or f"({tz_name})" not in reply:
+        failures.append(f"reply not in {tz_name}: {reply!r}")
+    if not day_start.startswith(f"{tomorrow.isoformat()}T00:00:00-0"):
+        failures.append(f"date range starts at {day_start}")
+    if not utc_noon.endswith(("08:00 AM", "07:00 AM")):
+        failures.append(f"12:00 UTC displayed as {utc_noon}")
+    if dt_handler.tz.zone != "Europe/London":
+        failures.append(f"time zone leaked out of the request: {dt_handler.tz.zone}")
+    return failures
+
+
+def time_parser(parse, texts, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            parse(text)
+    elapsed = time.perf_counter() - start
+    return repeat * len(texts) / elapsed if elapsed else 0.0
+
+
+def _dateutil_fuzzy(text):
+    try:
+        return dateutil_parser.parse(text, fuzzy=True)
+    except (ValueError, OverflowError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--corpus", default=CORPUS_PATH)
+    arg_parser.add_argument("--repeat", type=int, default=100, help="passes over the corpus for the throughput figures")
+    args = arg_parser.parse_args()
+    # dateutil warns about words it mistakes for time zone names ("B" in "Bob")
+    warnings.filterwarnings("ignore", category=dateutil_parser.UnknownTimezoneWarning)
+
+    with open(args.corpus, encoding="utf-8") as handle:
+        corpus = json.load(handle)
+    now = pytz.timezone(corpus["timezone"]).localize(datetime.datetime.fromisoformat(corpus["now"]))
+    cases = corpus["cases"]
+    texts = [case["text"] for case in cases]
+
+    hits, mismatches = check_accuracy(cases, now)
+    print(f"Accuracy on {len(cases)} sentences (now = {now.strftime('%a %d %b %Y %H:%M %Z')}):")
+    for field, count in hits.items():
+        print(f"  {field:<10} {count:>3}/{len(cases)}  {100.0 * count / len(cases):5.1f}%")
+    for text, field, got, expected in mismatches:
+        print(f"  MISMATCH {field}: {text!r}\n    got      {got}\n    expected {expected}")
+
+    print(f"Throughput ({args.repeat} passes):")
+    print(f"  event_text_parser  {time_parser(lambda text: parse_event_text(text, now), texts, args.repeat):>9.0f} parses/s")
+    print(f"  dateutil fuzzy     {time_parser(_dateutil_fuzzy, texts, args.repeat):>9.0f} parses/s (dates only)")
+
+    tz_failures = check_request_timezone()
+    print(f"Request time zone (America/New_York): {'OK' if not tz_failures else 'FAILED'}")
+    for failure in tz_failures:
+        print(f"  {failure}")
+    if mismatches or tz_failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
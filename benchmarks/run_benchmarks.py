@@ -0,0 +1,237 @@
+"""
+Offline benchmark suite: no Google OAuth, no LLM keys, no network.
+
+Runs the FastAPI app end to end (/query scenarios from scenarios.json) against
+the in-memory Calendar fake and the scripted chat model, plus microbenchmarks of
+every CalendarTool tool. Reports throughput, p50/p99 latency, peak allocations
+and tokens, and can compare against a saved baseline to catch regressions.
+
+Usage:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --events 5000 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+# Keep per-request logging out of the measurements unless asked for
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_calendar import FakeCalendarService, seed_service
+from benchmarks.scripted_llm import ScriptedChatModel, load_scenarios
+from utils.calendar_api import GoogleCalendarAPI
+from utils.datetime_utils import dt_handler
+from utils.tracing import TOKENS_METRIC, registry
+
+SCENARIOS_PATH = os.path.join(os.path.dirname(__file__), "scenarios.json")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(func: Callable[[], Any], iterations: int, alloc_iterations: int = 3) -> Dict[str, float]:
+    """Time `func` over `iterations` runs, then measure peak allocation over a few extra runs
+    (tracemalloc is kept out of the timed loop because it slows allocation down)."""
+    func()  # warm-up
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(alloc_iterations):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "throughput_per_s": iterations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "peak_alloc_kib": (peak - baseline) / 1024,
+    }
+
+
+def total_tokens() -> float:
+    counters = registry.snapshot()["counters"].get(TOKENS_METRIC, {})
+    return sum(counters.values())
+
+
+def build_environment(args: argparse.Namespace):
+    """Seeded fake calendar, tools and a graph driven by the scripted model."""
+    from agent.agentic_workflow import GraphBuilder
+    from tools.calendar_tool import CalendarTool
+    from utils.model_router import ModelRouter
+
+    service = FakeCalendarService()
+    seeded = seed_service(service, calendars=args.calendars, events_per_calendar=args.events, recurring_per_calendar=args.recurring)
+    # Scratch calendar for the bulk-delete microbenchmark: one busy day per iteration
+    service.add_calendar("bench-scratch", "Benchmark scratch")
+    api = GoogleCalendarAPI(service=service)
+    calendar_tool = CalendarTool(api=api)
+    scenarios = load_scenarios(SCENARIOS_PATH)
+    router = ModelRouter.from_llm(ScriptedChatModel.from_scenarios(scenarios), provider="scripted", model_name="scripted")
+    graph = GraphBuilder(router=router, calendar_tool=calendar_tool)()
+    return service, seeded, calendar_tool, scenarios, graph
+
+
+def run_query_scenarios(graph, scenarios: List[Dict[str, Any]], iterations: int) -> Dict[str, Dict[str, float]]:
+    from fastapi.testclient import TestClient
+    from main import app, authenticated_user, get_graph
+
+    app.dependency_overrides[get_graph] = lambda: graph
+    # Act as the local user without an API key
+    app.dependency_overrides[authenticated_user] = lambda: None
+    results = {}
+    try:
+        with TestClient(app) as client:
+            for scenario in scenarios:
+                payload = {"question": scenario["question"]}
+
+                def call():
+                    response = client.post("/query", json=payload)
+                    response.raise_for_status()
+                    return response.json()
+
+                body = call()
+                tokens_before = total_tokens()
+                stats = measure(call, iterations)
+                stats["tokens_per_request"] = (total_tokens() - tokens_before) / (iterations + 3)
+                stats["steps"] = body.get("steps")
+                stats["tool_calls"] = body.get("tool_calls")
+                stats["duplicate_tool_calls"] = body.get("duplicate_tool_calls")
+                results[f"query:{scenario['name']}"] = stats
+    finally:
+        app.dependency_overrides.pop(get_graph, None)
+        app.dependency_overrides.pop(authenticated_user, None)
+    return results
+
+
+def run_tool_microbenchmarks(service: FakeCalendarService, seeded: Dict[str, List[str]], calendar_tool, iterations: int) -> Dict[str, Dict[str, float]]:
+    tools = {t.name: t for t in calendar_tool.calendar_tool_list}
+    today = dt_handler.get_current_info()["today"]
+    tomorrow = dt_handler.get_current_info()["tomorrow"]
+    month_start, month_end = dt_handler.get_date_range(
+        (dt_handler.now - datetime.timedelta(days=15)).strftime("%Y-%m-%d"),
+        (dt_handler.now + datetime.timedelta(days=15)).strftime("%Y-%m-%d"),
+    )
+    event_id = seeded["primary"][0]
+    created = calendar_tool.api.create_event("primary", {
+        "summary": "Benchmark event",
+        "start": {"dateTime": f"{tomorrow}T09:00:00+00:00"},
+        "end": {"dateTime": f"{tomorrow}T10:00:00+00:00"},
+    })
+
+    def delete_cycle():
+        ev = calendar_tool.api.create_event("primary", {
+            "summary": "Disposable",
+            "start": {"dateTime": f"{tomorrow}T07:00:00+00:00"},
+            "end": {"dateTime": f"{tomorrow}T07:30:00+00:00"},
+        })
+        return tools["delete_event"].invoke({"calendar_id": "primary", "event_id": ev["id"], "minimal": True})
+
+    def bulk_delete_cycle():
+        for hour in range(8, 18):
+            service._insert("bench-scratch", {
+                "summary": "Scratch",
+                "start": {"dateTime": f"{tomorrow}T{hour:02d}:00:00+00:00"},
+                "end": {"dateTime": f"{tomorrow}T{hour:02d}:30:00+00:00"},
+            })
+        return tools["delete_events_in_range"].invoke({"calendar_id": "bench-scratch", "date": tomorrow})
+
+    cases: Dict[str, Callable[[], Any]] = {
+        "list_calendars": lambda: tools["list_calendars"].invoke({"show_ids": True}),
+        "smart_event_search:recent": lambda: tools["smart_event_search"].invoke({"description": "dentist"}),
+        "smart_event_search:all": lambda: tools["smart_event_search"].invoke({"description": "dentist", "search_recent": False}),
+        "list_events:today": lambda: tools["list_events"].invoke({"date": today}),
+        "search_events_by_keyword:month": lambda: tools["search_events_by_keyword"].invoke({"keyword": "review", "time_min": month_start, "time_max": month_end}),
+        "get_event_details": lambda: tools["get_event_details"].invoke({"event_id": event_id}),
+        "get_events_duration:month": lambda: tools["get_events_duration"].invoke({"time_min": month_start, "time_max": month_end}),
+        "get_free_busy:tomorrow": lambda: tools["get_free_busy"].invoke({"date": tomorrow}),
+        "quick_add_event": lambda: tools["quick_add_event"].invoke({"text": "Lunch with Bob at 1pm Friday"}),
+        "create_event+delete_event": delete_cycle,
+        "update_event": lambda: tools["update_event"].invoke({"calendar_id": "primary", "event_id": created["id"], "description": "updated", "minimal": True}),
+        "move_event": lambda: tools["move_event"].invoke({"calendar_id": "primary", "event_id": created["id"], "new_start": f"{tomorrow}T11:00:00+00:00", "new_end": f"{tomorrow}T12:00:00+00:00"}),
+        "delete_events_in_range:10": bulk_delete_cycle,
+    }
+    return {f"tool:{name}": measure(func, iterations) for name, func in cases.items()}
+
+
+def print_report(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'case':<40} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>9} {'tokens':>8}")
+    for name, stats in results.items():
+        tokens = stats.get("tokens_per_request")
+        print(f"{name:<40} {stats['throughput_per_s']:>9.1f} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+              f"{stats['peak_alloc_kib']:>9.1f} {'' if tokens is None else f'{tokens:.0f}':>8}")
+
+
+def compare_with_baseline(results: Dict[str, Dict[str, float]], baseline_path: str, tolerance: float) -> List[str]:
+    """Return the cases whose p50 latency regressed by more than `tolerance` (fraction)."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        change = stats["p50_ms"] / previous["p50_ms"] - 1
+        if change > tolerance:
+            regressions.append(f"{name}: p50 {previous['p50_ms']:.2f}ms -> {stats['p50_ms']:.2f}ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--calendars", type=int, default=5)
+    arg_parser.add_argument("--events", type=int, default=2000, help="one-off events per calendar")
+    arg_parser.add_argument("--recurring", type=int, default=8, help="recurring series per calendar")
+    arg_parser.add_argument("--iterations", type=int, default=50)
+    arg_parser.add_argument("--only", choices=["query", "tools"], help="run only one group")
+    arg_parser.add_argument("--output", help="write results as JSON")
+    arg_parser.add_argument("--baseline", help="JSON from a previous --output run to compare against")
+    arg_parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown before failing (fraction)")
+    args = arg_parser.parse_args()
+
+    service, seeded, calendar_tool, scenarios, graph = build_environment(args)
+    results: Dict[str, Dict[str, float]] = {}
+    if args.only in (None, "query"):
+        results.update(run_query_scenarios(graph, scenarios, args.iterations))
+    if args.only in (None, "tools"):
+        results.update(run_tool_microbenchmarks(service, seeded, calendar_tool, args.iterations))
+    print_report(results)
+    print(f"\nFake Calendar API calls: {dict(service.calls)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"created": datetime.datetime.now().isoformat(), "config": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Deterministic chat model for offline runs.
+
+Each scenario maps a user question to a list of steps. A step is either
+{"tool_calls": [{"name": ..., "args": {...}}]} or {"content": "final answer"}.
+The step to replay is the number of AI messages since the last human message,
+so one model instance can serve many concurrent conversations.
+"""
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from utils.datetime_utils import dt_handler
+
+# Rough characters-per-token ratio used for the synthetic usage numbers
+CHARS_PER_TOKEN = 4
+
+
+def load_scenarios(path: str) -> List[Dict[str, Any]]:
+    """Load scenarios from JSON, filling {today}/{tomorrow}/{yesterday} placeholders with real dates."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    for key, value in dt_handler.get_current_info().items():
+        raw = raw.replace("{" + key + "}", str(value))
+    return json.loads(raw)
+
+
+class ScriptedChatModel(BaseChatModel):
+    scenarios: Dict[str, List[Dict[str, Any]]]
+    latency: Optional[Callable[[], float]] = None
+
+    @classmethod
+    def from_scenarios(cls, scenarios: List[Dict[str, Any]], latency: Optional[Callable[[], float]] = None) -> "ScriptedChatModel":
+        return cls(scenarios={s["question"]: s["steps"] for s in scenarios}, latency=latency)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        question, step = "", 0
+        for message in reversed(messages):
+            if message.type == "human":
+                question = message.content
+                break
+            if message.type == "ai":
+                step += 1
+        steps = self.scenarios.get(question) or [{"content": "I don't have a scripted answer for that."}]
+        scripted = steps[min(step, len(steps) - 1)]
+        if self.latency is not None:
+            time.sleep(self.latency())
+
+        tool_calls = [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{step}_{i}", "type": "tool_call"}
+            for i, call in enumerate(scripted.get("tool_calls", []))
+        ]
+        content = scripted.get("content", "")
+        input_tokens = sum(len(str(m.content)) for m in messages) // CHARS_PER_TOKEN
+        output_tokens = max(1, (len(content) + len(json.dumps(tool_calls))) // CHARS_PER_TOKEN)
+        message = AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: how long `import main` takes in a fresh interpreter.
+
+Runs `python -X importtime -c "import main"` several times, reports wall time and
+the slowest imports by cumulative time, and fails when the median exceeds a budget
+or when a module that should load lazily (provider SDKs, Google client) shows up.
+
+Usage:
+    python -m benchmarks.startup_benchmark
+    python -m benchmarks.startup_benchmark --runs 10 --budget-ms 2500 --top 15
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Must not be imported at startup; they load on first use
+LAZY_MODULES = [
+    "langchain_groq",
+    "langchain_openai",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib",
+]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_once(target: str) -> Tuple[float, Dict[str, int]]:
+    """Import `target` in a fresh interpreter. Returns wall seconds and cumulative microseconds per module."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{completed.stderr[-2000:]}")
+    cumulative: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return wall, cumulative
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--target", default="main", help="module to import")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--top", type=int, default=10)
+    arg_parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median import exceeds this")
+    args = arg_parser.parse_args()
+
+    walls: List[float] = []
+    totals: List[float] = []
+    last: Dict[str, int] = {}
+    for _ in range(args.runs):
+        wall, cumulative = run_once(args.target)
+        walls.append(wall)
+        totals.append(cumulative.get(args.target, 0) / 1000)
+        last = cumulative
+
+    median_import = statistics.median(totals)
+    print(f"import {args.target}: median {median_import:.0f} ms (min {min(totals):.0f}, max {max(totals):.0f}) "
+          f"| interpreter wall median {statistics.median(walls) * 1000:.0f} ms over {args.runs} runs")
+    print(f"\nSlowest top-level imports (cumulative, last run):")
+    top_level = {name: us for name, us in last.items() if "." not in name and name != args.target}
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:>8.1f} ms  {name}")
+
+    failures = [f"{module} is imported at startup" for module in LAZY_MODULES if module in last]
+    if args.budget_ms is not None and median_import > args.budget_ms:
+        failures.append(f"median import {median_import:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+    if failures:
+        print("\nStartup check failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nStartup check passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import sys
+import traceback
+
+
+class SchedulerException(Exception):
+    """Base error for the scheduler service. Records where the error was raised."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        _, _, tb = sys.exc_info()
+        if tb is not None:
+            frame = traceback.extract_tb(tb)[-1]
+            self.file_name, self.line_number = frame.filename, frame.lineno
+        else:
+            self.file_name, self.line_number = None, None
+
+    def __str__(self) -> str:
+        if self.file_name:
+            return f"{self.message} (raised in {self.file_name}, line {self.line_number})"
+        return self.message
+
+
+class CalendarAuthError(SchedulerException):
+    """The user has no usable Google Calendar credentials (never authorised, or revoked)."""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=401)
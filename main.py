@@ -1,49 +1,531 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from agent.agentic_workflow import GraphBuilder
+from agent.agentic_workflow import GraphBuilder, initial_state
 from utils.save_to_document import save_document
-from starlette.responses import JSONResponse
+from utils.tracing import collect_trace, registry, span
+from utils.calendar_pool import CalendarClientPool, TokenRefresher, use_calendar_api
+from utils.datetime_utils import use_timezone
+from utils.credential_store import CredentialStore, DEFAULT_STORE_PATH
+from utils.job_queue import DEFAULT_JOBS_PATH, JobManager, JobStore
+from utils.bulk_operations import IMPORT_EVENTS, register_bulk_handlers
+from utils.event_sync import DEFAULT_CHANNELS_PATH, ChannelStore, WatchManager
+from utils.event_archive import DEFAULT_ARCHIVE_DIR, DEFAULT_MIN_RANGE_DAYS, EventArchive, archive_name, open_archive
+from utils.event_export import CONTENT_TYPES, FORMATS, export_events, parse_fields, resolve_range
+from utils.shared_state import DEFAULT_SHARED_STATE_PATH, SharedState
+from tools.calendar_tool import CalendarTool
+from utils.config_loader import load_config
+from utils.model_router import validate_routing
+from exception import SchedulerException
+from logger import get_logger
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, HumanMessage
+import asyncio
+import math
+import pytz
 import os
 import datetime
+import time
+import threading
+import uuid
 from dotenv import load_dotenv
 from pydantic import BaseModel
 load_dotenv()
 
-app = FastAPI()
+logger = get_logger(__name__)
+
+# Drawing the graph calls an external renderer, so it is opt-in and done once at graph build
+SAVE_GRAPH_PNG = os.getenv("SAVE_GRAPH_PNG", "").lower() in ("1", "true", "yes")
+
+def server_settings() -> dict:
+    return load_config().get("server") or {}
+
+_shared_state = None
+_shared_lock = threading.Lock()
+
+def get_shared_state() -> SharedState:
+    """State shared by all worker processes (`uvicorn main:app --workers N`): event cache versions,
+    model cooldowns, rate-limit buckets, background-work leases and conversations."""
+    global _shared_state
+    if _shared_state is None:
+        with _shared_lock:
+            if _shared_state is None:
+                _shared_state = SharedState(server_settings().get("shared_state_path", DEFAULT_SHARED_STATE_PATH))
+    return _shared_state
+
+_credential_store = None
+_client_pool = None
+_token_refresher = None
+_pool_lock = threading.Lock()
+
+def get_credential_store() -> CredentialStore:
+    """Per-user OAuth credentials and the API keys that identify callers."""
+    global _credential_store
+    if _credential_store is None:
+        with _pool_lock:
+            if _credential_store is None:
+                settings = load_config().get("credentials") or {}
+                _credential_store = CredentialStore(settings.get("store_path", DEFAULT_STORE_PATH))
+    return _credential_store
+
+def open_user_archive(user_id: Optional[str]) -> Optional[EventArchive]:
+    """The user's columnar event archive for long-range search and durations, or None when disabled."""
+    settings = load_config().get("archive") or {}
+    if not settings.get("enabled", True):
+        return None
+    directory = os.path.join(settings.get("directory", DEFAULT_ARCHIVE_DIR), archive_name(user_id))
+    return open_archive(directory, max_age_seconds=float(settings.get("max_age_seconds", 60)),
+                        min_range_days=float(settings.get("min_range_days", DEFAULT_MIN_RANGE_DAYS)))
+
+def client_options(user_id: Optional[str]) -> Dict[str, Any]:
+    """Extra GoogleCalendarAPI arguments for a user: their event archive, and shared state so
+    their event cache stays consistent across worker processes."""
+    return {"archive": open_user_archive(user_id), "shared_state": get_shared_state(), "cache_scope": archive_name(user_id)}
+
+def get_client_pool() -> CalendarClientPool:
+    """Per-user Calendar client pool, created on first multi-user request together with the
+    background token refresher."""
+    global _client_pool, _token_refresher
+    if _client_pool is None:
+        store = get_credential_store()
+        with _pool_lock:
+            if _client_pool is None:
+                settings = load_config().get("credentials") or {}
+                _client_pool = CalendarClientPool(store, max_size=int(settings.get("pool_size", 128)), client_options=client_options)
+                _token_refresher = TokenRefresher(
+                    store,
+                    _client_pool,
+                    interval_seconds=float(settings.get("refresh_interval_seconds", 60)),
+                    margin_seconds=float(settings.get("refresh_margin_seconds", 600)),
+                    active_seconds=float(settings.get("refresh_active_seconds", 86400)),
+                    shared=get_shared_state(),
+                )
+                _token_refresher.start()
+    return _client_pool
+
+_job_manager = None
+_local_api = None
+_jobs_lock = threading.Lock()
+
+def resolve_calendar_api(user_id: Optional[str]):
+    """Calendar client a background job acts with: the user's pooled client, else the local single-user client."""
+    global _local_api
+    if user_id:
+        return get_client_pool().get(user_id)
+    if _local_api is None:
+        from utils.calendar_api import GoogleCalendarAPI
+        # Never opens a browser OAuth flow inside a request: no usable token.pickle means 401
+        _local_api = GoogleCalendarAPI(interactive=False, **client_options(None))
+    return _local_api
+
+def get_job_manager() -> JobManager:
+    """Background job runner for bulk operations, backed by the SQLite job table."""
+    global _job_manager
+    if _job_manager is None:
+        with _jobs_lock:
+            if _job_manager is None:
+                settings = load_config().get("jobs") or {}
+                manager = JobManager(
+                    JobStore(settings.get("store_path", DEFAULT_JOBS_PATH)),
+                    resolve_calendar_api,
+                    max_workers=int(settings.get("max_workers", 2)),
+                    persist_interval=float(settings.get("persist_interval_seconds", 1.0)),
+                    heartbeat_interval=float(settings.get("heartbeat_interval_seconds", 10.0)),
+                )
+                register_bulk_handlers(manager)
+                _job_manager = manager
+    return _job_manager
+
+_watch_manager = None
+_watch_lock = threading.Lock()
+
+def get_watch_manager() -> WatchManager:
+    """Push-notification channels that keep the per-user event caches fresh. Overridable via dependency_overrides."""
+    global _watch_manager
+    if _watch_manager is None:
+        with _watch_lock:
+            if _watch_manager is None:
+                settings = load_config().get("push") or {}
+                _watch_manager = WatchManager(
+                    ChannelStore(settings.get("store_path", DEFAULT_CHANNELS_PATH)),
+                    resolve_calendar_api,
+                    address=settings.get("address") or os.getenv("CALENDAR_WEBHOOK_URL"),
+                    ttl_seconds=float(settings.get("ttl_seconds", 604800)),
+                    renew_margin_seconds=float(settings.get("renew_margin_seconds", 3600)),
+                    interval_seconds=float(settings.get("renew_interval_seconds", 300)),
+                    shared=get_shared_state(),
+                )
+    return _watch_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A provider typo in routing.tiers should stop startup, not fail the first query
+    validate_routing(load_config())
+    settings = load_config().get("credentials") or {}
+    # Start refreshing tokens straight away when users have already been authorised
+    if os.path.exists(settings.get("store_path", DEFAULT_STORE_PATH)):
+        get_client_pool()
+    # Pick up bulk jobs whose worker is gone (the last shutdown, or a worker that died); jobs
+    # still running in another live worker keep their owner
+    get_job_manager().start()
+    # Renew push channels only when Google can reach us
+    if get_watch_manager().address:
+        get_watch_manager().start()
+    yield
+    if _watch_manager is not None:
+        _watch_manager.stop()
+    if _token_refresher is not None:
+        _token_refresher.stop()
+    if _job_manager is not None:
+        _job_manager.shutdown()
+    if _shared_state is not None:
+        _shared_state.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # set specific origins in prod
+    # Browser origins allowed to call the API (auth.cors_origins); requests still need an API key
+    allow_origins=(load_config().get("auth") or {}).get("cors_origins") or [],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+_graph = None
+_graph_lock = threading.Lock()
+# Router of the production graph, for /metrics (None until the first query builds it)
+_router = None
+
+def get_graph():
+    """Build the agent graph once per process and reuse it, so model clients, the calendar
+    client and router health metrics survive across requests. Overridable via dependency_overrides."""
+    global _graph, _router
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                with span("graph", "build"):
+                    # Provider order comes from config.yaml (routing.preferred_provider, then the tiers)
+                    builder = GraphBuilder(calendar_tool=CalendarTool(api=resolve_calendar_api(None), job_manager=get_job_manager()))
+                    # Rate-limit cooldowns apply to every worker, not just the one that hit the limit
+                    builder.router.shared_state = get_shared_state()
+                    _router = builder.router
+                    _graph = builder()
+                if SAVE_GRAPH_PNG:
+                    png_graph = _graph.get_graph().draw_mermaid_png()
+                    with open("my_graph.png", "wb") as f:
+                        f.write(png_graph)
+                    logger.info(f"Graph saved as 'my_graph.png' in {os.getcwd()}")
+    return _graph
+
+def authenticated_user(authorization: Optional[str] = Header(default=None), x_user_id: Optional[str] = Header(default=None)) -> Optional[str]:
+    """The user a request acts for, from its API key (`Authorization: Bearer <key>`, see
+    `python -m utils.credential_store issue-key`). Without a key, only the local single-user mode
+    (auth.allow_local_user) is served, as user None. An X-User-Id header must name the same user.
+    Overridable via dependency_overrides."""
+    if authorization:
+        scheme, _, key = authorization.partition(" ")
+        user_id = get_credential_store().user_for_api_key(key.strip()) if scheme.lower() == "bearer" and key.strip() else None
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid API key", headers={"WWW-Authenticate": "Bearer"})
+    elif (load_config().get("auth") or {}).get("allow_local_user", False):
+        user_id = None
+    else:
+        raise HTTPException(status_code=401, detail="Missing API key", headers={"WWW-Authenticate": "Bearer"})
+    check_claimed_user(x_user_id, user_id)
+    return user_id
+
+def check_claimed_user(claimed: Optional[str], user_id: Optional[str]) -> None:
+    """A user id sent by the client (body or header) is only accepted when it is the authenticated one."""
+    if claimed is not None and claimed != user_id:
+        raise HTTPException(status_code=403, detail="user_id does not match the API key")
+
 class QueryRequest(BaseModel):
     question: str
+    debug: bool = False
+    # Optional: must match the user of the API key (see authenticated_user)
+    user_id: Optional[str] = None
+    # Continue an earlier conversation: its last turns are passed to the agent (any worker can serve it)
+    thread_id: Optional[str] = None
+    # IANA time zone of the user (e.g. "America/New_York"); defaults to Europe/London
+    timezone: Optional[str] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    debug: bool = False
+    user_id: Optional[str] = None
+    timezone: Optional[str] = None
+    # Lowers the server's batch_concurrency for this batch
+    max_concurrency: Optional[int] = None
+
+RATE_LIMITED_METRIC = "scheduler_rate_limited_total"
+
+def check_timezone(timezone: Optional[str]) -> None:
+    if timezone and timezone not in pytz.all_timezones_set:
+        raise HTTPException(status_code=400, detail=f"Unknown time zone: {timezone}")
+
+def load_history(user_id: Optional[str], thread_id: str) -> Tuple[list, Optional[str]]:
+    """The last server.conversation_turns turns of a thread as messages, and a summary of the
+    earlier questions for the system prompt."""
+    settings = server_settings()
+    recent = int(settings.get("conversation_turns", 3)) * 2
+    turns = get_shared_state().load_conversation(user_id, thread_id)
+    older, turns = (turns[:-recent], turns[-recent:]) if recent else (turns, [])
+    questions = [turn["content"] for turn in older if turn["role"] == "user"]
+    summary = "Earlier questions in this conversation:\n" + "\n".join(f"- {q[:200]}" for q in questions) if questions else None
+    messages = [HumanMessage(content=turn["content"]) if turn["role"] == "user" else AIMessage(content=turn["content"]) for turn in turns]
+    return messages, summary
+
+def save_history(user_id: Optional[str], thread_id: str, question: str, answer: str) -> None:
+    """Append a question/answer turn, keeping the last conversation_turns + conversation_summary_turns turns."""
+    settings = server_settings()
+    keep = (int(settings.get("conversation_turns", 3)) + int(settings.get("conversation_summary_turns", 5))) * 2
+    get_shared_state().append_conversation(user_id, thread_id, [{"role": "user", "content": question}, {"role": "assistant", "content": answer}], keep)
+
+def rate_limit_burst() -> Optional[int]:
+    """Most questions a user can ask at once (server.burst), or None when rate limiting is off."""
+    settings = server_settings()
+    per_minute = float(settings.get("requests_per_minute", 0))
+    if per_minute <= 0:
+        return None
+    return int(settings.get("burst", per_minute))
+
+def rate_limit_wait(user_id: Optional[str], cost: int = 1) -> float:
+    """Seconds the user must wait before asking `cost` more questions; 0 when allowed or
+    server.requests_per_minute is unset. Every question costs a token, batched or not; the
+    bucket is shared by all workers."""
+    burst = rate_limit_burst()
+    if burst is None:
+        return 0.0
+    per_minute = float(server_settings().get("requests_per_minute", 0))
+    return get_shared_state().take(f"query:{user_id or 'local'}", per_minute / 60, burst, cost)
+
+def rate_limited(user_id: Optional[str], wait: float) -> JSONResponse:
+    registry.inc(RATE_LIMITED_METRIC, {})
+    logger.warning(f"Rate limited {user_id or 'local user'} for {wait:.1f}s")
+    return JSONResponse(status_code=429, content={"error": "Too many requests, try again later"},
+                        headers={"Retry-After": str(math.ceil(wait))})
+
+def run_query(react_app, query: QueryRequest, user_id: Optional[str]) -> dict:
+    """Run one question through the graph. Executed in a worker thread so blocking LLM and
+    Google client calls never stall the event loop."""
+    calendar_api = get_client_pool().get(user_id) if user_id else None
+    history, summary = load_history(user_id, query.thread_id) if query.thread_id else ([], None)
+    with collect_trace() if query.debug else nullcontext() as trace:
+        with use_calendar_api(calendar_api, user_id) if calendar_api else nullcontext(), use_timezone(query.timezone):
+            with span("request", "query"):
+                output = react_app.invoke(initial_state(query.question, history, timezone=query.timezone, thread_summary=summary))
+
+    # If result is dict with messages:
+    if isinstance(output, dict) and "messages" in output:
+        final_output = output["messages"][-1].content  # Last AI response
+    else:
+        final_output = str(output)
+    if query.thread_id:
+        save_history(user_id, query.thread_id, query.question, final_output)
+
+    logger.info(f"Agent steps: {output.get('steps')} tool calls: {output.get('tool_calls')} memoized duplicates: {output.get('duplicate_tool_calls')}")
+    response = {
+        "answer": final_output,
+        "steps": output.get("steps"),
+        "tool_calls": output.get("tool_calls"),
+        "duplicate_tool_calls": output.get("duplicate_tool_calls"),
+        "budget_exhausted": output.get("budget_exhausted"),
+    }
+    if query.debug:
+        response["trace"] = trace
+    return response
 
 @app.post("/query")
-async def query_travel_agent(query:QueryRequest):
+async def query_travel_agent(query:QueryRequest, react_app=Depends(get_graph), user_id: Optional[str] = Depends(authenticated_user)):
+    check_timezone(query.timezone)
+    check_claimed_user(query.user_id, user_id)
     try:
-        print(query)
-        graph = GraphBuilder(model_provider="groq")
-        react_app=graph()
-        #react_app = graph.build_graph()
-
-        png_graph = react_app.get_graph().draw_mermaid_png()
-        with open("my_graph.png", "wb") as f:
-            f.write(png_graph)
-
-        print(f"Graph saved as 'my_graph.png' in {os.getcwd()}")
-        # Assuming request is a pydantic object like: {"question": "your text"}
-        messages={"messages": [query.question]}
-        output = react_app.invoke(messages)
-
-        # If result is dict with messages:
-        if isinstance(output, dict) and "messages" in output:
-            final_output = output["messages"][-1].content  # Last AI response
-        else:
-            final_output = str(output)
-        
-        return {"answer": final_output}
+        logger.info(f"Query received from {user_id or 'local user'}: {query.question!r}")
+        wait = await run_in_threadpool(rate_limit_wait, user_id)
+        if wait:
+            return rate_limited(user_id, wait)
+        return await run_in_threadpool(run_query, react_app, query, user_id)
+    except SchedulerException as e:
+        logger.warning(f"Query rejected: {e.message}")
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
     except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        logger.exception("Query failed")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.post("/query/batch")
+async def query_batch(batch: BatchQueryRequest, react_app=Depends(get_graph), user_id: Optional[str] = Depends(authenticated_user)):
+    """Answer independent questions concurrently, at most server.batch_concurrency at a time.
+    Results come back in question order; a failed question carries an error instead of an answer."""
+    check_timezone(batch.timezone)
+    check_claimed_user(batch.user_id, user_id)
+    settings = server_settings()
+    max_questions = int(settings.get("batch_max_questions", 50))
+    # A batch larger than the burst could never be paid for in one go
+    burst = rate_limit_burst()
+    if burst is not None:
+        max_questions = min(max_questions, burst)
+    if not batch.questions or len(batch.questions) > max_questions:
+        raise HTTPException(status_code=400, detail=f"questions must hold 1 to {max_questions} entries")
+    logger.info(f"Batch of {len(batch.questions)} questions received from {user_id or 'local user'}")
+    wait = await run_in_threadpool(rate_limit_wait, user_id, len(batch.questions))
+    if wait:
+        return rate_limited(user_id, wait)
+    concurrency = int(settings.get("batch_concurrency", 8))
+    if batch.max_concurrency:
+        concurrency = min(concurrency, max(1, batch.max_concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question: str) -> dict:
+        async with semaphore:
+            try:
+                return await run_in_threadpool(run_query, react_app, QueryRequest(question=question, debug=batch.debug, timezone=batch.timezone), user_id)
+            except SchedulerException as e:
+                return {"error": e.message, "status_code": e.status_code}
+            except Exception as e:
+                logger.exception("Batch question failed")
+                return {"error": str(e), "status_code": 500}
+
+    started = time.perf_counter()
+    with span("request", "query.batch", questions=len(batch.questions)):
+        results = await asyncio.gather(*(answer(question) for question in batch.questions))
+    return {"results": results, "elapsed_seconds": round(time.perf_counter() - started, 3)}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: span latency histograms, token counters and model router health."""
+    text = registry.render_prometheus()
+    if _router is not None:
+        text += _router.render_prometheus()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+def _job_for_user(job_id: str, user_id: Optional[str]) -> dict:
+    job = get_job_manager().get(job_id)
+    # Jobs are only visible to the user who started them
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+def _job_progress(job: dict) -> dict:
+    total = job["total"]
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "done": job["done"],
+        "total": total,
+        "percent": round(100 * job["done"] / total, 1) if total else None,
+    }
+
+@app.get("/jobs")
+async def list_jobs(user_id: Optional[str] = Depends(authenticated_user), limit: int = 50):
+    jobs = get_job_manager().store.list(user_id=user_id, limit=limit)
+    return [{**_job_progress(job), "kind": job["kind"], "created_at": job["created_at"]} for job in jobs]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: Optional[str] = Depends(authenticated_user)):
+    job = _job_for_user(job_id, user_id)
+    job.pop("checkpoint", None)
+    return job
+
+@app.get("/jobs/{job_id}/progress")
+async def get_job_progress(job_id: str, user_id: Optional[str] = Depends(authenticated_user)):
+    return _job_progress(_job_for_user(job_id, user_id))
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, user_id: Optional[str] = Depends(authenticated_user)):
+    _job_for_user(job_id, user_id)
+    return _job_progress(get_job_manager().cancel(job_id))
+
+@app.post("/calendars/{calendar_id}/watch")
+async def watch_calendar(calendar_id: str, user_id: Optional[str] = Depends(authenticated_user), watch_manager: WatchManager = Depends(get_watch_manager)):
+    """Open a push channel for a calendar; from then on it is served from the event cache."""
+    try:
+        channel = await run_in_threadpool(watch_manager.watch, user_id, calendar_id)
+    except SchedulerException as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"channel_id": channel["channel_id"], "calendar_id": calendar_id, "expiration": channel["expiration"]}
+
+@app.delete("/calendars/{calendar_id}/watch")
+async def unwatch_calendar(calendar_id: str, user_id: Optional[str] = Depends(authenticated_user), watch_manager: WatchManager = Depends(get_watch_manager)):
+    try:
+        return {"stopped": await run_in_threadpool(watch_manager.unwatch, user_id, calendar_id)}
+    except SchedulerException as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+
+@app.post("/notifications/calendar")
+async def calendar_notification(request: Request, watch_manager: WatchManager = Depends(get_watch_manager)):
+    """Webhook for Google Calendar push notifications. The body is empty; everything is in the X-Goog-* headers."""
+    headers = request.headers
+    channel = await run_in_threadpool(
+        watch_manager.handle_notification,
+        headers.get("X-Goog-Channel-ID", ""),
+        headers.get("X-Goog-Channel-Token"),
+        headers.get("X-Goog-Resource-State", ""),
+    )
+    if channel is None:
+        logger.warning(f"Ignored notification for unknown channel {headers.get('X-Goog-Channel-ID')!r}")
+        return Response(status_code=404)
+    return Response(status_code=204)
+
+@app.get("/export")
+async def export_calendar(calendar_id: str = "primary", start: Optional[str] = None, end: Optional[str] = None, format: str = "jsonl",
+                          fields: Optional[str] = None, user_id: Optional[str] = Depends(authenticated_user)):
+    """Stream a calendar range as ICS, JSONL or Parquet, one API page at a time. `start`/`end` are dates or RFC3339 times."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    try:
+        time_min, time_max = resolve_range(start, end)
+        projection = parse_fields(fields)
+        calendar_api = await run_in_threadpool(resolve_calendar_api, user_id)
+        # Authenticate now: once streaming has started, an auth error can no longer become a 401
+        await run_in_threadpool(lambda: calendar_api.service)
+    except SchedulerException as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Exporting '{calendar_id}' as {format} for {user_id or 'local user'}")
+    return StreamingResponse(
+        export_events(calendar_api, calendar_id, time_min, time_max, format, projection),
+        media_type=CONTENT_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{calendar_id}.{format}"'},
+    )
+
+@app.post("/import")
+async def import_calendar(request: Request, calendar_id: str = "primary", format: str = "ics", timezone: Optional[str] = None,
+                          user_id: Optional[str] = Depends(authenticated_user)):
+    """Upload an ICS or CSV file as the raw request body and import it as a background job.
+    Re-importing the same file skips events that are already present."""
+    if format not in ("ics", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ics or csv")
+    check_timezone(timezone)
+    settings = load_config().get("jobs") or {}
+    max_bytes = int(settings.get("max_upload_bytes", 50 * 2 ** 20))
+    too_large = HTTPException(status_code=413, detail=f"upload larger than {max_bytes} bytes")
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+    upload_dir = settings.get("upload_dir", "data/imports")
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{uuid.uuid4().hex}.{format}")
+    size = 0
+    # File writes go to the threadpool so a large upload never blocks the event loop
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            await run_in_threadpool(f.write, chunk)
+    finally:
+        await run_in_threadpool(f.close)
+    if not size or size > max_bytes:
+        os.remove(path)
+        if size:
+            raise too_large
+        raise HTTPException(status_code=400, detail="empty upload")
+    job_id = get_job_manager().submit(IMPORT_EVENTS, {"path": path, "calendar_id": calendar_id, "format": format, "timezone": timezone}, user_id=user_id)
+    logger.info(f"Import job {job_id}: {size} bytes into '{calendar_id}' for {user_id or 'local user'}")
+    return {"job_id": job_id, "bytes": size}
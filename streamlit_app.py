@@ -1,8 +1,11 @@
+import os
 import streamlit as st
 import requests
 import datetime
 
 BASE_URL = "http://localhost:8000"  # Backend endpoint
+# Issued with `python -m utils.credential_store issue-key <user>`
+API_KEY = os.getenv("SCHEDULER_API_KEY")
 
 # --- Set Streamlit dark theme ---
 st.set_page_config(
@@ -54,7 +57,8 @@ if submit_button and user_input.strip():
     try:
         with st.spinner("Agent is working on your request..."):
             payload = {"question": user_input}
-            response = requests.post(f"{BASE_URL}/query", json=payload)
+            headers = {"Authorization": f"Bearer {API_KEY}"} if API_KEY else {}
+            response = requests.post(f"{BASE_URL}/query", json=payload, headers=headers)
 
         if response.status_code == 200:
             answer = response.json().get("answer", "No answer returned.")
@@ -1,18 +1,32 @@
 from utils.calendar_api import GoogleCalendarAPI
+from utils.calendar_pool import current_calendar_api, current_user_id
+from utils.bulk_operations import BATCH_DELETE
+from utils.job_queue import JobManager
 from utils.datetime_utils import dt_handler
-from langchain.tools import tool
+from langchain_core.tools import tool
 from typing import List
 from datetime import datetime, timedelta
 import pytz
 import time
 
-LONDON_TZ = 'Europe/London'
 
 class CalendarTool:
-    def __init__(self):
-        self.api = GoogleCalendarAPI()
+    def __init__(self, api: GoogleCalendarAPI = None, job_manager: JobManager = None):
+        self._default_api = api
+        # When set, bulk operations run as background jobs instead of inside the request
+        self.job_manager = job_manager
         self.calendar_tool_list = self._setup_tools()
 
+    @property
+    def api(self) -> GoogleCalendarAPI:
+        """The calendar client for the current request (multi-user server), else the local single-user client."""
+        request_api = current_calendar_api.get()
+        if request_api is not None:
+            return request_api
+        if self._default_api is None:
+            self._default_api = GoogleCalendarAPI()
+        return self._default_api
+
     def _setup_tools(self) -> List:
         @tool
         def list_calendars(show_ids: bool = False) -> str:
@@ -42,7 +56,7 @@ class CalendarTool:
 
         @tool
         def smart_event_search(description: str, calendar_id: str = 'primary', search_recent: bool = True) -> str:
-            """Intelligently search for events based on vague descriptions. This tool is perfect for finding events when users mention them without specific IDs. Search in recent/upcoming events by default."""
+            """Intelligently search for events based on vague descriptions. This tool is perfect for finding events when users mention them without specific IDs. Search in recent/upcoming events by default; set search_recent=False for the whole history (e.g. 'when did I last see the dentist')."""
             try:
                 # Determine search time range based on context
                 if search_recent:
@@ -55,12 +69,19 @@ class CalendarTool:
                     # Search in all events
                     time_min, time_max = None, None
                 
-                events = self.api.get_events(calendar_id, time_min, time_max)
-                
                 # Smart keyword extraction and matching
                 description_lower = description.lower()
                 keywords = description_lower.split()
                 
+                archive = self.api.archive
+                if not search_recent and archive is not None:
+                    # Whole-history search runs on the local archive (summary, location and description) instead of listing every event
+                    terms = [description_lower] + [keyword for keyword in keywords if len(keyword) > 2]
+                    archive.refresh(self.api, calendar_id)
+                    events = archive.events(calendar_id, match=lambda text: any(term in text.lower() for term in terms))
+                else:
+                    events = self.api.get_events(calendar_id, time_min, time_max)
+                
                 # Enhanced matching logic
                 matches = []
                 for ev in events:
@@ -229,9 +250,9 @@ class CalendarTool:
             try:
                 ev = self.api.get_event(calendar_id, event_id)
                 ev['start']['dateTime'] = new_start
-                ev['start']['timeZone'] = LONDON_TZ
+                ev['start']['timeZone'] = dt_handler.tz.zone
                 ev['end']['dateTime'] = new_end
-                ev['end']['timeZone'] = LONDON_TZ
+                ev['end']['timeZone'] = dt_handler.tz.zone
                 updated = self.api.update_event(calendar_id, event_id, ev)
                 return f"✅ Event '{updated.get('summary','(No Title)')}' moved to {dt_handler.format_datetime_for_display(new_start)} - {dt_handler.format_datetime_for_display(new_end)}."
             except Exception as e:
@@ -239,7 +260,7 @@ class CalendarTool:
 
         @tool
         def get_events_duration(calendar_id: str = 'primary', date: str = None, time_min: str = None, time_max: str = None) -> str:
-            """Calculate the total duration of all events in a calendar for a given date or time range. You can specify a date (YYYY-MM-DD) or relative term (today/tomorrow/yesterday)."""
+            """Calculate the total duration of all events in a calendar for a given date or time range. You can specify a date (YYYY-MM-DD) or relative term (today/tomorrow/yesterday). Works for long ranges too, e.g. a whole year."""
             try:
                 # Use datetime handler for reliable date parsing
                 if date:
@@ -251,22 +272,31 @@ class CalendarTool:
                     else:
                         return f'❌ Invalid date format: {date}. Please use YYYY-MM-DD or relative terms like "today", "tomorrow".'
                 
-                events = self.api.get_events(calendar_id, time_min, time_max)
-                total_minutes = 0
-                for ev in events:
-                    start = ev.get('start', {}).get('dateTime', ev.get('start', {}).get('date', ''))
-                    end = ev.get('end', {}).get('dateTime', ev.get('end', {}).get('date', ''))
-                    try:
-                        dt_start = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                        dt_end = datetime.fromisoformat(end.replace('Z', '+00:00'))
-                        total_minutes += int((dt_end - dt_start).total_seconds() // 60)
-                    except Exception:
-                        continue
+                archive = self.api.archive
+                if archive is not None and archive.covers(time_min, time_max):
+                    # Months or years are answered from the local archive instead of listing every event;
+                    # a day or a week is listed (or served by the event cache) and never waits on an archive sync
+                    archive.refresh(self.api, calendar_id)
+                    event_count, total_seconds = archive.duration(calendar_id, time_min, time_max)
+                    total_minutes = total_seconds // 60
+                else:
+                    events = self.api.get_events(calendar_id, time_min, time_max)
+                    event_count = len(events)
+                    total_minutes = 0
+                    for ev in events:
+                        start = ev.get('start', {}).get('dateTime', ev.get('start', {}).get('date', ''))
+                        end = ev.get('end', {}).get('dateTime', ev.get('end', {}).get('date', ''))
+                        try:
+                            dt_start = datetime.fromisoformat(start.replace('Z', '+00:00'))
+                            dt_end = datetime.fromisoformat(end.replace('Z', '+00:00'))
+                            total_minutes += int((dt_end - dt_start).total_seconds() // 60)
+                        except Exception:
+                            continue
                 
                 hours = total_minutes // 60
                 minutes = total_minutes % 60
                 date_display = dt_handler.format_datetime_for_display(time_min)[:11] if time_min else "the specified period"
-                return f"📊 **Time Summary for {date_display}:**\n- Total scheduled time: {hours} hours {minutes} minutes\n- Number of events: {len(events)}"
+                return f"📊 **Time Summary for {date_display}:**\n- Total scheduled time: {hours} hours {minutes} minutes\n- Number of events: {event_count}"
             except Exception as e:
                 return f'❌ Error calculating duration: {str(e)}.'
 
@@ -306,38 +336,58 @@ class CalendarTool:
                 return f'❌ Error getting free/busy info: {str(e)}.'
 
         @tool
-        def quick_add_event(calendar_id: str = 'primary', text: str = '') -> str:
-            """Quickly add an event using a single natural language string (e.g., 'Lunch with Bob at 1pm Friday'). Returns a confirmation."""
-            # This is a placeholder; Google Calendar API has a quickAdd endpoint, but not in v3 Python client. We'll parse with LLM and call create_event.
-            return f"Quick add: {text}. Please use the create_event tool for full details."
+        def quick_add_event(calendar_id: str = 'primary', text: str = '', minimal: bool = False) -> str:
+            """Create an event from a single natural language string in one step (e.g., 'Lunch with Bob at 1pm Friday at Dishoom', 'Standup 9:30-9:45 next Tue', 'Offsite 12 June'). Understands dates, weekdays with next/this, times, time ranges, durations and locations. Set minimal=True for a short confirmation message."""
+            try:
+                parsed = dt_handler.parse_event_text(text)
+                if parsed['start'] is None:
+                    return f"❌ Could not find a date or time in '{text}'. Please use the create_event tool with explicit start and end."
+                if parsed['all_day']:
+                    start, end = {'date': parsed['start'].isoformat()}, {'date': parsed['end'].isoformat()}
+                else:
+                    start = {'dateTime': parsed['start'].isoformat(), 'timeZone': dt_handler.tz.zone}
+                    end = {'dateTime': parsed['end'].isoformat(), 'timeZone': dt_handler.tz.zone}
+                event = {'summary': parsed['summary'], 'start': start, 'end': end}
+                if parsed['location']:
+                    event['location'] = parsed['location']
+                created = self.api.create_event(calendar_id, event)
+                if minimal:
+                    return f"✅ Event '{created.get('summary','(No Title)')}' created."
+                if parsed['all_day']:
+                    when = f"{parsed['start'].strftime('%d %B %Y')} (all day)"
+                else:
+                    when = f"{dt_handler.format_datetime_for_display(start['dateTime'])} to {dt_handler.format_datetime_for_display(end['dateTime'])} ({dt_handler.tz.zone})"
+                return f"**✅ Event Created Successfully!**\n\n- **Title:** {created.get('summary','(No Title)')}\n- **Date:** {when}\n- **Location:** {created.get('location','')}\n- **Calendar:** {calendar_id}\n- **Event ID:** {created.get('id','')}\n"
+            except Exception as e:
+                return f'❌ Error creating event: {str(e)}.'
 
         @tool
         def create_event(calendar_id: str, summary: str, start: str, end: str, description: str = "", location: str = "", minimal: bool = False) -> str:
-            """Create an event in a calendar. Dates in RFC3339 format, always using Europe/London time zone. Set minimal=True for a short confirmation message. Always confirm with a detailed, nicely formatted summary."""
+            """Create an event in a calendar. Dates in RFC3339 format, in the user's time zone. Set minimal=True for a short confirmation message. Always confirm with a detailed, nicely formatted summary."""
             try:
                 event = {
                     'summary': summary,
                     'location': location,
                     'description': description,
-                    'start': {'dateTime': start, 'timeZone': LONDON_TZ},
-                    'end': {'dateTime': end, 'timeZone': LONDON_TZ},
+                    'start': {'dateTime': start, 'timeZone': dt_handler.tz.zone},
+                    'end': {'dateTime': end, 'timeZone': dt_handler.tz.zone},
                 }
                 created = self.api.create_event(calendar_id, event)
                 if minimal:
                     return f"✅ Event '{created.get('summary','(No Title)')}' created."
-                summary_text = f"**✅ Event Created Successfully!**\n\n- **Title:** {created.get('summary','(No Title)')}\n- **Date:** {dt_handler.format_datetime_for_display(created['start'].get('dateTime',''))} to {dt_handler.format_datetime_for_display(created['end'].get('dateTime',''))} (Europe/London)\n- **Description:** {created.get('description','')}\n- **Location:** {created.get('location','')}\n- **Calendar:** {calendar_id}\n- **Event ID:** {created.get('id','')}\n"
+                summary_text = f"**✅ Event Created Successfully!**\n\n- **Title:** {created.get('summary','(No Title)')}\n- **Date:** {dt_handler.format_datetime_for_display(created['start'].get('dateTime',''))} to {dt_handler.format_datetime_for_display(created['end'].get('dateTime',''))} ({dt_handler.tz.zone})\n- **Description:** {created.get('description','')}\n- **Location:** {created.get('location','')}\n- **Calendar:** {calendar_id}\n- **Event ID:** {created.get('id','')}\n"
                 return summary_text
             except Exception as e:
                 return f'❌ Error creating event: {str(e)}.'
 
         @tool
         def update_event(calendar_id: str, event_id: str, summary: str = None, start: str = None, end: str = None, description: str = None, location: str = None, minimal: bool = False) -> str:
-            """Update an event in a calendar. Only provided fields will be updated. Dates in RFC3339, Europe/London. Set minimal=True for a short confirmation message. Always confirm with a detailed, nicely formatted summary."""
+            """Update an event in a calendar. Only provided fields will be updated. Dates in RFC3339, in the user's time zone. Set minimal=True for a short confirmation message. Always confirm with a detailed, nicely formatted summary."""
             try:
                 event = self.api.get_event(calendar_id, event_id)
                 if summary: event['summary'] = summary
-                if start: event['start']['dateTime'] = start; event['start']['timeZone'] = LONDON_TZ
-                if end: event['end']['dateTime'] = end; event['end']['timeZone'] = LONDON_TZ
+                if start: event['start']['dateTime'] = start; event['start']['timeZone'] = dt_handler.tz.zone
+                if end: event['end']['dateTime'] = end; event['end']['timeZone'] = dt_handler.tz.zone
                 if description: event['description'] = description
                 if location: event['location'] = location
                 updated = self.api.update_event(calendar_id, event_id, event)
@@ -369,7 +419,7 @@ class CalendarTool:
 
         @tool
         def delete_events_in_range(calendar_id: str = 'primary', date: str = None, time_min: str = None, time_max: str = None) -> str:
-            """Delete all events in a calendar between time_min and time_max (RFC3339 format) or for a specific date. You can specify a date (YYYY-MM-DD) or relative term (today/tomorrow/yesterday). Use this for requests like 'delete all events between 2-7pm from tomorrow onwards'. Always confirm with a nicely formatted summary of deleted events."""
+            """Delete all events in a calendar between time_min and time_max (RFC3339 format) or for a specific date. You can specify a date (YYYY-MM-DD) or relative term (today/tomorrow/yesterday). Use this for requests like 'delete all events between 2-7pm from tomorrow onwards'. Large deletions may run as a background job: then share the returned job ID and use get_job_status for progress. Otherwise confirm with a nicely formatted summary of deleted events."""
             try:
                 # Use datetime handler for reliable date parsing
                 if date:
@@ -382,7 +432,13 @@ class CalendarTool:
                         return f'❌ Invalid date format: {date}. Please use YYYY-MM-DD or relative terms like "today", "tomorrow".'
                 elif not time_min or not time_max:
                     return '❌ Please specify a valid time range or date.'
-                
+
+                if self.job_manager is not None:
+                    job_id = self.job_manager.submit(BATCH_DELETE, {"calendar_id": calendar_id, "time_min": time_min, "time_max": time_max}, user_id=current_user_id.get())
+                    date_display = dt_handler.format_datetime_for_display(time_min)[:11]
+                    return (f"🗑️ Started background job `{job_id}` to delete events from calendar '{calendar_id}' for {date_display}.\n"
+                            f"Track it with get_job_status or GET /jobs/{job_id}/progress; cancel with POST /jobs/{job_id}/cancel.")
+
                 # Add timeout protection for batch operations
                 start_time = time.time()
                 timeout = 60  # 60 seconds timeout for batch operations
@@ -405,4 +461,21 @@ class CalendarTool:
             except Exception as e:
                 return f'❌ Error deleting events: {str(e)}. Please check the calendar ID and permissions.'
 
-        return [list_calendars, smart_event_search, list_events, search_events_by_keyword, get_event_details, move_event, get_events_duration, get_free_busy, quick_add_event, create_event, update_event, delete_event, delete_events_in_range]
+        @tool
+        def get_job_status(job_id: str) -> str:
+            """Get the status and progress of a background job (e.g. a bulk deletion) by its job ID."""
+            if self.job_manager is None:
+                return '❌ Background jobs are not enabled.'
+            job = self.job_manager.get(job_id)
+            if job is None or job['user_id'] != current_user_id.get():
+                return f'❌ Job `{job_id}` not found.'
+            total = job['total']
+            progress = f"{job['done']}/{total}" if total is not None else f"{job['done']}"
+            result = f"**Job `{job_id}`** ({job['kind']}): {job['status']}, {progress} done"
+            if job['result']:
+                result += f"\nResult: {job['result']}"
+            if job['error']:
+                result += f"\nError: {job['error']}"
+            return result
+
+        return [list_calendars, smart_event_search, list_events, search_events_by_keyword, get_event_details, move_event, get_events_duration, get_free_busy, quick_add_event, create_event, update_event, delete_event, delete_events_in_range, get_job_status]
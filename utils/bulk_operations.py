@@ -0,0 +1,69 @@
+"""
+Job handlers for bulk calendar operations run by utils/job_queue.py.
+"""
+from typing import Any, Dict
+
+from utils.event_import import import_file
+from utils.job_queue import JobContext, JobManager
+
+BATCH_DELETE = "batch_delete"
+IMPORT_EVENTS = "import_events"
+
+# Persist the resume checkpoint after this many deletions
+CHECKPOINT_EVERY = 25
+
+
+def _http_status(error: Exception):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+
+
+def batch_delete_handler(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Delete every event in a range. Resumable: events deleted before a restart are no
+    longer listed, and the checkpoint keeps the running count."""
+    calendar_id = params["calendar_id"]
+    deleted = ctx.checkpoint.get("deleted", 0)
+    events = ctx.api.get_events(calendar_id, params["time_min"], params["time_max"])
+    ctx.progress(deleted, deleted + len(events))
+    for event in events:
+        ctx.check_cancelled()
+        event_id = event.get("id")
+        if not event_id:
+            continue
+        try:
+            ctx.api.delete_event(calendar_id, event_id)
+        except Exception as e:
+            # Already gone (e.g. deleted just before a restart): count it and move on
+            if _http_status(e) not in (404, 410):
+                raise
+        deleted += 1
+        ctx.checkpoint["deleted"] = deleted
+        ctx.progress(deleted)
+        if deleted % CHECKPOINT_EVERY == 0:
+            ctx.save_checkpoint(ctx.checkpoint)
+    return {"calendar_id": calendar_id, "time_min": params["time_min"], "time_max": params["time_max"], "deleted": deleted}
+
+
+def import_events_handler(ctx: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Import an uploaded ICS/CSV file; resumes from the record position in the checkpoint."""
+    def on_checkpoint(state: Dict[str, Any]) -> None:
+        ctx.progress(state["position"])
+        ctx.save_checkpoint(state)
+
+    report = import_file(
+        ctx.api,
+        params["path"],
+        params.get("calendar_id", "primary"),
+        params.get("format"),
+        tz_name=params.get("timezone"),
+        concurrency=params.get("concurrency", 4),
+        checkpoint=ctx.checkpoint,
+        on_checkpoint=on_checkpoint,
+        check_cancelled=ctx.check_cancelled,
+    )
+    ctx.progress(report.resumed_from + report.records, report.resumed_from + report.records)
+    return report.to_dict()
+
+
+def register_bulk_handlers(manager: JobManager) -> None:
+    manager.register(BATCH_DELETE, batch_delete_handler)
+    manager.register(IMPORT_EVENTS, import_events_handler)
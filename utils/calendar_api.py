@@ -1,60 +1,217 @@
 import os
 import datetime
+import functools
+import json
 import pickle
-from typing import List, Optional
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from typing import Iterator, List, Optional, Tuple
+from exception import CalendarAuthError
+from utils.event_sync import EventCache
+from utils.tracing import span, traced
+
+# Google client libraries are imported where they are used: they are slow to import and
+# not needed until the first calendar call (or at all, with an injected service).
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 CREDENTIALS_FILE = 'credentials.json'
 TOKEN_FILE = 'token.pickle'
+# Optional pinned copy of the discovery document; otherwise the one bundled with google-api-python-client is used
+DISCOVERY_FILE = os.getenv('CALENDAR_DISCOVERY_FILE', 'config/calendar_v3_discovery.json')
+
+@functools.lru_cache(maxsize=1)
+def load_discovery_document() -> dict:
+    """Calendar v3 discovery document, read and parsed once per process, never fetched over the network."""
+    if os.path.exists(DISCOVERY_FILE):
+        with open(DISCOVERY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    from googleapiclient import discovery_cache
+    document = discovery_cache.get_static_doc('calendar', 'v3')
+    if document is None:
+        raise FileNotFoundError(f"No bundled Calendar v3 discovery document found; save one to {DISCOVERY_FILE}")
+    return json.loads(document)
+
+def build_service(creds):
+    """Build a Calendar client from the cached discovery document. The client is safe to share
+    between threads: httplib2.Http is not thread-safe, so every request gets its own authorised Http object."""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(creds, http=httplib2.Http()), *args, **kwargs)
+    return build_from_document(load_discovery_document(), requestBuilder=build_request, http=AuthorizedHttp(creds, http=httplib2.Http()))
+
 
 class GoogleCalendarAPI:
-    def __init__(self):
-        self.creds = None
-        self.service = None
-        self.authenticate()
+    def __init__(self, service=None, credentials=None, archive=None, shared_state=None, cache_scope: str = "local",
+                 interactive: bool = True):
+        # A prebuilt service (e.g. the offline fake in benchmarks/) skips OAuth entirely.
+        # Otherwise the client is built on first use, from stored credentials (see
+        # utils/calendar_pool.py) or, in single-user local mode, from token.pickle.
+        # interactive=False (the API server) raises CalendarAuthError instead of opening a browser flow.
+        self.creds = credentials
+        self.interactive = interactive
+        self._service = service
+        # Optional columnar history (utils/event_archive.py) for long-range search and durations
+        self.archive = archive
+        # Serves calendars that have a push channel open (utils/event_sync.py); others hit the API.
+        # Its syncs also keep the archive current; with shared_state its invalidations reach every worker.
+        self.event_cache = EventCache(on_sync=archive.apply if archive is not None else None, shared=shared_state, scope=cache_scope)
 
+    @property
+    def service(self):
+        if self._service is None:
+            if self.creds is not None:
+                self._service = build_service(self.creds)
+            else:
+                self.authenticate()
+        return self._service
+
+    @service.setter
+    def service(self, value):
+        self._service = value
+
+    @traced("calendar", "authenticate")
     def authenticate(self):
+        from google.auth.transport.requests import Request
+
         if os.path.exists(TOKEN_FILE):
             with open(TOKEN_FILE, 'rb') as token:
                 self.creds = pickle.load(token)
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 self.creds.refresh(Request())
+            elif not self.interactive:
+                raise CalendarAuthError("No usable local Google token. Run: python -m utils.credential_store local-login")
             else:
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
                 self.creds = flow.run_local_server(port=0)
             with open(TOKEN_FILE, 'wb') as token:
                 pickle.dump(self.creds, token)
-        self.service = build('calendar', 'v3', credentials=self.creds)
+        self.service = build_service(self.creds)
 
+    @traced("calendar", "calendarList.list")
     def get_user_calendars(self) -> List[dict]:
         calendars_result = self.service.calendarList().list().execute()
         return calendars_result.get('items', [])
 
     def get_events(self, calendar_id: str = 'primary', time_min: Optional[str] = None, time_max: Optional[str] = None) -> List[dict]:
-        events_result = self.service.events().list(
-            calendarId=calendar_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        return events_result.get('items', [])
+        cached = self.event_cache.get_events(self, calendar_id, time_min, time_max)
+        if cached is not None:
+            return cached
+        return self._list_events(calendar_id, time_min, time_max)
 
+    @traced("calendar", "events.list")
+    def _list_events(self, calendar_id: str, time_min: Optional[str], time_max: Optional[str]) -> List[dict]:
+        events = []
+        page_token = None
+        # The API returns at most 250 events per page; follow nextPageToken so busy ranges are not truncated
+        while True:
+            events_result = self.service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                singleEvents=True,
+                orderBy='startTime',
+                pageToken=page_token
+            ).execute()
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return events
+
+    def iter_event_pages(self, calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None,
+                         page_size: int = 2500, fields: Optional[str] = None, single_events: bool = True) -> Iterator[List[dict]]:
+        """Yield events one API page at a time, so only one page is held in memory (exports).
+        `fields` is a partial-response selector such as 'items(id,summary,start,end)'.
+        With single_events=False recurring series come back once, unexpanded and unordered."""
+        page_token = None
+        while True:
+            with span("calendar", "events.list"):
+                events_result = self.service.events().list(
+                    calendarId=calendar_id,
+                    timeMin=time_min,
+                    timeMax=time_max,
+                    singleEvents=single_events,
+                    orderBy='startTime' if single_events else None,
+                    pageToken=page_token,
+                    maxResults=page_size,
+                    fields=f'nextPageToken,{fields}' if fields else None
+                ).execute()
+            yield events_result.get('items', [])
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return
+
+    @traced("calendar", "events.list.sync")
+    def list_event_changes(self, calendar_id: str, sync_token: Optional[str] = None) -> Tuple[List[dict], str]:
+        """All expanded events (no sync token) or only those changed since `sync_token`, deleted
+        ones with status 'cancelled'. Returns the items and the token for the next call."""
+        events = []
+        page_token = None
+        while True:
+            events_result = self.service.events().list(
+                calendarId=calendar_id,
+                singleEvents=True,
+                syncToken=sync_token,
+                pageToken=page_token,
+                maxResults=2500
+            ).execute()
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                return events, events_result.get('nextSyncToken')
+
+    @traced("calendar", "events.watch")
+    def watch_events(self, calendar_id: str, channel_id: str, address: str, token: str, ttl_seconds: float) -> dict:
+        """Ask Google to POST change notifications for a calendar to `address`."""
+        body = {'id': channel_id, 'type': 'web_hook', 'address': address, 'token': token, 'params': {'ttl': str(int(ttl_seconds))}}
+        return self.service.events().watch(calendarId=calendar_id, body=body).execute()
+
+    @traced("calendar", "channels.stop")
+    def stop_channel(self, channel_id: str, resource_id: str) -> None:
+        self.service.channels().stop(body={'id': channel_id, 'resourceId': resource_id}).execute()
+
+    @traced("calendar", "events.insert")
     def create_event(self, calendar_id: str, event: dict) -> dict:
         event = self.service.events().insert(calendarId=calendar_id, body=event).execute()
+        self._invalidate(calendar_id)
         return event
 
+    def import_events_batch(self, calendar_id: str, events: List[dict]) -> List[Tuple[Optional[dict], Optional[Exception]]]:
+        """Import events (each with an iCalUID) in one HTTP batch request; at most 50 per batch.
+        events.import is idempotent per iCalUID. Returns (imported event, error) per input, in order."""
+        results: List[Tuple[Optional[dict], Optional[Exception]]] = [(None, None)] * len(events)
+
+        def on_response(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for index, event in enumerate(events):
+            batch.add(self.service.events().import_(calendarId=calendar_id, body=event), request_id=str(index))
+        with span("calendar", "events.import.batch", size=len(events)):
+            batch.execute()
+        self._invalidate(calendar_id)
+        return results
+
+    @traced("calendar", "events.update")
     def update_event(self, calendar_id: str, event_id: str, updated_event: dict) -> dict:
         event = self.service.events().update(calendarId=calendar_id, eventId=event_id, body=updated_event).execute()
+        self._invalidate(calendar_id)
         return event
 
+    @traced("calendar", "events.delete")
     def delete_event(self, calendar_id: str, event_id: str) -> None:
         self.service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        self._invalidate(calendar_id)
+
+    def _invalidate(self, calendar_id: str) -> None:
+        self.event_cache.invalidate(calendar_id)
+        if self.archive is not None:
+            self.archive.invalidate(calendar_id)
 
+    @traced("calendar", "events.get")
     def get_event(self, calendar_id: str, event_id: str) -> dict:
         event = self.service.events().get(calendarId=calendar_id, eventId=event_id).execute()
         return event
@@ -0,0 +1,205 @@
+"""
+Per-user Calendar clients for the multi-user server.
+
+- CalendarClientPool: LRU of built GoogleCalendarAPI objects, one per user, so
+  requests never rebuild a client or re-authenticate.
+- TokenRefresher: background thread that refreshes the access tokens of recently
+  active users shortly before they expire, keeping token refresh off the request
+  path. With several workers only the holder of a shared lease sweeps; the others
+  pick the refreshed token up from the store.
+- current_calendar_api / use_calendar_api: the client bound to the request being
+  served, read by CalendarTool so one compiled graph serves every user.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from google.auth.exceptions import RefreshError
+
+from exception import CalendarAuthError
+from logger import get_logger
+from utils.calendar_api import GoogleCalendarAPI
+from utils.credential_store import CredentialStore
+from utils.tracing import span
+
+logger = get_logger(__name__)
+
+TOKEN_REFRESH_LEASE = "credentials.refresh"
+# A pooled user's activity is written to the store at most this often
+TOUCH_INTERVAL_SECONDS = 60
+
+current_calendar_api: contextvars.ContextVar[Optional[GoogleCalendarAPI]] = contextvars.ContextVar("current_calendar_api", default=None)
+current_user_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_user_id", default=None)
+
+
+@contextmanager
+def use_calendar_api(api: GoogleCalendarAPI, user_id: Optional[str] = None) -> Iterator[GoogleCalendarAPI]:
+    """Bind `api` (and the user it belongs to) as the calendar client for the enclosed work (one request or job)."""
+    api_token = current_calendar_api.set(api)
+    user_token = current_user_id.set(user_id)
+    try:
+        yield api
+    finally:
+        current_user_id.reset(user_token)
+        current_calendar_api.reset(api_token)
+
+
+class CalendarClientPool:
+    """LRU cache of per-user GoogleCalendarAPI clients built from the credential store."""
+
+    def __init__(self, store: CredentialStore, max_size: int = 128, client_options: Optional[Callable[[str], Dict[str, Any]]] = None):
+        self.store = store
+        self.max_size = max_size
+        # user_id -> extra GoogleCalendarAPI arguments for that user (event archive, shared state)
+        self.client_options = client_options
+        self._clients: "OrderedDict[str, GoogleCalendarAPI]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One build per user at a time; other requests for that user wait for it
+        self._build_locks: dict = {}
+        # user_id -> when its activity was last recorded in the store
+        self._touched: Dict[str, float] = {}
+
+    def get(self, user_id: str) -> GoogleCalendarAPI:
+        self._touch(user_id)
+        with self._lock:
+            client = self._clients.get(user_id)
+            if client is not None:
+                self._clients.move_to_end(user_id)
+        if client is not None:
+            if client.creds is not None and not client.creds.valid:
+                self._adopt_stored_token(user_id, client)
+            return client
+        with self._lock:
+            build_lock = self._build_locks.setdefault(user_id, threading.Lock())
+        with build_lock:
+            with self._lock:
+                client = self._clients.get(user_id)
+                if client is not None:
+                    return client
+            client = self._build(user_id)
+            with self._lock:
+                self._clients[user_id] = client
+                self._clients.move_to_end(user_id)
+                while len(self._clients) > self.max_size:
+                    evicted, _ = self._clients.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+                    self._touched.pop(evicted, None)
+            return client
+
+    def _touch(self, user_id: str) -> None:
+        """Record the user as active (for TokenRefresher), at most every TOUCH_INTERVAL_SECONDS."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(user_id, 0.0) < TOUCH_INTERVAL_SECONDS:
+                return
+            self._touched[user_id] = now
+        self.store.touch(user_id, now)
+
+    def _adopt_stored_token(self, user_id: str, client: GoogleCalendarAPI) -> None:
+        """The pooled token expired: take the one another worker's refresher stored, if it is newer."""
+        stored = self.store.get(user_id)
+        if stored is not None and stored.valid:
+            client.creds.token, client.creds.expiry = stored.token, stored.expiry
+
+    def _build(self, user_id: str) -> GoogleCalendarAPI:
+        creds = self.store.get(user_id)
+        if creds is None:
+            raise CalendarAuthError(f"No Google Calendar credentials for user '{user_id}'. Run: python -m utils.credential_store authorize {user_id}")
+        if self.store.is_revoked(user_id):
+            raise CalendarAuthError(f"Google Calendar access for user '{user_id}' was revoked. Run: python -m utils.credential_store authorize {user_id}")
+        if not creds.valid:
+            # Only reached when the background refresher has not caught this user yet
+            if not creds.refresh_token:
+                raise CalendarAuthError(f"Google Calendar credentials for user '{user_id}' have expired and cannot be refreshed.")
+            from google.auth.transport.requests import Request
+            with span("calendar", "token.refresh"):
+                try:
+                    creds.refresh(Request())
+                except RefreshError as e:
+                    self.store.mark_revoked(user_id)
+                    raise CalendarAuthError(f"Google Calendar access for user '{user_id}' was revoked: {e}")
+            self.store.put(user_id, creds)
+        with span("calendar", "client.build"):
+            return GoogleCalendarAPI(credentials=creds, **(self.client_options(user_id) if self.client_options else {}))
+
+    def peek(self, user_id: str) -> Optional[GoogleCalendarAPI]:
+        with self._lock:
+            return self._clients.get(user_id)
+
+    def evict(self, user_id: str) -> None:
+        with self._lock:
+            self._clients.pop(user_id, None)
+            self._touched.pop(user_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+
+class TokenRefresher:
+    """Refreshes tokens that expire within `margin_seconds`, every `interval_seconds`, for users
+    active within `active_seconds`. Users idle for longer refresh on their next request."""
+
+    def __init__(self, store: CredentialStore, pool: CalendarClientPool, interval_seconds: float = 60, margin_seconds: float = 600,
+                 active_seconds: float = 86400, shared=None):
+        self.store = store
+        self.pool = pool
+        self.interval_seconds = interval_seconds
+        self.margin_seconds = margin_seconds
+        self.active_seconds = active_seconds
+        # With several worker processes, only the holder of the shared lease sweeps
+        self.shared = shared
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.shared is not None:
+            self.shared.release_lease(TOKEN_REFRESH_LEASE)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.shared is None or self.shared.acquire_lease(TOKEN_REFRESH_LEASE, ttl_seconds=self.interval_seconds * 2):
+                    self.refresh_due()
+            except Exception:
+                logger.exception("Token refresh sweep failed")
+            self._stop.wait(self.interval_seconds)
+
+    def refresh_due(self) -> int:
+        """Refresh every recently active user's token expiring soon. Returns the number refreshed."""
+        from google.auth.transport.requests import Request
+        refreshed = 0
+        now = time.time()
+        for user_id in self.store.expiring_before(now + self.margin_seconds, active_since=now - self.active_seconds):
+            client = self.pool.peek(user_id)
+            # Refresh the pooled client's credentials in place so its service picks up the new token
+            creds = client.creds if client is not None and client.creds is not None else self.store.get(user_id)
+            if creds is None or not creds.refresh_token:
+                continue
+            try:
+                with span("calendar", "token.refresh"):
+                    creds.refresh(Request())
+            except RefreshError as e:
+                # Revoked or expired refresh token: skip this user until they authorise again
+                logger.warning(f"Could not refresh token for user '{user_id}', marking it revoked: {e}")
+                self.store.mark_revoked(user_id)
+                self.pool.evict(user_id)
+                continue
+            self.store.put(user_id, creds)
+            refreshed += 1
+        if refreshed:
+            logger.info(f"Refreshed {refreshed} Google token(s) ahead of expiry")
+        return refreshed
@@ -0,0 +1,225 @@
+"""
+Per-user Google OAuth credential store backed by SQLite.
+
+Credentials are stored as the JSON produced by google.oauth2.credentials.Credentials,
+encrypted with Fernet when CREDENTIAL_STORE_KEY is set (requires `cryptography`).
+
+Authorise a user once from a machine with a browser:
+    python -m utils.credential_store authorize alice
+Import the legacy single-user token.pickle:
+    python -m utils.credential_store import-pickle default
+Issue the API key a client sends as `Authorization: Bearer <key>` to act as that
+user (only a hash is stored, so the key is shown once), or revoke all of them:
+    python -m utils.credential_store issue-key alice
+    python -m utils.credential_store revoke-keys alice
+Create the local single-user token.pickle (auth.allow_local_user):
+    python -m utils.credential_store local-login
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional
+
+from logger import get_logger
+from utils.calendar_api import CREDENTIALS_FILE, SCOPES, TOKEN_FILE
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+logger = get_logger(__name__)
+
+DEFAULT_STORE_PATH = "data/credentials.db"
+
+
+def _load_fernet(key: Optional[str]):
+    if not key:
+        return None
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError as e:
+        raise ImportError("CREDENTIAL_STORE_KEY is set but the 'cryptography' package is not installed.") from e
+    return Fernet(key.encode() if isinstance(key, str) else key)
+
+
+def _expiry_epoch(creds: "Credentials") -> Optional[float]:
+    if not creds.expiry:
+        return None
+    # google-auth keeps expiry as a naive UTC datetime
+    return creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class CredentialStore:
+    """Thread-safe SQLite store of OAuth credentials keyed by user id."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH, key: Optional[str] = None):
+        self.path = path
+        self._fernet = _load_fernet(key if key is not None else os.getenv("CREDENTIAL_STORE_KEY"))
+        if self._fernet is None:
+            logger.warning("CREDENTIAL_STORE_KEY not set: OAuth tokens are stored unencrypted")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS credentials ("
+            "user_id TEXT PRIMARY KEY, payload BLOB NOT NULL, expiry REAL, updated_at REAL NOT NULL, "
+            "last_active REAL, revoked INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Tables created before activity and revocation were tracked
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(credentials)")}
+        for column, kind in (("last_active", "REAL"), ("revoked", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE credentials ADD COLUMN {column} {kind}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS api_keys (key_hash TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _encode(self, creds: "Credentials") -> bytes:
+        payload = creds.to_json().encode("utf-8")
+        return self._fernet.encrypt(payload) if self._fernet else payload
+
+    def _decode(self, payload: bytes) -> "Credentials":
+        from google.oauth2.credentials import Credentials
+        if self._fernet:
+            payload = self._fernet.decrypt(payload)
+        info = json.loads(payload.decode("utf-8"))
+        return Credentials.from_authorized_user_info(info, info.get("scopes") or SCOPES)
+
+    def get(self, user_id: str) -> Optional["Credentials"]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def put(self, user_id: str, creds: "Credentials") -> None:
+        """Store (new or refreshed) credentials; a fresh login also clears a revoked mark."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO credentials (user_id, payload, expiry, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET payload = excluded.payload, expiry = excluded.expiry, "
+                "updated_at = excluded.updated_at, revoked = 0",
+                (user_id, self._encode(creds), _expiry_epoch(creds), time.time()),
+            )
+            self._conn.commit()
+
+    def mark_revoked(self, user_id: str) -> None:
+        """Record that Google rejected the refresh token: skipped until the user authorises again (put)."""
+        with self._lock:
+            self._conn.execute("UPDATE credentials SET revoked = 1 WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def is_revoked(self, user_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT revoked FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+        return bool(row and row[0])
+
+    def touch(self, user_id: str, when: Optional[float] = None) -> None:
+        """Record that the user made a request (see expiring_before's active_since)."""
+        with self._lock:
+            self._conn.execute("UPDATE credentials SET last_active = ? WHERE user_id = ?", (when or time.time(), user_id))
+            self._conn.commit()
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def users(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT user_id FROM credentials ORDER BY user_id")]
+
+    def issue_api_key(self, user_id: str) -> str:
+        """Create an API key that authenticates requests as `user_id`. Only its hash is stored."""
+        key = secrets.token_urlsafe(32)
+        with self._lock:
+            self._conn.execute("INSERT INTO api_keys (key_hash, user_id, created_at) VALUES (?, ?, ?)", (_hash_key(key), user_id, time.time()))
+            self._conn.commit()
+        return key
+
+    def user_for_api_key(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT user_id FROM api_keys WHERE key_hash = ?", (_hash_key(key),)).fetchone()
+        return row[0] if row else None
+
+    def revoke_api_keys(self, user_id: str) -> int:
+        with self._lock:
+            count = self._conn.execute("DELETE FROM api_keys WHERE user_id = ?", (user_id,)).rowcount
+            self._conn.commit()
+        return count
+
+    def expiring_before(self, epoch: float, active_since: Optional[float] = None) -> List[str]:
+        """Users whose access token expires before `epoch` (tokens without expiry and revoked
+        credentials are skipped), limited to users active since `active_since` when given."""
+        sql = "SELECT user_id FROM credentials WHERE expiry IS NOT NULL AND expiry < ? AND revoked = 0"
+        args: tuple = (epoch,)
+        if active_since is not None:
+            sql += " AND last_active >= ?"
+            args += (active_since,)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, args)]
+
+
+def _hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def authorize_user(store: CredentialStore, user_id: str) -> None:
+    """Run the browser OAuth flow once for a user and save the result."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+    creds = flow.run_local_server(port=0)
+    store.put(user_id, creds)
+    print(f"Stored credentials for '{user_id}' in {store.path}")
+
+
+def import_token_pickle(store: CredentialStore, user_id: str, token_file: str = TOKEN_FILE) -> None:
+    with open(token_file, "rb") as token:
+        creds = pickle.load(token)
+    store.put(user_id, creds)
+    print(f"Imported {token_file} as '{user_id}' into {store.path}")
+
+
+def main():
+    from utils.config_loader import load_config
+
+    settings = load_config().get("credentials") or {}
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("command", choices=["authorize", "import-pickle", "list", "remove", "issue-key", "revoke-keys", "local-login"])
+    arg_parser.add_argument("user_id", nargs="?", default="default")
+    arg_parser.add_argument("--store", default=settings.get("store_path", DEFAULT_STORE_PATH))
+    args = arg_parser.parse_args()
+
+    store = CredentialStore(args.store)
+    if args.command == "authorize":
+        authorize_user(store, args.user_id)
+    elif args.command == "import-pickle":
+        import_token_pickle(store, args.user_id)
+    elif args.command == "list":
+        for user_id in store.users():
+            print(user_id)
+    elif args.command == "remove":
+        store.delete(args.user_id)
+        revoked = store.revoke_api_keys(args.user_id)
+        print(f"Removed credentials and {revoked} API key(s) for '{args.user_id}'")
+    elif args.command == "issue-key":
+        print(store.issue_api_key(args.user_id))
+    elif args.command == "revoke-keys":
+        print(f"Revoked {store.revoke_api_keys(args.user_id)} API key(s) for '{args.user_id}'")
+    elif args.command == "local-login":
+        from utils.calendar_api import GoogleCalendarAPI
+        GoogleCalendarAPI().authenticate()
+        print(f"Saved the local Google token to {TOKEN_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,60 @@
 """
 Dedicated datetime utility library for reliable date/time handling
 """
+import contextlib
+import contextvars
 import datetime
 import pytz
-from typing import Optional, Tuple, Dict, Any
+from typing import Iterator, Optional, Tuple, Dict, Any
 from dateutil import parser, relativedelta
+from utils.event_text_parser import parse_event_text
+
+# IANA time zone of the request being served, set by the API around graph execution
+current_timezone: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_timezone", default=None)
+
+
+@contextlib.contextmanager
+def use_timezone(tz_name: Optional[str]) -> Iterator[None]:
+    """Bind the request's time zone for the tools called in this context (London when None)"""
+    token = current_timezone.set(tz_name)
+    try:
+        yield
+    finally:
+        current_timezone.reset(token)
+
 
 class DateTimeHandler:
-    """Handles all date/time operations with London timezone"""
+    """Handles all date/time operations in the request's time zone (London by default)"""
     
     def __init__(self):
         self.london_tz = pytz.timezone('Europe/London')
-        self.now = datetime.datetime.now(self.london_tz)
+
+    @property
+    def tz(self) -> pytz.BaseTzInfo:
+        """Time zone of the current request (see use_timezone), London outside one"""
+        tz_name = current_timezone.get()
+        return pytz.timezone(tz_name) if tz_name else self.london_tz
+
+    @property
+    def now(self) -> datetime.datetime:
+        """Current time in the request's time zone, evaluated on every access so long-lived workers never go stale"""
+        return datetime.datetime.now(self.tz)
     
-    def get_current_info(self) -> Dict[str, Any]:
-        """Get comprehensive current date/time information"""
+    def get_current_info(self, tz_name: Optional[str] = None) -> Dict[str, Any]:
+        """Get comprehensive current date/time information (request time zone unless tz_name is given)"""
+        tz = pytz.timezone(tz_name) if tz_name else self.tz
+        now = datetime.datetime.now(tz)
         return {
-            'current_datetime': self.now.strftime('%d %B %Y, %I:%M %p'),
-            'current_date': self.now.strftime('%Y-%m-%d'),
-            'current_day': self.now.strftime('%A'),
-            'timezone': 'Europe/London',
-            'today': self.now.strftime('%Y-%m-%d'),
-            'tomorrow': (self.now + datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
-            'yesterday': (self.now - datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
-            'today_day': self.now.strftime('%A'),
-            'tomorrow_day': (self.now + datetime.timedelta(days=1)).strftime('%A'),
-            'yesterday_day': (self.now - datetime.timedelta(days=1)).strftime('%A')
+            'current_datetime': now.strftime('%d %B %Y, %I:%M %p'),
+            'current_date': now.strftime('%Y-%m-%d'),
+            'current_day': now.strftime('%A'),
+            'timezone': tz.zone,
+            'today': now.strftime('%Y-%m-%d'),
+            'tomorrow': (now + datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
+            'yesterday': (now - datetime.timedelta(days=1)).strftime('%Y-%m-%d'),
+            'today_day': now.strftime('%A'),
+            'tomorrow_day': (now + datetime.timedelta(days=1)).strftime('%A'),
+            'yesterday_day': (now - datetime.timedelta(days=1)).strftime('%A')
         }
     
     def parse_relative_date(self, relative_term: str) -> str:
@@ -45,13 +74,20 @@ class DateTimeHandler:
         else:
             return self.now.strftime('%Y-%m-%d')  # default to today
     
+    def parse_event_text(self, text: str, now: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        """Parse a one-line event description ('Lunch with Bob at 1pm Friday') relative to now in the request's time zone"""
+        return parse_event_text(text, now or self.now)
+
     def parse_natural_language_date(self, text: str) -> Optional[str]:
-        """Parse natural language date expressions"""
+        """Parse natural language date expressions ('next Tuesday', 'in 3 days', '5 March')"""
+        parsed = parse_event_text(text, self.now)
+        if parsed['has_date']:
+            return parsed['start'].strftime('%Y-%m-%d')
         try:
             # Try to parse with dateutil
             parsed_date = parser.parse(text, fuzzy=True)
             if parsed_date.tzinfo is None:
-                parsed_date = self.london_tz.localize(parsed_date)
+                parsed_date = self.tz.localize(parsed_date)
             return parsed_date.strftime('%Y-%m-%d')
         except:
             return None
@@ -68,21 +104,21 @@ class DateTimeHandler:
         # Parse dates
         try:
             if len(start_date) == 10:  # YYYY-MM-DD format
-                start_dt = self.london_tz.localize(datetime.datetime.strptime(start_date, '%Y-%m-%d'))
+                start_dt = self.tz.localize(datetime.datetime.strptime(start_date, '%Y-%m-%d'))
                 start_dt = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
             else:
                 start_dt = parser.parse(start_date)
                 if start_dt.tzinfo is None:
-                    start_dt = self.london_tz.localize(start_dt)
+                    start_dt = self.tz.localize(start_dt)
             
             if end_date:
                 if len(end_date) == 10:  # YYYY-MM-DD format
-                    end_dt = self.london_tz.localize(datetime.datetime.strptime(end_date, '%Y-%m-%d'))
+                    end_dt = self.tz.localize(datetime.datetime.strptime(end_date, '%Y-%m-%d'))
                     end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
                 else:
                     end_dt = parser.parse(end_date)
                     if end_dt.tzinfo is None:
-                        end_dt = self.london_tz.localize(end_dt)
+                        end_dt = self.tz.localize(end_dt)
             else:
                 # Default to same day
                 end_dt = start_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
@@ -95,16 +131,34 @@ class DateTimeHandler:
             today_end = today_start.replace(hour=23, minute=59, second=59, microsecond=999999)
             return today_start.isoformat(), today_end.isoformat()
     
+    def to_event_time(self, value: str, tz_name: Optional[str] = None, all_day: bool = False) -> Dict[str, str]:
+        """Normalise a date or datetime string to a Calendar API start/end dict.
+        Naive times are taken in tz_name (the request's time zone by default). Raises ValueError if unparseable."""
+        value = value.strip()
+        try:
+            if all_day or (len(value) in (8, 10) and value.replace('-', '').isdigit()):
+                return {'date': parser.parse(value).strftime('%Y-%m-%d')}
+            tz = pytz.timezone(tz_name) if tz_name else self.tz
+            try:
+                dt = parser.isoparse(value)
+            except ValueError:
+                dt = parser.parse(value)
+        except (ValueError, OverflowError, pytz.UnknownTimeZoneError) as e:
+            raise ValueError(f"Invalid date/time {value!r}: {e}")
+        if dt.tzinfo is None:
+            return {'dateTime': tz.localize(dt).isoformat(), 'timeZone': tz.zone}
+        return {'dateTime': dt.isoformat(), 'timeZone': tz_name} if tz_name else {'dateTime': dt.isoformat()}
+
     def format_datetime_for_display(self, dt_str: str) -> str:
-        """Format datetime string for nice display"""
+        """Format datetime string for nice display in the request's time zone"""
         if not dt_str:
             return ''
         try:
             dt = parser.parse(dt_str)
             if dt.tzinfo is None:
-                dt = self.london_tz.localize(dt)
+                dt = self.tz.localize(dt)
             else:
-                dt = dt.astimezone(self.london_tz)
+                dt = dt.astimezone(self.tz)
             return dt.strftime('%d %B %Y, %I:%M %p')
         except:
             return dt_str
@@ -0,0 +1,555 @@
+"""
+Columnar on-disk archive of calendar events, for questions that span years
+("how many 1:1s did I have last year", "when did I last see the dentist")
+and would otherwise list the whole calendar over the network on every call.
+
+There is one archive directory per Calendar client (user). Each column is a
+flat file of fixed-width values, one per row:
+  start.i64, end.i64      epoch seconds (all-day dates as midnight UTC, as in utils/event_sync.py)
+  calendar.u32, event_id.u32, summary.u32, location.u32, description.u32
+                          indexes into strings.txt, the interned string table
+  flags.u8                ALL_DAY | DELETED
+Columns are read through mmap (zero-copy memoryviews) and only ever appended
+to: a changed event appends a new row and flags the old one DELETED, and
+compact() rewrites a new generation of the files once deleted rows dominate.
+Several worker processes can share a directory: writes hold an flock on LOCK,
+and a process reloads its indexes when it sees the files changed under it.
+
+The archive is filled incrementally with events.list(syncToken): by refresh()
+(sync tokens per calendar live in state.json) and by the push-notification
+cache, which hands over every sync it makes (EventCache(on_sync=...)).
+
+Usage:
+    python -m utils.event_archive sync --calendar primary
+    python -m utils.event_archive search dentist --calendar primary
+    python -m utils.event_archive stats
+"""
+import argparse
+import bisect
+import datetime
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from logger import get_logger
+from utils.event_sync import _bound, _epoch, _http_status
+from utils.tracing import registry, span
+
+logger = get_logger(__name__)
+
+DEFAULT_ARCHIVE_DIR = "data/archive"
+DEFAULT_MIN_RANGE_DAYS = 31
+SYNC_METRIC = "scheduler_archive_syncs_total"
+ALL_DAY = 1
+DELETED = 2
+# name -> array typecode; the file suffix records the width
+COLUMNS = {"start": "q", "end": "q", "calendar": "I", "event_id": "I", "summary": "I", "location": "I", "description": "I", "flags": "B"}
+SUFFIXES = {"q": "i64", "I": "u32", "B": "u8"}
+# Columns that hold interned strings (remapped on compaction)
+STRING_COLUMNS = ("calendar", "event_id", "summary", "location", "description")
+# Columns searched by text matching
+TEXT_COLUMNS = ("summary", "location", "description")
+# Bumped when COLUMNS changes; an archive written with another layout is rebuilt by a full sync
+ARCHIVE_FORMAT = 2
+# Rewrite the files once there are more deleted rows than live ones (and at least this many)
+COMPACT_MIN_DELETED = 1000
+
+
+class _Column:
+    """One append-only column file, read through a read-only mmap that is remapped after appends."""
+
+    def __init__(self, path: str, typecode: str):
+        self.path = path
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        # "ab" never truncates, even when another process created the file first
+        open(path, "ab").close()
+        self._file = open(path, "r+b", buffering=0)
+        self.length = os.fstat(self._file.fileno()).st_size // self.itemsize
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+    def truncate(self, rows: int) -> None:
+        self._release()
+        self._file.truncate(rows * self.itemsize)
+        self.length = rows
+
+    def append(self, values: array) -> None:
+        self._release()
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(values.tobytes())
+        self.length += len(values)
+
+    def set(self, row: int, value: int) -> None:
+        # Writes go through the page cache, so a live read-only mapping sees them
+        self._file.seek(row * self.itemsize)
+        self._file.write(array(self.typecode, [value]).tobytes())
+
+    def view(self) -> memoryview:
+        if self._view is None:
+            if self.length == 0:
+                return memoryview(array(self.typecode))
+            self._mmap = mmap.mmap(self._file.fileno(), self.length * self.itemsize, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mmap).cast(self.typecode)
+        return self._view
+
+    def _release(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._mmap.close()
+            self._view = self._mmap = None
+
+    def close(self) -> None:
+        self._release()
+        self._file.close()
+
+
+class _CalendarIndex:
+    """Live rows of one calendar ordered by start, for range queries with bisect."""
+
+    def __init__(self, rows: array, starts: array, max_duration: int):
+        self.rows = rows
+        self.starts = starts
+        # Longest event, so a range query knows how far before time_min to look
+        self.max_duration = max_duration
+
+
+def archive_name(user_id: Optional[str]) -> str:
+    """Directory name of a user's archive ('local' for the single-user client)."""
+    return re.sub(r"[^A-Za-z0-9_.@-]", "_", user_id) if user_id else "local"
+
+
+class EventArchive:
+    """Columnar event archive of one Calendar client. Thread-safe; one instance per directory (see open_archive)."""
+
+    def __init__(self, directory: str, max_age_seconds: float = 60, min_range_days: float = DEFAULT_MIN_RANGE_DAYS):
+        self.directory = directory
+        # refresh() skips the API when a calendar was synced this recently and nothing marked it stale
+        self.max_age_seconds = max_age_seconds
+        # Shorter ranges are cheaper to list than to sync the archive for (see covers())
+        self.min_range_days = min_range_days
+        self._lock = threading.RLock()
+        # Serialises network syncs without blocking queries
+        self._sync_lock = threading.Lock()
+        self._synced_at: Dict[str, float] = {}
+        self._stale: set = set()
+        os.makedirs(directory, exist_ok=True)
+        # flock()ed around writes; holds a write sequence number that tells readers to reload
+        self._lock_file = os.fdopen(os.open(os.path.join(directory, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644), "r+b", buffering=0)
+        self._load()
+
+    # ---- storage ----
+
+    def _generation_dir(self, generation: int) -> str:
+        return os.path.join(self.directory, f"g{generation}")
+
+    def _load(self) -> None:
+        # Taken first: a write landing while we read makes it stale, so the next access reloads
+        self._marker = self._disk_marker()
+        current = os.path.join(self.directory, "CURRENT")
+        self._generation = int(open(current).read().strip()) if os.path.exists(current) else 0
+        path = self._generation_dir(self._generation)
+        os.makedirs(path, exist_ok=True)
+        self._columns = {name: _Column(os.path.join(path, f"{name}.{SUFFIXES[code]}"), code) for name, code in COLUMNS.items()}
+        # Columns of different lengths mean an append in progress (or interrupted by a crash):
+        # rows count once every column has them. _repair() trims the rest under the write lock.
+        rows = min(column.length for column in self._columns.values())
+        for column in self._columns.values():
+            column.length = rows
+        self._strings_path = os.path.join(path, "strings.txt")
+        self._strings: List[str] = []
+        # Bytes of complete lines; anything after them is an interrupted append
+        self._strings_bytes = 0
+        if os.path.exists(self._strings_path):
+            with open(self._strings_path, "rb") as f:
+                data = f.read()
+            complete = data[:data.rfind(b"\n") + 1]
+            self._strings = [json.loads(line) for line in complete.decode("utf-8").splitlines()]
+            self._strings_bytes = len(complete)
+        self._string_ids = {value: index for index, value in enumerate(self._strings)}
+        self._strings_file = open(self._strings_path, "a", encoding="utf-8")
+        self._state_path = os.path.join(path, "state.json")
+        self._state: Dict[str, Any] = {"format": ARCHIVE_FORMAT, "sync_tokens": {}}
+        if os.path.exists(self._state_path):
+            with open(self._state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("format") == ARCHIVE_FORMAT:
+                self._state = state
+            else:
+                # Older layout: no rows count and, without sync tokens, the next refresh refills everything
+                logger.info(f"Event archive {self.directory} has an old layout; it will be rebuilt on the next sync")
+                rows = 0
+                for column in self._columns.values():
+                    column.length = 0
+        self._keys: Dict[Tuple[int, int], int] = {}
+        self._deleted = 0
+        calendars, event_ids, flags = (self._columns[name].view() for name in ("calendar", "event_id", "flags"))
+        for row in range(rows):
+            if flags[row] & DELETED:
+                self._deleted += 1
+            else:
+                self._keys[(calendars[row], event_ids[row])] = row
+        # Strings used as a summary, location or description: what text matching scans (event ids are interned too)
+        self._text_ids = set().union(*(self._columns[name].view() for name in TEXT_COLUMNS))
+        self._indexes: Dict[int, _CalendarIndex] = {}
+
+    def _disk_marker(self) -> int:
+        """Write sequence number; every process bumps it after appending, deleting or compacting."""
+        self._lock_file.seek(0)
+        return int(self._lock_file.read(20) or 0)
+
+    def _catch_up(self) -> None:
+        """Reload if another process changed the archive since we last looked."""
+        if self._disk_marker() != self._marker:
+            self._close_files()
+            self._load()
+
+    def _repair(self) -> None:
+        """Drop what an interrupted append left past the last complete row or string."""
+        for column in self._columns.values():
+            if os.path.getsize(column.path) != column.length * column.itemsize:
+                column.truncate(column.length)
+        if os.path.getsize(self._strings_path) != self._strings_bytes:
+            with open(self._strings_path, "r+b") as f:
+                f.truncate(self._strings_bytes)
+
+    @contextmanager
+    def _exclusive(self):
+        """Cross-process write lock; the in-memory indexes are brought up to date first."""
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            self._catch_up()
+            self._repair()
+            try:
+                yield
+            except BaseException:
+                # Our indexes may be ahead of the files: reload on next use
+                self._marker = -1
+                raise
+            self._marker += 1
+            self._lock_file.seek(0)
+            self._lock_file.write(b"%020d" % self._marker)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _intern_all(self, values: Iterable[str]) -> List[int]:
+        ids, new = [], []
+        for value in values:
+            index = self._string_ids.get(value)
+            if index is None:
+                index = self._string_ids[value] = len(self._strings)
+                self._strings.append(value)
+                new.append(value)
+            ids.append(index)
+        if new:
+            text = "".join(json.dumps(value, ensure_ascii=False) + "\n" for value in new)
+            self._strings_file.write(text)
+            self._strings_file.flush()
+            self._strings_bytes += len(text.encode("utf-8"))
+        return ids
+
+    def _save_state(self) -> None:
+        tmp = self._state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        os.replace(tmp, self._state_path)
+
+    def __len__(self) -> int:
+        """Live (not deleted) rows."""
+        return len(self._keys)
+
+    def _close_files(self) -> None:
+        for column in self._columns.values():
+            column.close()
+        self._strings_file.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            self._lock_file.close()
+
+    # ---- writes ----
+
+    def apply(self, calendar_id: str, items: List[dict], full: bool = False, sync_token: Optional[str] = None) -> int:
+        """Apply the result of an events.list sync: upsert events, delete 'cancelled' ones and, for a
+        full sync, every archived event of the calendar that is missing from `items`. Returns rows written."""
+        with self._lock, self._exclusive():
+            calendar = self._intern_all([calendar_id])[0]
+            flags_column = self._columns["flags"]
+            seen = set()
+            new_rows: Dict[str, List[int]] = {name: [] for name in COLUMNS}
+            pending: Dict[Tuple[int, int], int] = {}
+            for item in items:
+                event_id = self._intern_all([item["id"]])[0]
+                key = (calendar, event_id)
+                seen.add(event_id)
+                row = self._row_values(item, calendar, event_id)
+                previous = self._keys.get(key)
+                if previous is not None and (row is None or not self._same(previous, row)):
+                    flags_column.set(previous, flags_column.view()[previous] | DELETED)
+                    del self._keys[key]
+                    self._deleted += 1
+                elif previous is not None:
+                    continue
+                if row is None:
+                    if key in pending:
+                        new_rows["flags"][pending.pop(key)] |= DELETED
+                    continue
+                if key in pending:
+                    # The same event twice in one batch: the later item wins
+                    for name in COLUMNS:
+                        new_rows[name][pending[key]] = row[name]
+                    continue
+                pending[key] = len(new_rows["start"])
+                for name in COLUMNS:
+                    new_rows[name].append(row[name])
+            if full:
+                for (other_calendar, event_id), row in list(self._keys.items()):
+                    if other_calendar == calendar and event_id not in seen:
+                        flags_column.set(row, flags_column.view()[row] | DELETED)
+                        del self._keys[(other_calendar, event_id)]
+                        self._deleted += 1
+            base = self._columns["start"].length
+            if new_rows["start"]:
+                # flags last: a row only counts once every column has it
+                for name, code in COLUMNS.items():
+                    self._columns[name].append(array(code, new_rows[name]))
+                for key, offset in pending.items():
+                    self._keys[key] = base + offset
+                self._text_ids.update(*(new_rows[name] for name in TEXT_COLUMNS))
+            if sync_token:
+                self._state["sync_tokens"][calendar_id] = sync_token
+                self._save_state()
+            self._indexes.pop(calendar, None)
+            self._synced_at[calendar_id] = time.monotonic()
+            if self._deleted > max(len(self._keys), COMPACT_MIN_DELETED):
+                self._compact()
+            return len(new_rows["start"])
+
+    def _row_values(self, item: dict, calendar: int, event_id: int) -> Optional[Dict[str, int]]:
+        if item.get("status") == "cancelled" or not item.get("start") or not item.get("end"):
+            return None
+        summary, location, description = self._intern_all([item.get(name) or "" for name in TEXT_COLUMNS])
+        return {
+            "start": int(_epoch(item["start"])),
+            "end": int(_epoch(item["end"])),
+            "calendar": calendar,
+            "event_id": event_id,
+            "summary": summary,
+            "location": location,
+            "description": description,
+            "flags": 0 if item["start"].get("dateTime") else ALL_DAY,
+        }
+
+    def _same(self, row: int, values: Dict[str, int]) -> bool:
+        return all(self._columns[name].view()[row] == value for name, value in values.items())
+
+    def compact(self) -> None:
+        """Rewrite the live rows (and the strings they use) as a new generation and drop the old one."""
+        with self._lock, self._exclusive():
+            self._compact()
+
+    def _compact(self) -> None:
+        views = {name: column.view() for name, column in self._columns.items()}
+        live = sorted(self._keys.values(), key=views["start"].__getitem__)
+        strings = {"": 0}
+        remapped = {name: array(code) for name, code in COLUMNS.items()}
+        for row in live:
+            for name in COLUMNS:
+                value = views[name][row]
+                if name in STRING_COLUMNS:
+                    value = strings.setdefault(self._strings[value], len(strings))
+                remapped[name].append(value)
+        generation = self._generation + 1
+        path = self._generation_dir(generation)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        for name, code in COLUMNS.items():
+            with open(os.path.join(path, f"{name}.{SUFFIXES[code]}"), "wb") as f:
+                f.write(remapped[name].tobytes())
+        with open(os.path.join(path, "strings.txt"), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(value, ensure_ascii=False) + "\n" for value in strings))
+        with open(os.path.join(path, "state.json"), "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        del views
+        old = self._generation_dir(self._generation)
+        self._close_files()
+        tmp = os.path.join(self.directory, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp, os.path.join(self.directory, "CURRENT"))
+        self._load()
+        shutil.rmtree(old, ignore_errors=True)
+        logger.info(f"Compacted event archive {self.directory}: {len(live)} live rows")
+
+    # ---- sync ----
+
+    def invalidate(self, calendar_id: str) -> None:
+        """Mark a calendar as changed (e.g. after a write through this client); the next refresh syncs it."""
+        self._stale.add(calendar_id)
+
+    def sync(self, api, calendar_id: str) -> int:
+        """Fetch changes since the stored sync token (everything on the first call) and apply them."""
+        with self._sync_lock:
+            self._stale.discard(calendar_id)
+            token = self._state["sync_tokens"].get(calendar_id)
+            kind = "incremental" if token else "full"
+            try:
+                with span("archive", f"sync.{kind}", calendar_id=calendar_id):
+                    items, sync_token = api.list_event_changes(calendar_id, token)
+            except Exception as e:
+                if token is None or _http_status(e) != 410:
+                    self._stale.add(calendar_id)
+                    raise
+                kind = "full"
+                with span("archive", f"sync.{kind}", calendar_id=calendar_id):
+                    items, sync_token = api.list_event_changes(calendar_id)
+            written = self.apply(calendar_id, items, full=kind == "full", sync_token=sync_token)
+            registry.inc(SYNC_METRIC, {"kind": kind})
+            return written
+
+    def covers(self, time_min: Optional[str], time_max: Optional[str]) -> bool:
+        """Whether a range is long enough to be answered from the archive: open-ended or at least
+        min_range_days. A day or a week is cheaper to list than a first full-history sync."""
+        low, high = _bound(time_min), _bound(time_max)
+        return low is None or high is None or high - low >= self.min_range_days * 86400
+
+    def refresh(self, api, calendar_id: str) -> None:
+        """Sync a calendar unless it was synced within max_age_seconds and nothing marked it stale."""
+        synced_at = self._synced_at.get(calendar_id)
+        if calendar_id in self._stale or synced_at is None or time.monotonic() - synced_at > self.max_age_seconds:
+            self.sync(api, calendar_id)
+
+    # ---- queries ----
+
+    def _index(self, calendar: int) -> _CalendarIndex:
+        index = self._indexes.get(calendar)
+        if index is None:
+            starts_view, ends_view = self._columns["start"].view(), self._columns["end"].view()
+            rows = array("I", sorted((row for (cal, _), row in self._keys.items() if cal == calendar), key=starts_view.__getitem__))
+            starts = array("q", (starts_view[row] for row in rows))
+            max_duration = max((ends_view[row] - starts_view[row] for row in rows), default=0)
+            index = self._indexes[calendar] = _CalendarIndex(rows, starts, max_duration)
+        return index
+
+    def _rows(self, calendar_id: str, time_min: Optional[str], time_max: Optional[str]) -> List[int]:
+        """Live rows of a calendar overlapping [time_min, time_max), ordered by start."""
+        calendar = self._string_ids.get(calendar_id)
+        if calendar is None:
+            return []
+        index = self._index(calendar)
+        low, high = _bound(time_min), _bound(time_max)
+        first = 0 if low is None else bisect.bisect_left(index.starts, low - index.max_duration)
+        last = len(index.rows) if high is None else bisect.bisect_left(index.starts, high)
+        rows = index.rows[first:last]
+        if low is None:
+            return list(rows)
+        ends = self._columns["end"].view()
+        return [row for row in rows if ends[row] > low]
+
+    def _event(self, row: int, views: Dict[str, memoryview]) -> dict:
+        start, end = views["start"][row], views["end"][row]
+        if views["flags"][row] & ALL_DAY:
+            key, as_text = "date", lambda epoch: datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%d")
+        else:
+            key, as_text = "dateTime", lambda epoch: datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat()
+        return {
+            "id": self._strings[views["event_id"][row]],
+            "summary": self._strings[views["summary"][row]],
+            "location": self._strings[views["location"][row]],
+            "description": self._strings[views["description"][row]],
+            "start": {key: as_text(start)},
+            "end": {key: as_text(end)},
+        }
+
+    def events(self, calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None,
+               match: Optional[Callable[[str], bool]] = None) -> List[dict]:
+        """Archived events overlapping the range, ordered by start, shaped like events.list items
+        (id, summary, location, description, start, end). With `match`, only events whose summary,
+        location or description satisfies it; it is evaluated once per distinct string, not once per event."""
+        with self._lock:
+            self._catch_up()
+            rows = self._rows(calendar_id, time_min, time_max)
+            if match is not None:
+                texts = [self._columns[name].view() for name in TEXT_COLUMNS]
+                strings = self._strings
+                matching = {index for index in self._text_ids if strings[index] and match(strings[index])}
+                rows = [row for row in rows if any(text[row] in matching for text in texts)]
+            views = {name: column.view() for name, column in self._columns.items()}
+            return [self._event(row, views) for row in rows]
+
+    def duration(self, calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None) -> Tuple[int, int]:
+        """(number of events, total seconds) of archived events overlapping the range."""
+        with self._lock:
+            self._catch_up()
+            rows = self._rows(calendar_id, time_min, time_max)
+            starts, ends = self._columns["start"].view(), self._columns["end"].view()
+            return len(rows), sum(ends[row] - starts[row] for row in rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._catch_up()
+            size = sum(os.path.getsize(column.path) for column in self._columns.values()) + os.path.getsize(self._strings_path)
+            return {"live_rows": len(self._keys), "deleted_rows": self._deleted, "strings": len(self._strings),
+                    "bytes": size, "calendars": sorted(self._state["sync_tokens"])}
+
+
+_archives: Dict[str, EventArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(directory: str, max_age_seconds: float = 60, min_range_days: float = DEFAULT_MIN_RANGE_DAYS) -> EventArchive:
+    """The process-wide EventArchive for a directory (clients rebuilt for the same user share it)."""
+    key = os.path.realpath(directory)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = EventArchive(directory, max_age_seconds=max_age_seconds, min_range_days=min_range_days)
+        return archive
+
+
+def main():
+    from utils.calendar_api import GoogleCalendarAPI
+
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("command", choices=["sync", "search", "stats", "compact"])
+    arg_parser.add_argument("text", nargs="?", help="search text (search)")
+    arg_parser.add_argument("--calendar", default="primary")
+    arg_parser.add_argument("--directory", default=os.path.join(DEFAULT_ARCHIVE_DIR, archive_name(None)))
+    args = arg_parser.parse_args()
+
+    archive = open_archive(args.directory)
+    if args.command == "sync":
+        started = time.perf_counter()
+        written = archive.sync(GoogleCalendarAPI(), args.calendar)
+        print(f"Synced {args.calendar}: {written} row(s) written in {time.perf_counter() - started:.1f}s, {len(archive)} live")
+    elif args.command == "search":
+        if not args.text:
+            arg_parser.error("search needs a text")
+        needle = args.text.lower()
+        for event in archive.events(args.calendar, match=lambda value: needle in value.lower()):
+            print(f"{event['start'].get('dateTime') or event['start'].get('date')}  {event['summary']}  {event['location']}")
+    elif args.command == "compact":
+        archive.compact()
+        print(json.dumps(archive.stats(), indent=2))
+    else:
+        print(json.dumps(archive.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
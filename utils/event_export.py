@@ -0,0 +1,321 @@
+"""
+Streaming export of calendar events to ICS, JSONL or Parquet.
+
+Events are read one API page at a time and every page is encoded and handed
+on before the next is fetched, so memory stays flat however many events the
+range holds. Projection (`fields`) trims both what Google sends back and what
+is written.
+
+Fields are event keys, dotted paths into nested values (e.g. 'organizer.email')
+or the derived fields 'start', 'end' (dateTime or date), 'all_day' and
+'calendar_id'.
+
+    python -m utils.event_export --calendar primary --from 2025-01-01 --to 2025-12-31 --format parquet --output 2025.parquet
+    python -m utils.event_export --format jsonl --fields id,summary,start,end --output - > events.jsonl
+"""
+import argparse
+import datetime
+import json
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dateutil.parser import isoparse
+
+from logger import get_logger
+from utils.datetime_utils import dt_handler
+
+logger = get_logger(__name__)
+
+FORMATS = ("ics", "jsonl", "parquet")
+CONTENT_TYPES = {"ics": "text/calendar", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+DEFAULT_TABULAR_FIELDS = ["id", "calendar_id", "summary", "start", "end", "all_day", "location", "description", "status", "recurringEventId", "iCalUID", "updated"]
+DERIVED_FIELDS = {"start": "start", "end": "end", "all_day": "start", "calendar_id": None}
+# Top-level keys of the Calendar v3 Event resource; any other key makes events.list answer 400
+EVENT_FIELDS = frozenset((
+    "kind", "etag", "id", "status", "htmlLink", "created", "updated", "summary", "description", "location", "colorId",
+    "creator", "organizer", "start", "end", "endTimeUnspecified", "recurrence", "recurringEventId", "originalStartTime",
+    "transparency", "visibility", "iCalUID", "sequence", "attendees", "attendeesOmitted", "extendedProperties",
+    "hangoutLink", "conferenceData", "gadget", "anyoneCanAddSelf", "guestsCanInviteOthers", "guestsCanModify",
+    "guestsCanSeeOtherGuests", "privateCopy", "locked", "reminders", "source", "attachments", "eventType",
+    "workingLocationProperties", "outOfOfficeProperties", "focusTimeProperties", "birthdayProperties",
+))
+# Rows buffered per Parquet row group: bounds memory for the columnar format
+PARQUET_ROW_GROUP = 20000
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated projection. Raises ValueError on unknown fields, before any export starts."""
+    if not fields:
+        return None
+    parsed = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in parsed if field not in DERIVED_FIELDS and field.split(".", 1)[0] not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown export field(s): {', '.join(unknown)}")
+    return parsed
+
+
+def api_fields_selector(fields: Optional[List[str]], fmt: str) -> Optional[str]:
+    """Partial-response selector for events.list covering the requested fields (None: whole events)."""
+    if not fields:
+        return None
+    if fmt == "ics":
+        # ICS needs the identity and timing properties whatever the projection
+        fields = fields + ["id", "iCalUID", "start", "end", "updated", "recurringEventId", "originalStartTime", "summary", "status"]
+    top_level = []
+    for field in fields:
+        key = DERIVED_FIELDS[field] if field in DERIVED_FIELDS else field.split(".", 1)[0]
+        if key and key not in top_level:
+            top_level.append(key)
+    return f"items({','.join(top_level)})"
+
+
+def _time_value(value: Optional[Dict[str, str]]) -> Optional[str]:
+    if not value:
+        return None
+    return value.get("dateTime") or value.get("date")
+
+
+def field_value(event: Dict[str, Any], field: str, calendar_id: str) -> Any:
+    if field in ("start", "end"):
+        return _time_value(event.get(field))
+    if field == "all_day":
+        return "date" in (event.get("start") or {})
+    if field == "calendar_id":
+        return calendar_id
+    value: Any = event
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def project(event: Dict[str, Any], fields: List[str], calendar_id: str) -> Dict[str, Any]:
+    return {field: field_value(event, field, calendar_id) for field in fields}
+
+
+# --- ICS -----------------------------------------------------------------------
+
+def _ics_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _ics_fold(line: str) -> str:
+    """Fold a content line at 75 octets (RFC 5545 3.1) without splitting UTF-8 characters."""
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_time(name: str, value: Optional[Dict[str, str]]) -> Optional[str]:
+    if not value:
+        return None
+    if value.get("dateTime"):
+        dt = datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt_handler.london_tz.localize(dt)
+        return f"{name}:{dt.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+    if value.get("date"):
+        return f"{name};VALUE=DATE:{value['date'].replace('-', '')}"
+    return None
+
+
+ICS_OPTIONAL = {"description": "DESCRIPTION", "location": "LOCATION", "status": "STATUS"}
+
+
+def ics_event(event: Dict[str, Any], fields: Optional[List[str]]) -> str:
+    uid = event.get("iCalUID") or f"{event.get('id')}@google.com"
+    stamp = _ics_time("DTSTAMP", {"dateTime": event["updated"]}) if event.get("updated") else \
+        f"DTSTAMP:{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+    lines = ["BEGIN:VEVENT", f"UID:{uid}", stamp, _ics_time("DTSTART", event.get("start")), _ics_time("DTEND", event.get("end"))]
+    # Instances of a series share the series UID and are told apart by RECURRENCE-ID
+    if event.get("recurringEventId"):
+        lines.append(_ics_time("RECURRENCE-ID", event.get("originalStartTime")))
+    lines.append(f"SUMMARY:{_ics_escape(event.get('summary') or '')}")
+    for key, name in ICS_OPTIONAL.items():
+        if event.get(key) and (fields is None or key in fields):
+            value = _ics_escape(str(event[key]))
+            lines.append(f"{name}:{value.upper() if key == 'status' else value}")
+    lines.append("END:VEVENT")
+    return "".join(_ics_fold(line) for line in lines if line)
+
+
+def ics_chunks(pages: Iterable[List[dict]], calendar_id: str, fields: Optional[List[str]], stats: Dict[str, int]) -> Iterator[bytes]:
+    yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//AI Scheduler Agent//Export//EN\r\n"
+           + _ics_fold(f"X-WR-CALNAME:{_ics_escape(calendar_id)}")).encode("utf-8")
+    for page in pages:
+        stats["events"] += len(page)
+        yield "".join(ics_event(event, fields) for event in page).encode("utf-8")
+    yield b"END:VCALENDAR\r\n"
+
+
+# --- JSONL ---------------------------------------------------------------------
+
+def jsonl_chunks(pages: Iterable[List[dict]], calendar_id: str, fields: Optional[List[str]], stats: Dict[str, int]) -> Iterator[bytes]:
+    for page in pages:
+        stats["events"] += len(page)
+        rows = (project(event, fields, calendar_id) if fields else event for event in page)
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+# --- Parquet -------------------------------------------------------------------
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes out in chunks; tell() keeps counting so Parquet offsets stay right."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export requires the 'pyarrow' package (pip install pyarrow).") from e
+    return pa, pq
+
+
+def parquet_chunks(pages: Iterable[List[dict]], calendar_id: str, fields: Optional[List[str]], stats: Dict[str, int],
+                   row_group_size: int = PARQUET_ROW_GROUP) -> Iterator[bytes]:
+    pa, pq = _load_pyarrow()
+    fields = fields or DEFAULT_TABULAR_FIELDS
+    schema = pa.schema([(field, pa.bool_() if field == "all_day" else pa.string()) for field in fields])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    columns: Dict[str, list] = {field: [] for field in fields}
+    buffered = 0
+
+    def flush_row_group():
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    for page in pages:
+        stats["events"] += len(page)
+        for event in page:
+            for field in fields:
+                value = field_value(event, field, calendar_id)
+                if isinstance(value, (dict, list)):
+                    value = json.dumps(value, ensure_ascii=False)
+                elif value is not None and field != "all_day":
+                    value = str(value)
+                columns[field].append(value)
+        buffered += len(page)
+        if buffered >= row_group_size:
+            flush_row_group()
+            buffered = 0
+            yield sink.drain()
+    if buffered:
+        flush_row_group()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"ics": ics_chunks, "jsonl": jsonl_chunks, "parquet": parquet_chunks}
+
+
+def _check_bound(value: str) -> None:
+    # get_date_range falls back to today on input it cannot parse; an export must not
+    if value.lower() in ("today", "tomorrow", "yesterday") or dt_handler.is_valid_date(value):
+        return
+    try:
+        isoparse(value)
+    except ValueError:
+        raise ValueError(f"Invalid date or time: {value!r}. Use YYYY-MM-DD or RFC3339.")
+
+
+def resolve_range(start: Optional[str], end: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Accept dates (YYYY-MM-DD, today/tomorrow/yesterday) or RFC3339 bounds; missing bounds stay open."""
+    for value in (start, end):
+        if value:
+            _check_bound(value)
+    time_min = dt_handler.get_date_range(start)[0] if start else None
+    # Passed as end_date: a day runs to its last instant, an RFC3339 time is kept as given
+    time_max = dt_handler.get_date_range(end, end)[1] if end else None
+    return time_min, time_max
+
+
+def export_events(api, calendar_id: str = "primary", time_min: Optional[str] = None, time_max: Optional[str] = None,
+                  fmt: str = "jsonl", fields: Optional[List[str]] = None, stats: Optional[Dict[str, int]] = None) -> Iterator[bytes]:
+    """Encoded export of a calendar range as a stream of byte chunks, one or more per API page.
+    `stats['events']` counts the events written so far."""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unsupported export format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    stats = stats if stats is not None else {}
+    stats.setdefault("events", 0)
+    pages = api.iter_event_pages(calendar_id, time_min, time_max, fields=api_fields_selector(fields, fmt))
+    return ENCODERS[fmt](pages, calendar_id, fields, stats)
+
+
+def main():
+    from utils.calendar_api import GoogleCalendarAPI
+
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--calendar", default="primary")
+    arg_parser.add_argument("--from", dest="start", help="first day (YYYY-MM-DD) or RFC3339 time; default: open")
+    arg_parser.add_argument("--to", dest="end", help="last day (YYYY-MM-DD) or RFC3339 time; default: open")
+    arg_parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    arg_parser.add_argument("--fields", help="comma-separated projection, e.g. id,summary,start,end")
+    arg_parser.add_argument("--output", required=True, help="file path, or - for stdout")
+    arg_parser.add_argument("--user", help="export a user from the credential store instead of the local token.pickle")
+    args = arg_parser.parse_args()
+
+    if args.user:
+        from utils.config_loader import load_config
+        from utils.credential_store import DEFAULT_STORE_PATH, CredentialStore
+        settings = load_config().get("credentials") or {}
+        creds = CredentialStore(settings.get("store_path", DEFAULT_STORE_PATH)).get(args.user)
+        if creds is None:
+            sys.exit(f"No credentials stored for '{args.user}'")
+        api = GoogleCalendarAPI(credentials=creds)
+    else:
+        api = GoogleCalendarAPI()
+
+    try:
+        time_min, time_max = resolve_range(args.start, args.end)
+        fields = parse_fields(args.fields)
+    except ValueError as e:
+        sys.exit(str(e))
+    stats: Dict[str, int] = {}
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in export_events(api, args.calendar, time_min, time_max, args.format, fields, stats):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"Exported {stats['events']} event(s) from '{args.calendar}' as {args.format}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
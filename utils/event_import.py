@@ -0,0 +1,533 @@
+"""
+Bulk import of ICS or CSV files into a Google Calendar.
+
+The file is parsed as a stream. Every record is validated and its times are
+normalised with dt_handler. Each event gets a stable iCalUID (the ICS UID, a
+CSV uid column, or a hash of its summary, times, description and location), so
+records already in the calendar are skipped and re-running an import never
+duplicates anything. Modified instances of a series (RECURRENCE-ID) are
+imported against the series UID and their originalStartTime, after the series
+themselves. Windows time zone names (Outlook, Exchange) are mapped to IANA
+names. Events are sent through events.import in HTTP batches, with a
+bounded number of batches in flight.
+
+Progress is checkpointed as the position of the last record before which
+everything is done, so an interrupted import resumes from there.
+
+CSV columns (case-insensitive): summary/subject/title, start + end, or
+"Start Date"/"Start Time"/"End Date"/"End Time" (Google Calendar's CSV
+format), plus optional all day, description, location, uid and timezone.
+
+    python -m utils.event_import team.ics --calendar primary
+    python -m utils.event_import export.csv --calendar primary --concurrency 8 --timezone Europe/Paris
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from logger import get_logger
+from utils.datetime_utils import dt_handler
+from utils.windows_timezones import iana_timezone
+
+logger = get_logger(__name__)
+
+FORMATS = ("ics", "csv")
+# Google's recommended maximum number of calls per batch request
+MAX_BATCH_SIZE = 50
+RETRY_STATUSES = (429, 500, 502, 503)
+MAX_ATTEMPTS = 3
+MAX_REPORTED_ERRORS = 20
+UID_DOMAIN = "ai-scheduler-import"
+
+
+def _http_status(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = _http_status(error)
+    # Google reports per-user rate limits as 403 rateLimitExceeded
+    return status in RETRY_STATUSES or (status == 403 and "rate" in str(error).lower())
+
+
+def stable_uid(*parts: Optional[str]) -> str:
+    digest = hashlib.sha1("|".join(part or "" for part in parts).encode("utf-8")).hexdigest()
+    return f"{digest[:24]}@{UID_DOMAIN}"
+
+
+# --- ICS -----------------------------------------------------------------------
+
+ICS_TEXT_ESCAPES = re.compile(r"\\([\\;,nN])")
+ICS_DURATION = re.compile(r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$")
+
+
+def _unfold(stream: TextIO) -> Iterator[str]:
+    """Content lines with RFC 5545 line folding undone."""
+    current = None
+    for raw in stream:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def _parse_content_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """Split 'NAME;PARAM=x;PARAM="y:z":value' into name, params and value."""
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        raise ValueError(f"Malformed content line: {line[:60]!r}")
+    name, *raw_params = head.split(";")
+    params = {}
+    for raw in raw_params:
+        key, _, param_value = raw.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def _ics_text(value: str) -> str:
+    return ICS_TEXT_ESCAPES.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def iter_ics_records(stream: TextIO) -> Iterator[Dict[str, List[Tuple[Dict[str, str], str]]]]:
+    """Yield each VEVENT as {property name: [(params, value), ...]}, ignoring nested VALARMs."""
+    record = None
+    nested = 0
+    for line in _unfold(stream):
+        if not line:
+            continue
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            record, nested = {}, 0
+        elif record is None:
+            continue
+        elif upper == "END:VEVENT":
+            yield record
+            record = None
+        elif upper.startswith("BEGIN:"):
+            nested += 1
+        elif upper.startswith("END:"):
+            nested -= 1
+        elif not nested:
+            name, params, value = _parse_content_line(line)
+            record.setdefault(name, []).append((params, value))
+
+
+def _ics_time(prop: Optional[List[Tuple[Dict[str, str], str]]], tz_name: Optional[str]) -> Optional[Dict[str, str]]:
+    if not prop:
+        return None
+    params, value = prop[0]
+    if params.get("VALUE") == "DATE" or (len(value) == 8 and value.isdigit()):
+        return dt_handler.to_event_time(value, all_day=True)
+    return dt_handler.to_event_time(value, iana_timezone(params.get("TZID")) or tz_name)
+
+
+def _ics_property(name: str, params: Dict[str, str], value: str) -> str:
+    """Content line for a recurrence property, keeping its parameters (EXDATE;TZID=...:...)."""
+    rendered = ""
+    for key, param_value in params.items():
+        if key == "TZID":
+            param_value = iana_timezone(param_value)
+        if any(char in param_value for char in ':;,'):
+            param_value = f'"{param_value}"'
+        rendered += f";{key}={param_value}"
+    return f"{name}{rendered}:{value}"
+
+
+def _ics_duration(value: str) -> datetime.timedelta:
+    match = ICS_DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid DURATION {value!r}")
+    parts = {key: int(number) for key, number in match.groupdict().items() if key != "sign" and number}
+    delta = datetime.timedelta(**parts)
+    return -delta if match.group("sign") == "-" else delta
+
+
+def _shift(time_value: Dict[str, str], delta: datetime.timedelta) -> Dict[str, str]:
+    if "date" in time_value:
+        day = datetime.date.fromisoformat(time_value["date"]) + delta
+        return {"date": day.isoformat()}
+    shifted = datetime.datetime.fromisoformat(time_value["dateTime"]) + delta
+    return dict(time_value, dateTime=shifted.isoformat())
+
+
+def ics_record_to_event(record: Dict[str, List[Tuple[Dict[str, str], str]]], tz_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Calendar API body for one VEVENT, or None for cancelled entries. Raises ValueError if invalid."""
+    def text(name: str) -> Optional[str]:
+        return _ics_text(record[name][0][1]) if name in record else None
+
+    if (text("STATUS") or "").upper() == "CANCELLED":
+        return None
+    start = _ics_time(record.get("DTSTART"), tz_name)
+    if start is None:
+        raise ValueError("VEVENT without DTSTART")
+    end = _ics_time(record.get("DTEND"), tz_name)
+    if end is None:
+        default = datetime.timedelta(days=1) if "date" in start else datetime.timedelta(hours=1)
+        end = _shift(start, _ics_duration(record["DURATION"][0][1]) if "DURATION" in record else default)
+    uid = text("UID") or stable_uid(text("SUMMARY"), start.get("dateTime") or start.get("date"), end.get("dateTime") or end.get("date"),
+                                    text("DESCRIPTION"), text("LOCATION"))
+    event: Dict[str, Any] = {"iCalUID": uid, "summary": text("SUMMARY") or "(No title)", "start": start, "end": end}
+    # A modified instance of a series: it replaces the occurrence the series would produce at RECURRENCE-ID
+    if "RECURRENCE-ID" in record:
+        event["originalStartTime"] = _ics_time(record["RECURRENCE-ID"], tz_name)
+    for name, key in (("DESCRIPTION", "description"), ("LOCATION", "location")):
+        if text(name):
+            event[key] = text(name)
+    recurrence = [_ics_property(name, params, value) for name in ("RRULE", "RDATE", "EXDATE") for params, value in record.get(name, [])]
+    if recurrence:
+        event["recurrence"] = recurrence
+        # Recurring events need a time zone to expand in
+        for key in ("start", "end"):
+            if "dateTime" in event[key] and "timeZone" not in event[key]:
+                event[key]["timeZone"] = tz_name or "UTC"
+    return event
+
+
+# --- CSV -----------------------------------------------------------------------
+
+CSV_ALIASES = {
+    "summary": ("summary", "subject", "title", "name"),
+    "start": ("start", "start_datetime", "start_time_iso", "dtstart"),
+    "end": ("end", "end_datetime", "end_time_iso", "dtend"),
+    "start_date": ("start_date",),
+    "start_time": ("start_time",),
+    "end_date": ("end_date",),
+    "end_time": ("end_time",),
+    "all_day": ("all_day", "all_day_event"),
+    "description": ("description", "notes"),
+    "location": ("location",),
+    "uid": ("uid", "ical_uid", "icaluid"),
+    "timezone": ("timezone", "time_zone", "tz"),
+}
+TRUE_VALUES = ("true", "yes", "1", "y")
+
+
+def _csv_columns(header: List[str]) -> Dict[str, str]:
+    """Map our field names to the file's column names."""
+    normalised = {re.sub(r"[\s\-]+", "_", column.strip().lower()): column for column in header}
+    return {field: normalised[alias] for field, aliases in CSV_ALIASES.items() for alias in aliases if alias in normalised}
+
+
+def csv_row_to_event(row: Dict[str, str], columns: Dict[str, str], tz_name: Optional[str]) -> Dict[str, Any]:
+    def get(field: str) -> str:
+        return (row.get(columns[field]) or "").strip() if field in columns else ""
+
+    all_day = get("all_day").lower() in TRUE_VALUES
+    tz = iana_timezone(get("timezone")) or tz_name
+    start_value = get("start") or " ".join(part for part in (get("start_date"), "" if all_day else get("start_time")) if part)
+    end_value = get("end") or " ".join(part for part in (get("end_date") or get("start_date"), "" if all_day else get("end_time")) if part)
+    if not start_value:
+        raise ValueError("row without a start")
+    start = dt_handler.to_event_time(start_value, tz, all_day=all_day)
+    if end_value and (get("end") or get("end_time") or all_day):
+        end = dt_handler.to_event_time(end_value, tz, all_day=all_day)
+    else:
+        end = _shift(start, datetime.timedelta(days=1) if "date" in start else datetime.timedelta(hours=1))
+    if all_day and end == start:
+        # All-day end dates are exclusive in the Calendar API
+        end = _shift(start, datetime.timedelta(days=1))
+    summary = get("summary") or "(No title)"
+    event: Dict[str, Any] = {
+        "iCalUID": get("uid") or stable_uid(summary, start.get("dateTime") or start.get("date"), end.get("dateTime") or end.get("date"),
+                                            get("description"), get("location")),
+        "summary": summary,
+        "start": start,
+        "end": end,
+    }
+    for field in ("description", "location"):
+        if get(field):
+            event[field] = get(field)
+    return event
+
+
+# --- pipeline ------------------------------------------------------------------
+
+def _event_bound(value: Dict[str, str]) -> datetime.datetime:
+    if "date" in value:
+        return datetime.datetime.fromisoformat(value["date"]).replace(tzinfo=datetime.timezone.utc)
+    return datetime.datetime.fromisoformat(value["dateTime"])
+
+
+def iter_events(stream: TextIO, fmt: str, tz_name: Optional[str] = None) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """(event body, None) or (None, error) per source record, in file order; (None, None) for skipped records."""
+    if fmt == "ics":
+        records = iter_ics_records(stream)
+        convert = lambda record: ics_record_to_event(record, tz_name)
+    elif fmt == "csv":
+        reader = csv.DictReader(stream)
+        columns = _csv_columns(reader.fieldnames or [])
+        if "start" not in columns and "start_date" not in columns:
+            raise ValueError(f"CSV needs a start or 'Start Date' column, found: {reader.fieldnames}")
+        records = reader
+        convert = lambda row: csv_row_to_event(row, columns, tz_name)
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    for record in records:
+        try:
+            event = convert(record)
+            if event is not None and _event_bound(event["end"]) < _event_bound(event["start"]):
+                raise ValueError("end is before start")
+            yield event, None
+        except ValueError as e:
+            yield None, str(e)
+
+
+class ImportReport:
+    """Counters and throughput of one import run."""
+
+    def __init__(self, resumed_from: int = 0):
+        self.resumed_from = resumed_from
+        self.records = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[str] = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, message: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "resumed_from": self.resumed_from,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "batches": self.batches,
+            "seconds": round(elapsed, 3),
+            "records_per_s": round(self.records / elapsed, 1) if elapsed else 0.0,
+            "imported_per_s": round(self.imported / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+    def summary(self) -> str:
+        report = self.to_dict()
+        return (f"{report['records']} records in {report['seconds']:.1f}s ({report['records_per_s']:.0f}/s): "
+                f"{report['imported']} imported, {report['duplicates']} already present, "
+                f"{report['invalid']} invalid, {report['failed']} failed, {report['batches']} batch requests")
+
+
+def event_key(event: Dict[str, Any]) -> str:
+    """Identity of an imported event: its iCalUID, plus the original start for a modified instance."""
+    original = event.get("originalStartTime")
+    if not original:
+        return event["iCalUID"]
+    return f"{event['iCalUID']}@{_event_bound(original).astimezone(datetime.timezone.utc).isoformat()}"
+
+
+def existing_keys(api, calendar_id: str) -> Set[str]:
+    """event_key of everything already in the calendar (series counted once), fetched with a minimal projection."""
+    keys: Set[str] = set()
+    for page in api.iter_event_pages(calendar_id, fields="items(iCalUID,originalStartTime)", single_events=False):
+        keys.update(event_key(event) for event in page if event.get("iCalUID"))
+    return keys
+
+
+def _import_batch(api, calendar_id: str, batch: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, Optional[Exception]]]:
+    """Import one batch, retrying rate-limited and transient failures with backoff."""
+    pending = batch
+    outcome: List[Tuple[int, Optional[Exception]]] = []
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(2 ** attempt * 0.5)
+        results = api.import_events_batch(calendar_id, [event for _, event in pending])
+        retry = []
+        for (index, event), (_, error) in zip(pending, results):
+            if error is not None and _is_retryable(error) and attempt < MAX_ATTEMPTS - 1:
+                retry.append((index, event))
+            else:
+                outcome.append((index, error))
+        if not retry:
+            break
+        pending = retry
+    return outcome
+
+
+def import_events(api, stream: TextIO, fmt: str, calendar_id: str = "primary", tz_name: Optional[str] = None,
+                  batch_size: int = MAX_BATCH_SIZE, concurrency: int = 4, checkpoint: Optional[Dict[str, Any]] = None,
+                  on_checkpoint: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  check_cancelled: Optional[Callable[[], None]] = None) -> ImportReport:
+    """Import every record of `stream` into `calendar_id`. Records before checkpoint['position'] are skipped;
+    on_checkpoint receives the new checkpoint after each finished batch. check_cancelled may raise to stop,
+    in which case in-flight batches are finished and checkpointed first. Modified instances of a series
+    are held back until every series has been imported."""
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    resume_at = int((checkpoint or {}).get("position", 0))
+    report = ImportReport(resumed_from=resume_at)
+    known = existing_keys(api, calendar_id)
+    in_flight: Dict[Future, Tuple[int, List[Tuple[int, Dict[str, Any]]]]] = {}
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    instances: List[Tuple[int, Dict[str, Any]]] = []
+    position = resume_at
+
+    def save_checkpoint():
+        # Everything before the first unfinished record is done
+        starts = [first for first, _ in in_flight.values()] + ([batch[0][0]] if batch else []) + [index for index, _ in instances[:1]]
+        if on_checkpoint is not None:
+            on_checkpoint({"position": min(starts + [position]), "calendar_id": calendar_id, "report": report.to_dict()})
+
+    def collect(done) -> None:
+        for future in done:
+            _, sent = in_flight.pop(future)
+            events = dict(sent)
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(index, e) for index, _ in sent]
+            for index, error in results:
+                if error is None:
+                    report.imported += 1
+                elif _http_status(error) == 409:
+                    report.duplicates += 1
+                else:
+                    report.failed += 1
+                    report.error(f"record {index + 1} ({events[index].get('summary')!r}): {error}")
+        save_checkpoint()
+
+    def submit() -> None:
+        nonlocal batch
+        if len(in_flight) >= concurrency:
+            collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        report.batches += 1
+        in_flight[executor.submit(_import_batch, api, calendar_id, batch)] = (batch[0][0], batch)
+        batch = []
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="import")
+    try:
+        for index, (event, error) in enumerate(iter_events(stream, fmt, tz_name)):
+            if index < resume_at:
+                continue
+            if check_cancelled is not None:
+                check_cancelled()
+            report.records += 1
+            position = index + 1
+            if error is not None:
+                report.invalid += 1
+                report.error(f"record {index + 1}: {error}")
+                continue
+            if event is None:
+                continue
+            key = event_key(event)
+            if key in known:
+                report.duplicates += 1
+                continue
+            known.add(key)
+            if "originalStartTime" in event:
+                instances.append((index, event))
+                continue
+            batch.append((index, event))
+            if len(batch) >= batch_size:
+                submit()
+        if batch:
+            submit()
+        if instances:
+            # The series must exist before its instances can be modified
+            while in_flight:
+                collect(wait(in_flight).done)
+            for start in range(0, len(instances), batch_size):
+                batch = instances[start:start + batch_size]
+                submit()
+            instances = []
+    finally:
+        # Let in-flight batches finish so the checkpoint covers them, even when stopping early
+        while in_flight:
+            collect(wait(in_flight).done)
+        executor.shutdown(wait=True)
+        report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension in ("ics", "ical", "ifb"):
+        return "ics"
+    if extension in ("csv", "tsv"):
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass --format ics or csv")
+
+
+def import_file(api, path: str, calendar_id: str = "primary", fmt: Optional[str] = None, **kwargs) -> ImportReport:
+    with open(path, "r", encoding="utf-8-sig", newline="") as stream:
+        return import_events(api, stream, fmt or detect_format(path), calendar_id, **kwargs)
+
+
+def main():
+    from utils.calendar_api import GoogleCalendarAPI
+
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--calendar", default="primary")
+    arg_parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    arg_parser.add_argument("--timezone", help="time zone for times without one (default Europe/London)")
+    arg_parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE)
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="batch requests in flight")
+    arg_parser.add_argument("--checkpoint", help="checkpoint file (default: <path>.checkpoint.json)")
+    arg_parser.add_argument("--user", help="import for a user from the credential store instead of the local token.pickle")
+    args = arg_parser.parse_args()
+
+    if args.user:
+        from utils.config_loader import load_config
+        from utils.credential_store import DEFAULT_STORE_PATH, CredentialStore
+        settings = load_config().get("credentials") or {}
+        creds = CredentialStore(settings.get("store_path", DEFAULT_STORE_PATH)).get(args.user)
+        if creds is None:
+            sys.exit(f"No credentials stored for '{args.user}'")
+        api = GoogleCalendarAPI(credentials=creds)
+    else:
+        api = GoogleCalendarAPI()
+
+    checkpoint_path = args.checkpoint or f"{args.path}.checkpoint.json"
+    checkpoint = None
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("calendar_id") != args.calendar:
+            checkpoint = None
+        else:
+            print(f"Resuming from record {checkpoint['position'] + 1} ({checkpoint_path})", file=sys.stderr)
+
+    def save(state: Dict[str, Any]) -> None:
+        with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    report = import_file(api, args.path, args.calendar, args.format, tz_name=args.timezone, batch_size=args.batch_size,
+                         concurrency=args.concurrency, checkpoint=checkpoint, on_checkpoint=save)
+    print(report.summary())
+    for error in report.errors:
+        print(f"  {error}")
+    if report.failed:
+        print("Run the import again to retry the failed records; everything already imported is skipped.", file=sys.stderr)
+    # The run is complete: a rerun starts from the first record, so failed records are retried
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+if __name__ == "__main__":
+    main()
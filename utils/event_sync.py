@@ -0,0 +1,372 @@
+"""
+Push-invalidated event cache for Google Calendar.
+
+- EventCache: per-client copy of the (expanded) events of watched calendars,
+  filled by one full sync and then kept current with incremental syncs
+  (syncToken), so reads do not hit the API.
+- WatchManager: opens `events().watch` channels that point Google at our
+  webhook, turns each notification into an incremental sync of just that
+  calendar, and renews channels before they expire.
+
+Only calendars with an open channel are served from the cache; everything else
+goes straight to the API as before. Test locally with benchmarks/fake_push.py.
+"""
+import datetime
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+from utils.tracing import registry, span
+
+logger = get_logger(__name__)
+
+DEFAULT_CHANNELS_PATH = "data/channels.db"
+NOTIFICATIONS_METRIC = "scheduler_push_notifications_total"
+SYNC_METRIC = "scheduler_calendar_syncs_total"
+RENEWAL_LEASE = "push.renewal"
+
+
+def _epoch(value: Dict[str, str]) -> float:
+    """Epoch seconds of an event start/end ({'dateTime': ...} or all-day {'date': ...}, taken as UTC)."""
+    if value.get("dateTime"):
+        dt = datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    else:
+        dt = datetime.datetime.strptime(value["date"], "%Y-%m-%d")
+    return (dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone.utc)).timestamp()
+
+
+def _bound(value: Optional[str]) -> Optional[float]:
+    return _epoch({"dateTime": value}) if value else None
+
+
+def _http_status(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+
+
+class _CalendarSnapshot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.sync_token: Optional[str] = None
+        self.stale = True
+        # Shared version this copy was synced at (multi-worker deployments)
+        self.version = 0
+        # (start, end, event) sorted by start, rebuilt after a sync that changed something
+        self._ordered: Optional[List[Tuple[float, float, Dict[str, Any]]]] = None
+
+    def ordered(self) -> List[Tuple[float, float, Dict[str, Any]]]:
+        if self._ordered is None:
+            self._ordered = sorted(
+                ((_epoch(e["start"]), _epoch(e["end"]), e) for e in self.events.values() if e.get("start") and e.get("end")),
+                key=lambda item: item[0],
+            )
+        return self._ordered
+
+
+class EventCache:
+    """Events of watched calendars for one Calendar client. Returned event dicts are shared: treat them as read-only.
+
+    With `shared` (a SharedState) and a per-user `scope`, watched calendars and invalidations are
+    visible to every worker process: each keeps its own copy and resyncs when the shared version moves."""
+
+    def __init__(self, on_sync: Optional[Callable[..., Any]] = None, shared=None, scope: str = "local"):
+        self._lock = threading.Lock()
+        self._calendars: Dict[str, _CalendarSnapshot] = {}
+        # Called as on_sync(calendar_id, items, full=..., sync_token=...) after every sync (EventArchive.apply)
+        self.on_sync = on_sync
+        self.shared = shared
+        self.scope = scope
+
+    def _shared_key(self, kind: str, calendar_id: str) -> str:
+        return f"{kind}:{self.scope}:{calendar_id}"
+
+    def watch(self, calendar_id: str) -> None:
+        """Start serving `calendar_id` from the cache (a channel now reports its changes)."""
+        with self._lock:
+            self._calendars.setdefault(calendar_id, _CalendarSnapshot())
+        if self.shared is not None:
+            self.shared.set(self._shared_key("watch", calendar_id), True)
+
+    def unwatch(self, calendar_id: str) -> None:
+        with self._lock:
+            self._calendars.pop(calendar_id, None)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key("watch", calendar_id))
+
+    def _snapshot(self, calendar_id: str) -> Optional[_CalendarSnapshot]:
+        snapshot = self._calendars.get(calendar_id)
+        if snapshot is None and self.shared is not None and self.shared.get(self._shared_key("watch", calendar_id)):
+            # Watched through another worker
+            with self._lock:
+                snapshot = self._calendars.setdefault(calendar_id, _CalendarSnapshot())
+        return snapshot
+
+    def is_watched(self, calendar_id: str) -> bool:
+        return self._snapshot(calendar_id) is not None
+
+    def invalidate(self, calendar_id: str) -> None:
+        """Mark a calendar as changed; the next read (or a background refresh) syncs it."""
+        snapshot = self._snapshot(calendar_id)
+        if snapshot is not None:
+            snapshot.stale = True
+            if self.shared is not None:
+                self.shared.bump(self._shared_key("events", calendar_id))
+
+    def _current_version(self, calendar_id: str, snapshot: _CalendarSnapshot) -> int:
+        """The shared version of a calendar; marks the snapshot stale if another worker changed it."""
+        if self.shared is None:
+            return 0
+        version = self.shared.version(self._shared_key("events", calendar_id))
+        if version != snapshot.version:
+            snapshot.stale = True
+        return version
+
+    def refresh(self, api, calendar_id: str) -> bool:
+        """Bring a watched calendar up to date if it is stale. Returns False if it is not watched."""
+        snapshot = self._snapshot(calendar_id)
+        if snapshot is None:
+            return False
+        with snapshot.lock:
+            version = self._current_version(calendar_id, snapshot)
+            if snapshot.stale:
+                self._sync(api, calendar_id, snapshot)
+                snapshot.version = version
+        return True
+
+    def get_events(self, api, calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None) -> Optional[List[dict]]:
+        """Events overlapping [time_min, time_max) ordered by start, like events.list(singleEvents=True,
+        orderBy='startTime'). None if the calendar is not watched."""
+        snapshot = self._snapshot(calendar_id)
+        if snapshot is None:
+            return None
+        low, high = _bound(time_min), _bound(time_max)
+        with snapshot.lock:
+            version = self._current_version(calendar_id, snapshot)
+            if snapshot.stale:
+                self._sync(api, calendar_id, snapshot)
+                snapshot.version = version
+            events = []
+            for start, end, event in snapshot.ordered():
+                if high is not None and start >= high:
+                    break
+                if low is not None and end <= low:
+                    continue
+                events.append(event)
+        return events
+
+    def _sync(self, api, calendar_id: str, snapshot: _CalendarSnapshot) -> None:
+        # Clear the flag first: a notification arriving mid-sync marks it stale again
+        snapshot.stale = False
+        kind = "incremental" if snapshot.sync_token else "full"
+        try:
+            with span("calendar", f"sync.{kind}", calendar_id=calendar_id):
+                items, sync_token = api.list_event_changes(calendar_id, snapshot.sync_token)
+        except Exception as e:
+            if snapshot.sync_token is None or _http_status(e) != 410:
+                snapshot.stale = True
+                raise
+            # Sync token expired or invalidated by Google: start over with a full sync
+            kind = "full"
+            snapshot.sync_token = None
+            with span("calendar", f"sync.{kind}", calendar_id=calendar_id):
+                items, sync_token = api.list_event_changes(calendar_id)
+        if kind == "full":
+            snapshot.events = {}
+        for item in items:
+            if item.get("status") == "cancelled":
+                snapshot.events.pop(item["id"], None)
+            else:
+                snapshot.events[item["id"]] = item
+        if items or kind == "full":
+            snapshot._ordered = None
+        snapshot.sync_token = sync_token
+        registry.inc(SYNC_METRIC, {"kind": kind})
+        if self.on_sync is not None:
+            try:
+                self.on_sync(calendar_id, items, full=kind == "full", sync_token=sync_token)
+            except Exception as e:
+                logger.warning(f"Sync listener failed for calendar {calendar_id}: {e}")
+
+
+class ChannelStore:
+    """SQLite table of open watch channels, so they can be renewed and verified after a restart."""
+
+    COLUMNS = ("channel_id", "resource_id", "user_id", "calendar_id", "token", "expiration")
+
+    def __init__(self, path: str = DEFAULT_CHANNELS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channels ("
+            "channel_id TEXT PRIMARY KEY, resource_id TEXT NOT NULL, user_id TEXT, calendar_id TEXT NOT NULL, "
+            "token TEXT NOT NULL, expiration REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _select(self, where: str, args: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM channels WHERE {where}", args).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def get(self, channel_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._select("channel_id = ?", (channel_id,))
+        return rows[0] if rows else None
+
+    def for_calendar(self, user_id: Optional[str], calendar_id: str) -> List[Dict[str, Any]]:
+        return self._select("user_id IS ? AND calendar_id = ?", (user_id, calendar_id))
+
+    def expiring_before(self, epoch: float) -> List[Dict[str, Any]]:
+        return self._select("expiration < ?", (epoch,))
+
+    def put(self, channel: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO channels ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(channel[column] for column in self.COLUMNS),
+            )
+            self._conn.commit()
+
+    def delete(self, channel_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+            self._conn.commit()
+
+
+class WatchManager:
+    """Opens, renews and closes watch channels and applies incoming notifications."""
+
+    def __init__(self, store: ChannelStore, api_resolver: Callable[[Optional[str]], Any], address: Optional[str],
+                 ttl_seconds: float = 604800, renew_margin_seconds: float = 3600, interval_seconds: float = 300, sync_workers: int = 2,
+                 shared=None):
+        self.store = store
+        # Maps a channel's user_id to that user's Calendar client (and so its EventCache)
+        self.api_resolver = api_resolver
+        # Public HTTPS URL of the webhook route; Google only delivers to HTTPS addresses
+        self.address = address
+        self.ttl_seconds = ttl_seconds
+        self.renew_margin_seconds = renew_margin_seconds
+        self.interval_seconds = interval_seconds
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="calendar-sync")
+        # With several worker processes, only the holder of the shared lease renews channels
+        self.shared = shared
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, user_id: Optional[str], calendar_id: str) -> Dict[str, Any]:
+        """Open a channel for a calendar (replacing any existing one) and serve it from the cache."""
+        if not self.address:
+            raise ValueError("No webhook address configured (push.address in config.yaml)")
+        api = self.api_resolver(user_id)
+        previous = self.store.for_calendar(user_id, calendar_id)
+        channel = {
+            "channel_id": uuid.uuid4().hex,
+            "resource_id": "",
+            "user_id": user_id,
+            "calendar_id": calendar_id,
+            "token": secrets.token_urlsafe(24),
+            "expiration": time.time() + self.ttl_seconds,
+        }
+        # Stored before the call: Google confirms a new channel with a "sync" message straight away
+        self.store.put(channel)
+        try:
+            response = api.watch_events(calendar_id, channel["channel_id"], self.address, channel["token"], self.ttl_seconds)
+        except Exception:
+            self.store.delete(channel["channel_id"])
+            raise
+        channel["resource_id"] = response["resourceId"]
+        if response.get("expiration"):
+            channel["expiration"] = int(response["expiration"]) / 1000
+        self.store.put(channel)
+        for old in previous:
+            self._close(api, old)
+        api.event_cache.watch(calendar_id)
+        logger.info(f"Watching calendar '{calendar_id}' for {user_id or 'local user'} (channel {channel['channel_id']})")
+        return channel
+
+    def unwatch(self, user_id: Optional[str], calendar_id: str) -> int:
+        api = self.api_resolver(user_id)
+        channels = self.store.for_calendar(user_id, calendar_id)
+        for channel in channels:
+            self._close(api, channel)
+        api.event_cache.unwatch(calendar_id)
+        return len(channels)
+
+    def _close(self, api, channel: Dict[str, Any]) -> None:
+        try:
+            api.stop_channel(channel["channel_id"], channel["resource_id"])
+        except Exception as e:
+            # Already expired or stopped on Google's side
+            if _http_status(e) != 404:
+                logger.warning(f"Could not stop channel {channel['channel_id']}: {e}")
+        self.store.delete(channel["channel_id"])
+
+    def handle_notification(self, channel_id: str, token: Optional[str], resource_state: str) -> Optional[Dict[str, Any]]:
+        """Apply one push notification. Returns the channel, or None if it is unknown or the token does not match."""
+        channel = self.store.get(channel_id)
+        if channel is None or not hmac.compare_digest(channel["token"], token or ""):
+            registry.inc(NOTIFICATIONS_METRIC, {"state": "rejected"})
+            return None
+        registry.inc(NOTIFICATIONS_METRIC, {"state": resource_state})
+        api = self.api_resolver(channel["user_id"])
+        # Re-attach after a restart or a pool eviction dropped this client's cache
+        api.event_cache.watch(channel["calendar_id"])
+        if resource_state != "sync":
+            api.event_cache.invalidate(channel["calendar_id"])
+            # Sync in the background so the webhook answers Google immediately
+            self._executor.submit(self._refresh, api, channel["calendar_id"])
+        return channel
+
+    def _refresh(self, api, calendar_id: str) -> None:
+        try:
+            api.event_cache.refresh(api, calendar_id)
+        except Exception:
+            logger.exception(f"Incremental sync of calendar '{calendar_id}' failed")
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="channel-renewer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.shared is not None:
+            self.shared.release_lease(RENEWAL_LEASE)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.shared is None or self.shared.acquire_lease(RENEWAL_LEASE, ttl_seconds=self.interval_seconds * 2):
+                    self.renew_due()
+            except Exception:
+                logger.exception("Channel renewal sweep failed")
+            self._stop.wait(self.interval_seconds)
+
+    def renew_due(self) -> int:
+        """Replace every channel expiring within `renew_margin_seconds`. Returns the number renewed."""
+        renewed = 0
+        for channel in self.store.expiring_before(time.time() + self.renew_margin_seconds):
+            try:
+                self.watch(channel["user_id"], channel["calendar_id"])
+                renewed += 1
+            except Exception as e:
+                logger.warning(f"Could not renew channel for calendar '{channel['calendar_id']}': {e}")
+        if renewed:
+            logger.info(f"Renewed {renewed} calendar watch channel(s)")
+        return renewed
@@ -0,0 +1,353 @@
+"""
+Deterministic parser for one-line event descriptions such as
+"Lunch with Bob at 1pm Friday at Cafe Nero" or "Standup 9:30-9:45 next Tue".
+
+A fixed set of precompiled patterns is applied in order. Each match consumes
+its span of the text:
+  explicit dates -> "in <month>" -> relative days / "in N days" -> weekdays
+  ("this"/"next") -> time ranges -> "in N hours" -> durations -> single times
+  -> parts of the day -> location
+Whatever is left becomes the summary.
+
+Conventions:
+- a bare or "this" weekday is its next occurrence, today included;
+- "next <weekday>" is that weekday in the following Monday-started week;
+- numeric dates are day/month (UK);
+- "in <month>" is the 1st of that month (today in the current month);
+- "in N hours/minutes" is a start time relative to now;
+- an hour from 1 to 7 without am/pm ("at 3", "at 3:15") is taken as pm,
+  unless the text says morning; a meal sets the part of the day when none is
+  given ("Dinner at 8" is 20:00, "Breakfast at 7" is 07:00);
+- "on the 31st" is the next month that has a 31st;
+- a time without a date is today if still ahead, else tomorrow;
+- no time at all gives an all-day event.
+
+Only the standard library is used, so parsing takes microseconds.
+"""
+import datetime
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_DURATION = datetime.timedelta(hours=1)
+PART_OF_DAY_HOURS = {"morning": 9, "afternoon": 14, "evening": 18, "tonight": 19, "night": 20}
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+# Replaces consumed spans so later patterns (notably locations) cannot run across them
+GAP = " \x00 "
+
+WEEKDAY_RE = r"(?:mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?)"
+MONTH_RE = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+TIME_RE = r"(?:\d{1,2}(?:[:.]\d{2})?\s*(?:a\.?m\.?|p\.?m\.?)(?!\w)|(?:[01]?\d|2[0-3]):[0-5]\d|noon|midday|midnight)"
+NUMBER_RE = r"(?:\d+(?:\.\d+)?|an?|one|two|three|four|five|six|seven|eight|nine|ten)"
+
+ISO_DATE = re.compile(r"\b(?:on\s+)?(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})\b")
+NUMERIC_DATE = re.compile(r"\b(?:on\s+)?(?P<d>\d{1,2})/(?P<m>\d{1,2})(?:/(?P<y>\d{2,4}))?\b")
+DAY_MONTH = re.compile(rf"\b(?:on\s+)?(?:the\s+)?(?P<d>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<month>{MONTH_RE})\b(?:,?\s+(?P<y>\d{{4}}))?", re.I)
+MONTH_DAY = re.compile(rf"\b(?:on\s+)?(?P<month>{MONTH_RE})\s+(?:the\s+)?(?P<d>\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(?P<y>\d{{4}}))?", re.I)
+ORDINAL_DAY = re.compile(r"\bon\s+the\s+(?P<d>\d{1,2})(?:st|nd|rd|th)\b", re.I)
+RELATIVE_DAY = re.compile(r"\b(?P<rel>(?:the\s+)?day\s+after\s+tomorrow|today|tonight|tomorrow|tmrw|tmr|yesterday)\b", re.I)
+IN_PERIOD = re.compile(rf"\bin\s+(?P<n>{NUMBER_RE})\s+(?P<unit>days?|weeks?|months?)\b", re.I)
+IN_MONTH = re.compile(rf"\b(?:in|during)\s+(?:early\s+)?(?P<month>{MONTH_RE})\b(?:\s+(?P<y>\d{{4}}))?", re.I)
+IN_TIME = re.compile(rf"\bin\s+(?:(?P<half>half\s+an\s+hour)|(?P<n>{NUMBER_RE})\s*(?P<unit>hours?|hrs?|minutes?|mins?))(?!\w)", re.I)
+NEXT_PERIOD = re.compile(r"\b(?P<mod>next|this)\s+(?P<unit>week|month|weekend)\b", re.I)
+WEEKDAY = re.compile(rf"\b(?:on\s+)?(?:(?P<mod>next|this|coming)\s+)?(?P<day>{WEEKDAY_RE})\b(?:\s+(?P<week>next|this)\s+week\b)?", re.I)
+TIME_RANGE = re.compile(
+    rf"\b(?:from\s+|between\s+)?(?:at\s+)?(?P<start>{TIME_RE}|\d{{1,2}}(?:[:.]\d{{2}})?)\s*(?:-|–|to|until|till|and)\s*(?P<end>{TIME_RE}|\d{{1,2}}(?:[:.]\d{{2}})?)(?!\s*(?:hours?|hrs?|h\b|min|days?|weeks?|/|st|nd|rd|th))",
+    re.I,
+)
+DURATION = re.compile(
+    rf"\b(?:for\s+)?(?:(?P<half>half\s+an?\s+hour)|(?![ap]\.?m\b)(?P<n>{NUMBER_RE})\s*(?P<unit>hours?|hrs?|h|minutes?|mins?|m)(?:\s*(?:and\s+)?(?P<extra>\d{{1,2}})\s*(?:minutes?|mins?|m)?)?)(?!\w)",
+    re.I,
+)
+SINGLE_TIME = re.compile(rf"(?:\b(?:at|by)\s+|@\s*|\b)(?P<time>{TIME_RE})", re.I)
+OCLOCK = re.compile(r"\b(?:at\s+)?(?P<h>\d{1,2})\s*o'?clock\b", re.I)
+BARE_HOUR = re.compile(r"\bat\s+(?P<h>\d{1,2})(?:[:.](?P<m>[0-5]\d))?\b(?![%/]|\s*(?:hours?|hrs?|mins?|minutes?|days?|weeks?|people|guests)\b)", re.I)
+# Meals that say which part of the day a bare hour is in
+MEAL_PART = re.compile(r"\b(?:(?P<morning>breakfast|brunch)|(?P<evening>dinner|supper|drinks))\b", re.I)
+PART_OF_DAY = re.compile(r"\b(?:in\s+the\s+|this\s+|tomorrow\s+)?(?P<part>morning|afternoon|evening|tonight|night)\b", re.I)
+LOCATION = re.compile(r"(?:^|\s)(?:at|@|in)\s+(?P<loc>(?:the\s+)?[A-Z][\w'&.\-]*(?:\s+(?:[A-Z0-9&][\w'&.\-]*|of|the|on|de|and))*)")
+COMMON_PLACE = re.compile(r"(?:^|\s)(?:at|in)\s+(?P<loc>(?:the\s+)?(?:office|home|gym|cafe|pub|library|school|work|hospital|clinic|airport|station|park|dentist|doctors?))\b", re.I)
+EXPLICIT_LOCATION = re.compile(r"(?:^|\s)(?:location|loc|where)\s*:\s*(?P<loc>[^,;\x00]+)", re.I)
+DANGLING = re.compile(r"^(?:\s|[,;:.!?\-–]|\b(?:on|at|from|for|in|by|this|next|the|and|until|to)\b)+|(?:\s|[,;:.!?\-–]|\b(?:on|at|from|for|in|by|this|next|the|and|until|to)\b)+$", re.I)
+
+
+def _weekday_index(word: str) -> int:
+    return WEEKDAYS.index(word[:3].lower())
+
+
+def _month_index(word: str) -> int:
+    return MONTHS.index(word[:3].lower()) + 1
+
+
+def _number(word: str) -> float:
+    word = word.lower()
+    return float(NUMBER_WORDS[word]) if word in NUMBER_WORDS else float(word)
+
+
+def _time_of(token: str, meridiem_hint: Optional[str] = None) -> Tuple[int, int, Optional[str]]:
+    """(hour, minute, meridiem) for '1pm', '13:30', '9.15 am', 'noon'; bare numbers use `meridiem_hint`."""
+    token = token.lower().replace(".", ":").replace(" ", "")
+    if token in ("noon", "midday"):
+        return 12, 0, "pm"
+    if token == "midnight":
+        return 0, 0, "am"
+    meridiem = None
+    for suffix, value in (("a:m:", "am"), ("p:m:", "pm"), ("a:m", "am"), ("p:m", "pm"), ("am", "am"), ("pm", "pm")):
+        if token.endswith(suffix):
+            meridiem, token = value, token[: -len(suffix)]
+            break
+    hour_text, _, minute_text = token.partition(":")
+    hour, minute = int(hour_text), int(minute_text or 0)
+    meridiem = meridiem or (meridiem_hint if hour <= 12 else None)
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Invalid time {token!r}")
+    return hour, minute, meridiem
+
+
+class _Text:
+    """Working copy of the input; matched spans are cut out as patterns apply."""
+
+    def __init__(self, text: str):
+        self.value = f" {text} "
+
+    def take(self, pattern: "re.Pattern", count: int = 1) -> List["re.Match"]:
+        matches = []
+        for _ in range(count):
+            match = pattern.search(self.value)
+            if match is None:
+                break
+            matches.append(match)
+            self._cut(match)
+        return matches
+
+    def take_last(self, pattern: "re.Pattern") -> Optional["re.Match"]:
+        match = None
+        for match in pattern.finditer(self.value):
+            pass
+        if match is not None:
+            self._cut(match)
+        return match
+
+    def _cut(self, match: "re.Match") -> None:
+        self.value = self.value[:match.start()] + GAP + self.value[match.end():]
+
+
+def _future_date(day: int, month: int, year: Optional[int], today: datetime.date) -> datetime.date:
+    if year is not None:
+        return datetime.date(year + 2000 if year < 100 else year, month, day)
+    candidate = datetime.date(today.year, month, day)
+    return candidate if candidate >= today else datetime.date(today.year + 1, month, day)
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    for last_day in (day.day, 30, 29, 28):
+        try:
+            return datetime.date(year, month, min(day.day, last_day))
+        except ValueError:
+            continue
+    raise ValueError("unreachable")
+
+
+def _parse_date(text: _Text, today: datetime.date) -> Tuple[Optional[datetime.date], Optional[str], bool]:
+    """The event date, the part of the day 'tonight' implies, and whether the
+    date is a bare weekday that may roll a week forward if its time has passed."""
+    for pattern in (ISO_DATE, DAY_MONTH, MONTH_DAY, NUMERIC_DATE):
+        for match in text.take(pattern):
+            groups = match.groupdict()
+            month = _month_index(groups["month"]) if groups.get("month") else int(groups["m"])
+            year = int(groups["y"]) if groups.get("y") else None
+            try:
+                return _future_date(int(groups["d"]), month, year, today), None, False
+            except ValueError:
+                continue
+    for match in text.take(IN_MONTH):
+        month, year = _month_index(match.group("month")), int(match.group("y")) if match.group("y") else None
+        if year is None and month == today.month:
+            return today, None, False
+        return _future_date(1, month, year, today), None, False
+    for match in text.take(ORDINAL_DAY):
+        day = int(match.group("d"))
+        if not 1 <= day <= 31:
+            continue
+        # This month if the day is still ahead, else the next month that has that day
+        for months in range(12):
+            month_start = _add_months(today.replace(day=1), months)
+            try:
+                candidate = month_start.replace(day=day)
+            except ValueError:
+                continue
+            if candidate >= today:
+                return candidate, None, False
+    for match in text.take(RELATIVE_DAY):
+        rel = match.group("rel").lower()
+        if rel.endswith("day after tomorrow"):
+            return today + datetime.timedelta(days=2), None, False
+        if rel in ("tomorrow", "tmrw", "tmr"):
+            return today + datetime.timedelta(days=1), None, False
+        if rel == "yesterday":
+            return today - datetime.timedelta(days=1), None, False
+        return today, "tonight" if rel == "tonight" else None, False
+    for match in text.take(IN_PERIOD):
+        amount = int(_number(match.group("n")))
+        unit = match.group("unit").lower()
+        if unit.startswith("month"):
+            return _add_months(today, amount), None, False
+        return today + datetime.timedelta(days=amount * (7 if unit.startswith("week") else 1)), None, False
+    for match in text.take(WEEKDAY):
+        target = _weekday_index(match.group("day"))
+        mod = (match.group("mod") or "").lower()
+        if mod == "next" or (match.group("week") or "").lower() == "next":
+            monday_next_week = today + datetime.timedelta(days=7 - today.weekday())
+            return monday_next_week + datetime.timedelta(days=target), None, False
+        return today + datetime.timedelta(days=(target - today.weekday()) % 7), None, mod != "this"
+    for match in text.take(NEXT_PERIOD):
+        unit, mod = match.group("unit").lower(), match.group("mod").lower()
+        if unit == "week":
+            return (today + datetime.timedelta(days=7 - today.weekday())) if mod == "next" else today, None, False
+        if unit == "weekend":
+            saturday = today + datetime.timedelta(days=(5 - today.weekday()) % 7)
+            return saturday + datetime.timedelta(days=7) if mod == "next" and today.weekday() < 5 else saturday, None, False
+        return (_add_months(today.replace(day=1), 1) if mod == "next" else today), None, False
+    return None, None, False
+
+
+def _parse_times(text: _Text) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]], Optional[datetime.timedelta], bool,
+                                       Optional[datetime.timedelta]]:
+    """Start time, end time and duration found in the text, whether the start
+    has no am/pm ('at 8', 'at 3:15') so that the part of the day decides, and
+    the offset from now of a relative start ('in 2 hours')."""
+    start = end = None
+    for match in text.take(TIME_RANGE):
+        start_token, end_token = match.group("start"), match.group("end")
+        # Need at least one side that is clearly a time ('2-4pm', '14:00-15:00'), not '2-4'
+        if not re.search(r"[ap]\.?m|:|noon|midday|midnight", start_token + end_token, re.I):
+            continue
+        end_h, end_m, end_meridiem = _time_of(end_token)
+        start_h, start_m, _ = _time_of(start_token, end_meridiem)
+        # '11-1pm': the start is the morning before
+        if end_meridiem == "pm" and start_h > end_h and start_h >= 12:
+            start_h -= 12
+        start, end = (start_h, start_m), (end_h, end_m)
+    offset = None
+    for match in text.take(IN_TIME):
+        if match.group("half"):
+            offset = datetime.timedelta(minutes=30)
+        else:
+            amount = _number(match.group("n"))
+            offset = datetime.timedelta(minutes=amount * 60 if match.group("unit").lower().startswith("h") else amount)
+    duration = None
+    for match in text.take(DURATION):
+        if match.group("half"):
+            duration = datetime.timedelta(minutes=30)
+            continue
+        unit = match.group("unit").lower()
+        amount = _number(match.group("n"))
+        if unit in ("m",) and not match.group(0).lower().startswith("for"):
+            # '5m' without 'for' is too ambiguous to be a duration
+            continue
+        minutes = amount * 60 if unit.startswith("h") else amount
+        duration = datetime.timedelta(minutes=minutes + int(match.group("extra") or 0))
+    bare = False
+    if start is None:
+        for pattern in (SINGLE_TIME, OCLOCK, BARE_HOUR):
+            matches = text.take(pattern)
+            if not matches:
+                continue
+            groups = matches[0].groupdict()
+            if groups.get("time"):
+                hour, minute, meridiem = _time_of(groups["time"])
+                # '3:15' has no am/pm, '03:15' and '15:15' are 24-hour times
+                bare = meridiem is None and hour < 12 and not groups["time"].startswith("0")
+            else:
+                hour, minute = int(groups["h"]), int(groups.get("m") or 0)
+                if hour > 23:
+                    continue
+                bare = hour < 12
+            start = (hour, minute)
+            break
+    return start, end, duration, bare, offset
+
+
+def _parse_location(text: _Text) -> Optional[str]:
+    for pattern in (EXPLICIT_LOCATION, LOCATION, COMMON_PLACE):
+        matches = text.take(pattern)
+        if matches:
+            return matches[0].group("loc").strip(" ,.")
+    return None
+
+
+def parse_event_text(text: str, now: datetime.datetime) -> Dict[str, Any]:
+    """Parse a one-line event description relative to `now` (an aware datetime).
+
+    Returns summary, location, all_day and start/end (aware datetimes, or dates
+    for all-day events, with an exclusive end), plus has_date/has_time flags.
+    start is None when the text holds no date or time."""
+    working = _Text(text)
+    today = now.date()
+    date, implied_part, may_roll = _parse_date(working, today)
+    start_time, end_time, duration, bare, offset = _parse_times(working)
+    if offset is not None and start_time is None and date is None:
+        moment = (now + offset).astimezone(now.tzinfo)
+        date, start_time = moment.date(), (moment.hour, moment.minute)
+    part = implied_part
+    if start_time is None or bare:
+        # The last one wins: "Date night Saturday evening" is in the evening
+        part_match = working.take_last(PART_OF_DAY)
+        part = part_match.group("part").lower() if part_match else implied_part
+    hint = part
+    if bare and hint is None:
+        meal = MEAL_PART.search(working.value)
+        hint = ("morning" if meal.group("morning") else "evening") if meal else None
+    # Only once the part of the day is known: "at 5 tomorrow morning" stays am
+    if bare and (hint in ("afternoon", "evening", "tonight", "night") or (hint is None and 1 <= start_time[0] <= 7)):
+        # Nobody books 3am by saying "at 3"
+        start_time = (start_time[0] + 12, start_time[1])
+    if part == "tonight" and date is None:
+        date = today
+    if start_time is None and part is not None:
+        start_time = (PART_OF_DAY_HOURS[part], 0)
+    if start_time is None and duration is not None:
+        start_time = (9, 0)
+    location = _parse_location(working)
+    summary = re.sub(r"\s+", " ", working.value.replace("\x00", " ")).strip()
+    summary = DANGLING.sub("", summary).strip() or "New event"
+
+    result: Dict[str, Any] = {"summary": summary, "location": location, "has_date": date is not None, "has_time": start_time is not None}
+    if start_time is None:
+        if date is None:
+            result.update(start=None, end=None, all_day=False)
+        else:
+            result.update(start=date, end=date + datetime.timedelta(days=1), all_day=True)
+        return result
+
+    tz = now.tzinfo
+    if date is None:
+        candidate = now.replace(hour=start_time[0], minute=start_time[1], second=0, microsecond=0)
+        date = today if candidate > now else today + datetime.timedelta(days=1)
+    start = _localize(tz, datetime.datetime.combine(date, datetime.time(*start_time)))
+    if may_roll and date == today and start <= now:
+        # "Wednesday 9am" said on Wednesday at 10am means next week
+        date += datetime.timedelta(days=7)
+        start = _localize(tz, datetime.datetime.combine(date, datetime.time(*start_time)))
+    if end_time is not None:
+        end = _localize(tz, datetime.datetime.combine(date, datetime.time(*end_time)))
+        if end <= start:
+            end += datetime.timedelta(days=1)
+    else:
+        end = start + (duration or DEFAULT_DURATION)
+    result.update(start=start, end=end, all_day=False)
+    return result
+
+
+def _localize(tz, naive: datetime.datetime) -> datetime.datetime:
+    # pytz zones need localize() to pick the right UTC offset (BST vs GMT)
+    if hasattr(tz, "localize"):
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tz)
@@ -0,0 +1,319 @@
+"""
+Local background jobs for long-running bulk calendar operations.
+
+Jobs live in a SQLite table so their status survives restarts, and run on a
+thread pool. A handler receives a JobContext to report progress, save a
+checkpoint and check for cancellation.
+
+Every unfinished job has an owner, the process running it, which keeps a
+heartbeat on it. Several processes can share the table (API workers): a job is
+only resumed by JobManager.resume() once its owner's heartbeat has stopped
+(the process exited or died), and it then continues from its last checkpoint.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import get_logger
+from utils.calendar_pool import use_calendar_api
+from utils.tracing import span
+
+logger = get_logger(__name__)
+
+DEFAULT_JOBS_PATH = "data/jobs.db"
+# A job whose owner has missed this many heartbeats is taken to be orphaned
+HEARTBEAT_MISSES = 3
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_COLUMNS = ("id", "kind", "user_id", "params", "status", "done", "total", "result", "error", "checkpoint", "cancel_requested", "created_at", "updated_at",
+               "owner", "heartbeat")
+JSON_COLUMNS = ("params", "result", "checkpoint")
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled."""
+
+
+class JobStore:
+    """SQLite-backed job table (one connection shared behind a lock)."""
+
+    def __init__(self, path: str = DEFAULT_JOBS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, user_id TEXT, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "done INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT, checkpoint TEXT, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "owner TEXT, heartbeat REAL)"
+        )
+        # Tables created before jobs had owners
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(JOB_COLUMNS, row))
+        for column in JSON_COLUMNS:
+            job[column] = json.loads(job[column]) if job[column] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def create(self, kind: str, params: Dict[str, Any], user_id: Optional[str], owner: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, user_id, params, status, created_at, updated_at, owner, heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, user_id, json.dumps(params), QUEUED, now, now, owner, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list(self, user_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs of one user (user_id None: jobs started in local single-user mode)."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE user_id IS ? ORDER BY created_at DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def heartbeat(self, owner: str) -> None:
+        """Mark every unfinished job of `owner` as still being worked on."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN (?, ?)", (time.time(), owner, QUEUED, RUNNING))
+            self._conn.commit()
+
+    def claim(self, job_id: str, owner: str, stale_after: float) -> bool:
+        """Take over an unfinished job whose owner is gone (no heartbeat for `stale_after` seconds).
+        Atomic, so only one of several processes resuming at once gets it."""
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET owner = ?, heartbeat = ? WHERE id = ? AND status IN (?, ?) "
+                "AND (owner IS NULL OR heartbeat IS NULL OR heartbeat < ?)",
+                (owner, now, job_id, QUEUED, RUNNING, now - stale_after),
+            ).rowcount
+            self._conn.commit()
+        return claimed == 1
+
+    def mark_running(self, job_id: str) -> bool:
+        """Move a queued (or resumed) job to running unless it was cancelled meanwhile.
+        A single conditional UPDATE, so a cancel that lands first always wins."""
+        with self._lock:
+            started = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?) AND NOT cancel_requested",
+                (RUNNING, time.time(), job_id, QUEUED, RUNNING),
+            ).rowcount
+            self._conn.commit()
+        return started == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        for column in JSON_COLUMNS:
+            if column in fields and fields[column] is not None:
+                fields[column] = json.dumps(fields[column])
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", tuple(fields.values()) + (job_id,))
+            self._conn.commit()
+
+
+class JobContext:
+    """Handed to a job handler: progress, checkpoints and cancellation for one job."""
+
+    def __init__(self, manager: "JobManager", job: Dict[str, Any]):
+        self.manager = manager
+        self.job_id = job["id"]
+        self.user_id = job["user_id"]
+        self.checkpoint: Dict[str, Any] = job["checkpoint"] or {}
+        self.done = job["done"] or 0
+        self.total = job["total"]
+        # Calendar client of the user who submitted the job, set before the handler runs
+        self.api: Any = None
+        self._last_persist = time.monotonic()
+        self._last_cancel_poll = time.monotonic()
+
+    def progress(self, done: int, total: Optional[int] = None) -> None:
+        """Report progress. Persisted at most every `persist_interval` seconds; readers see it live."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        self.manager._live[self.job_id] = (self.done, self.total)
+        if time.monotonic() - self._last_persist >= self.manager.persist_interval:
+            self.save_checkpoint(self.checkpoint)
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        """Persist resume state together with the current progress."""
+        self.checkpoint = checkpoint
+        self.manager.store.update(self.job_id, checkpoint=checkpoint, done=self.done, total=self.total)
+        self._last_persist = time.monotonic()
+        self._poll_cancel_requested()
+
+    def _poll_cancel_requested(self) -> None:
+        # A cancel handled by another worker process is only visible in the store
+        self._last_cancel_poll = time.monotonic()
+        if self.manager.store.cancel_requested(self.job_id):
+            self.manager._cancelled.add(self.job_id)
+
+    def check_cancelled(self) -> None:
+        if self.job_id not in self.manager._cancelled and time.monotonic() - self._last_cancel_poll >= self.manager.persist_interval:
+            self._poll_cancel_requested()
+        if self.job_id in self.manager._cancelled:
+            raise JobCancelled()
+
+
+JobHandler = Callable[[JobContext, Dict[str, Any]], Dict[str, Any]]
+
+
+class JobManager:
+    """Runs registered job kinds on a thread pool, tracking them in a JobStore. start() keeps the
+    heartbeat on this process's jobs and picks up jobs orphaned by other processes."""
+
+    def __init__(self, store: JobStore, api_resolver: Callable[[Optional[str]], Any], max_workers: int = 2, persist_interval: float = 1.0,
+                 heartbeat_interval: float = 10.0):
+        self.store = store
+        # Maps a job's user_id to the Calendar client it should act with
+        self.api_resolver = api_resolver
+        self.persist_interval = persist_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._live: Dict[str, tuple] = {}
+        self._cancelled: set = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, params: Dict[str, Any], user_id: Optional[str] = None) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.store.create(kind, params, user_id, owner=self.owner)
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Job {job_id} ({kind}) queued")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job and job_id in self._live and job["status"] == RUNNING:
+            job["done"], job["total"] = self._live[job_id]
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        self._cancelled.add(job_id)
+        if job["status"] == QUEUED:
+            self.store.update(job_id, status=CANCELLED, cancel_requested=1)
+        else:
+            self.store.update(job_id, cancel_requested=1)
+        return self.get(job_id)
+
+    def resume(self) -> int:
+        """Resubmit unfinished jobs whose owner stopped heartbeating (a previous or crashed process).
+        Jobs still running in another live process are left alone. Returns the number taken over."""
+        resumed = 0
+        for job in self.store.unfinished():
+            if job["owner"] == self.owner or not self.store.claim(job["id"], self.owner, self.heartbeat_interval * HEARTBEAT_MISSES):
+                continue
+            resumed += 1
+            if job["cancel_requested"]:
+                self.store.update(job["id"], status=CANCELLED)
+                continue
+            logger.info(f"Resuming job {job['id']} ({job['kind']}) from checkpoint")
+            self._executor.submit(self._run, job["id"])
+        return resumed
+
+    def start(self) -> None:
+        """Resume orphaned jobs now, then keep heartbeating and checking for orphans in the background."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.store.heartbeat(self.owner)
+                resumed = self.resume()
+                if resumed:
+                    logger.info(f"Resumed {resumed} background job(s)")
+            except Exception:
+                logger.exception("Job heartbeat failed")
+            self._stop.wait(self.heartbeat_interval)
+
+    def shutdown(self) -> None:
+        # Running jobs keep their checkpoint; once the heartbeat stops, the next process resumes them
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return
+        if job_id in self._cancelled or job["cancel_requested"]:
+            self.store.update(job_id, status=CANCELLED)
+            return
+        if not self.store.mark_running(job_id):
+            logger.info(f"Job {job_id} was cancelled before it started")
+            return
+        context = JobContext(self, job)
+        try:
+            context.api = self.api_resolver(job["user_id"])
+            with span("job", job["kind"]):
+                with use_calendar_api(context.api, job["user_id"]):
+                    result = self.handlers[job["kind"]](context, job["params"])
+            self.store.update(job_id, status=SUCCEEDED, result=result, done=context.done, total=context.total, checkpoint=context.checkpoint)
+            logger.info(f"Job {job_id} ({job['kind']}) finished")
+        except JobCancelled:
+            self.store.update(job_id, status=CANCELLED, done=context.done, total=context.total, checkpoint=context.checkpoint)
+            logger.info(f"Job {job_id} ({job['kind']}) cancelled")
+        except Exception as e:
+            logger.exception(f"Job {job_id} ({job['kind']}) failed")
+            self.store.update(job_id, status=FAILED, error=str(e), done=context.done, total=context.total, checkpoint=context.checkpoint)
+        finally:
+            self._live.pop(job_id, None)
+            self._cancelled.discard(job_id)
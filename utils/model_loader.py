@@ -3,44 +3,62 @@ from dotenv import load_dotenv
 from typing import Literal, Optional, Any
 from pydantic import BaseModel, Field
 from utils.config_loader import load_config
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+API_KEY_ENV = {
+    "groq": "GROQ_API_KEY",
+    "openai": "OPENAI_API_KEY",
+}
 
 
 class ConfigLoader:
     def __init__(self):
-        print(f"Loaded config.....")
+        logger.debug("Loaded config")
         self.config = load_config()
     
     def __getitem__(self, key):
         return self.config[key]
 
+    def get(self, key, default=None):
+        return self.config.get(key, default)
+
 class ModelLoader(BaseModel):
     model_provider: Literal["groq", "openai"] = "groq"
     config: Optional[ConfigLoader] = Field(default=None, exclude=True)
 
     def model_post_init(self, __context: Any) -> None:
-        self.config = ConfigLoader()
+        if self.config is None:
+            self.config = ConfigLoader()
     
     class Config:
         arbitrary_types_allowed = True
     
-    def load_llm(self):
+    def load_llm(self, model_name: Optional[str] = None, timeout: Optional[float] = None, max_retries: Optional[int] = None):
         """
         Load and return the LLM model.
+        model_name defaults to the provider's entry in config.yaml. timeout/max_retries are
+        passed through to the client so a router can fail over instead of waiting on retries.
         """
-        print("LLM loading...")
-        print(f"Loading model from provider: {self.model_provider}")
+        logger.info(f"Loading model from provider: {self.model_provider}")
+        client_kwargs = {}
+        if timeout is not None:
+            client_kwargs["timeout"] = timeout
+        if max_retries is not None:
+            client_kwargs["max_retries"] = max_retries
+        # Provider SDKs are imported only when that provider is selected: each takes
+        # hundreds of milliseconds to import
         if self.model_provider == "groq":
-            print("Loading LLM from Groq..............")
+            from langchain_groq import ChatGroq
             groq_api_key = os.getenv("GROQ_API_KEY")
-            model_name = self.config["llm"]["groq"]["model_name"]
-            llm=ChatGroq(model=model_name, api_key=groq_api_key)
+            model_name = model_name or self.config["llm"]["groq"]["model_name"]
+            llm=ChatGroq(model=model_name, api_key=groq_api_key, **client_kwargs)
         elif self.model_provider == "openai":
-            print("Loading LLM from OpenAI..............")
+            from langchain_openai import ChatOpenAI
             openai_api_key = os.getenv("OPENAI_API_KEY")
-            model_name = self.config["llm"]["openai"]["model_name"]
-            llm = ChatOpenAI(model_name="o4-mini", api_key=openai_api_key)
+            model_name = model_name or self.config["llm"]["openai"]["model_name"]
+            llm = ChatOpenAI(model_name=model_name, api_key=openai_api_key, **client_kwargs)
         
         return llm
-    
\ No newline at end of file
+    
@@ -0,0 +1,311 @@
+"""
+Model routing and provider failover on top of ModelLoader.
+
+Two tiers are configured in config.yaml under `routing`:
+- fast:   tool selection and intermediate agent steps
+- strong: the step after tool results come back (usually the final answer)
+          and hard cases
+
+Within a tier the candidates are tried in order; on a timeout or rate limit the
+router fails over to the next candidate and puts the failing one in a cooldown.
+Per-model latency, token and cost metrics are tracked and used to demote
+unhealthy or slow models.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import get_logger
+from utils.model_loader import API_KEY_ENV, ConfigLoader, ModelLoader
+from utils.tracing import _format_labels, record_tokens, span
+
+logger = get_logger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+
+# Smoothing factor for the latency moving average
+EWMA_ALPHA = 0.3
+# Number of calls before error rate / latency are trusted for routing
+MIN_SAMPLES = 3
+# Per-candidate router metrics exported on /metrics: name, type, help, snapshot key
+ROUTER_METRICS = (
+    ("scheduler_router_calls_total", "counter", "LLM calls routed to a model, by tier and model.", "calls"),
+    ("scheduler_router_failures_total", "counter", "Failed LLM calls, by tier and model.", "failures"),
+    ("scheduler_router_rate_limited_total", "counter", "LLM calls rejected with a rate limit.", "rate_limited"),
+    ("scheduler_router_timeouts_total", "counter", "LLM calls that timed out or hit a server error.", "timeouts"),
+    ("scheduler_router_latency_ewma_seconds", "gauge", "Moving average of LLM call latency used for routing.", "ewma_latency_s"),
+    ("scheduler_router_cost_usd_total", "counter", "Estimated LLM spend in USD (routing.tiers costs).", "cost_usd"),
+    ("scheduler_router_cooling_down", "gauge", "1 while a model is skipped after a rate limit or timeout.", "cooling_down"),
+)
+
+
+def validate_routing(config: Any) -> None:
+    """Fail fast on routing settings that name a provider ModelLoader cannot load."""
+    routing = config.get("routing") or {}
+    known = ", ".join(sorted(API_KEY_ENV))
+    preferred = routing.get("preferred_provider")
+    if preferred and preferred not in API_KEY_ENV:
+        raise ValueError(f"routing.preferred_provider: unknown provider '{preferred}' (expected one of: {known})")
+    for tier, entries in (routing.get("tiers") or {}).items():
+        if tier not in (FAST, STRONG):
+            raise ValueError(f"routing.tiers.{tier}: unknown tier (expected '{FAST}' or '{STRONG}')")
+        for position, entry in enumerate(entries or []):
+            provider = (entry or {}).get("provider")
+            if provider not in API_KEY_ENV:
+                raise ValueError(f"routing.tiers.{tier}[{position}]: unknown provider '{provider}' (expected one of: {known})")
+
+
+def classify_error(exc: Exception) -> Optional[str]:
+    """Return 'rate_limit' or 'timeout' for errors worth failing over on, None otherwise.
+    Works on class names and status codes so provider SDKs need not be imported here."""
+    name = type(exc).__name__.lower()
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429 or "ratelimit" in name:
+        return "rate_limit"
+    if isinstance(exc, TimeoutError) or "timeout" in name or "connection" in name:
+        return "timeout"
+    if status in (500, 502, 503, 504, 529) or "overloaded" in name or "internalserver" in name:
+        return "timeout"
+    return None
+
+
+class RoutedModel:
+    """One provider/model candidate plus its running metrics."""
+
+    def __init__(self, provider: str, model_name: str, llm: Any = None, input_cost_per_mtok: float = 0.0, output_cost_per_mtok: float = 0.0,
+                 factory: Optional[Callable[[], Any]] = None):
+        self.provider = provider
+        self.model_name = model_name
+        # Clients are built on first use, so fallbacks that are never needed cost nothing
+        self._llm = llm
+        self._factory = factory
+        self._tools: Optional[List[Any]] = None
+        self._bound_llm: Any = None
+        self.input_cost_per_mtok = input_cost_per_mtok
+        self.output_cost_per_mtok = output_cost_per_mtok
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.ewma_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.cooldown_until = 0.0
+
+    @property
+    def llm(self) -> Any:
+        if self._llm is None:
+            self._llm = self._factory()
+        return self._llm
+
+    @property
+    def bound_llm(self) -> Any:
+        if self._tools is None:
+            return self.llm
+        if self._bound_llm is None:
+            self._bound_llm = self.llm.bind_tools(tools=self._tools)
+        return self._bound_llm
+
+    def bind_tools(self, tools: List[Any]) -> None:
+        self._tools = tools
+        self._bound_llm = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model_name}"
+
+    @property
+    def error_rate(self) -> float:
+        return self.failures / self.calls if self.calls else 0.0
+
+    def is_cooling_down(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def is_degraded(self, timeout_seconds: float) -> bool:
+        if self.calls < MIN_SAMPLES:
+            return False
+        return self.error_rate > 0.5 or self.ewma_latency > 0.8 * timeout_seconds
+
+    def record_success(self, latency: float, response: Any) -> None:
+        self.calls += 1
+        self.ewma_latency = latency if self.calls == 1 else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0) or 0
+        output_tokens = usage.get("output_tokens", 0) or 0
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += (input_tokens * self.input_cost_per_mtok + output_tokens * self.output_cost_per_mtok) / 1_000_000
+
+    def record_failure(self, kind: Optional[str], cooldown_seconds: float) -> None:
+        self.calls += 1
+        self.failures += 1
+        if kind == "rate_limit":
+            self.rate_limited += 1
+            self.cooldown_until = time.monotonic() + cooldown_seconds
+        elif kind == "timeout":
+            self.timeouts += 1
+            self.cooldown_until = time.monotonic() + cooldown_seconds / 2
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model_name": self.model_name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "timeouts": self.timeouts,
+            "ewma_latency_s": round(self.ewma_latency, 4),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "cooling_down": self.is_cooling_down(time.monotonic()),
+        }
+
+
+class ModelRouter:
+    """Routes LLM calls to the fast or strong tier with automatic failover."""
+
+    def __init__(self, preferred_provider: Optional[str] = None, config: Optional[ConfigLoader] = None):
+        routing = self._load_settings(config)
+        validate_routing(self.config)
+        # Tried first in every tier; routing.preferred_provider, else plain config order
+        preferred_provider = preferred_provider or routing.get("preferred_provider")
+        tiers_config = routing.get("tiers") or {}
+        for tier in (FAST, STRONG):
+            entries = tiers_config.get(tier) or self._default_tier_entries()
+            # The caller's preferred provider goes first, config order otherwise
+            entries = sorted(entries, key=lambda entry: entry["provider"] != preferred_provider)
+            self.tiers[tier] = [self._load_candidate(entry) for entry in entries if os.getenv(API_KEY_ENV[entry["provider"]])]
+            if not self.tiers[tier]:
+                # No keys configured at all: keep the preferred provider so the error surfaces on first call
+                self.tiers[tier] = [self._load_candidate(entries[0])]
+
+    @classmethod
+    def from_llm(cls, llm: Any, config: Optional[ConfigLoader] = None, provider: str = "local", model_name: str = "local") -> "ModelRouter":
+        """Router serving both tiers from one prebuilt chat model (offline benchmarks, tests)."""
+        router = cls.__new__(cls)
+        router._load_settings(config)
+        # Same model in both tiers: escalating would only repeat the call
+        router.strong_final_answer = False
+        router.tiers = {tier: [RoutedModel(provider, model_name, llm)] for tier in (FAST, STRONG)}
+        return router
+
+    def _load_settings(self, config: Optional[ConfigLoader]) -> Dict[str, Any]:
+        self.config = config or ConfigLoader()
+        routing = self.config.get("routing") or {}
+        self.timeout_seconds = float(routing.get("timeout_seconds", 30))
+        self.cooldown_seconds = float(routing.get("rate_limit_cooldown_seconds", 60))
+        self.hard_case_min_chars = int(routing.get("hard_case_min_chars", 400))
+        self.strong_final_answer = bool(routing.get("strong_final_answer", True))
+        self._lock = threading.Lock()
+        self.tiers: Dict[str, List[RoutedModel]] = {}
+        # Optional SharedState: cooldowns after rate limits then apply to every worker process
+        self.shared_state = None
+        return routing
+
+    def _default_tier_entries(self) -> List[Dict[str, Any]]:
+        llm_config = self.config["llm"]
+        return [{"provider": name, "model_name": entry["model_name"]} for name, entry in llm_config.items()]
+
+    def _load_candidate(self, entry: Dict[str, Any]) -> RoutedModel:
+        def factory():
+            loader = ModelLoader(model_provider=entry["provider"], config=self.config)
+            # One client-side retry at most: the router's failover is the retry policy
+            return loader.load_llm(model_name=entry.get("model_name"), timeout=self.timeout_seconds, max_retries=1)
+        return RoutedModel(
+            provider=entry["provider"],
+            model_name=entry.get("model_name") or self.config["llm"][entry["provider"]]["model_name"],
+            input_cost_per_mtok=float(entry.get("input_cost_per_mtok", 0.0)),
+            output_cost_per_mtok=float(entry.get("output_cost_per_mtok", 0.0)),
+            factory=factory,
+        )
+
+    def bind_tools(self, tools: List[Any]) -> "ModelRouter":
+        for candidates in self.tiers.values():
+            for candidate in candidates:
+                candidate.bind_tools(tools)
+        return self
+
+    def candidates(self, tier: str) -> List[RoutedModel]:
+        """Tier candidates ordered for this call: healthy before degraded before cooling down."""
+        now = time.monotonic()
+        with self._lock:
+            ordered = list(enumerate(self.tiers[tier]))
+        shared_cooldowns = set()
+        if self.shared_state is not None and len(ordered) > 1:
+            shared_cooldowns = {candidate.key for _, candidate in ordered if self.shared_state.get(f"cooldown:{candidate.key}")}
+        ordered.sort(key=lambda item: (item[1].is_cooling_down(now) or item[1].key in shared_cooldowns,
+                                       item[1].is_degraded(self.timeout_seconds), item[0]))
+        return [candidate for _, candidate in ordered]
+
+    def choose_tier(self, messages: List[Any]) -> str:
+        """Fast tier by default; strong tier for long, complex requests and, with strong_final_answer,
+        for the step that reads tool results, which usually writes the final answer."""
+        if self.strong_final_answer and messages and getattr(messages[-1], "type", None) == "tool":
+            return STRONG
+        for message in reversed(messages):
+            if getattr(message, "type", None) == "human" or isinstance(message, str):
+                content = message if isinstance(message, str) else message.content
+                if isinstance(content, str) and len(content) >= self.hard_case_min_chars:
+                    return STRONG
+                break
+        return FAST
+
+    def invoke(self, messages: List[Any], tier: str = FAST, with_tools: bool = True) -> Any:
+        """Invoke the first healthy model in the tier, failing over on timeouts and rate limits."""
+        last_error: Optional[Exception] = None
+        for candidate in self.candidates(tier):
+            llm = candidate.bound_llm if with_tools else candidate.llm
+            start = time.perf_counter()
+            try:
+                with span("llm", candidate.key, tier=tier) as attributes:
+                    response = llm.invoke(messages)
+                    usage = getattr(response, "usage_metadata", None) or {}
+                    attributes["input_tokens"] = usage.get("input_tokens", 0) or 0
+                    attributes["output_tokens"] = usage.get("output_tokens", 0) or 0
+            except Exception as e:
+                kind = classify_error(e)
+                with self._lock:
+                    candidate.record_failure(kind, self.cooldown_seconds)
+                cooldown = candidate.cooldown_until - time.monotonic()
+                if kind is not None and self.shared_state is not None and cooldown > 0:
+                    self.shared_state.set(f"cooldown:{candidate.key}", kind, ttl_seconds=cooldown)
+                if kind is None:
+                    raise
+                logger.warning(f"Model {candidate.key} failed ({kind}), failing over...")
+                last_error = e
+                continue
+            with self._lock:
+                candidate.record_success(time.perf_counter() - start, response)
+            record_tokens(candidate.key, attributes["input_tokens"], attributes["output_tokens"])
+            return response
+        raise last_error if last_error else RuntimeError(f"No models configured for tier '{tier}'")
+
+    def invoke_step(self, messages: List[Any]) -> Any:
+        """One agent step on the tier chosen up front (see choose_tier). The strong tier is only
+        called again when the fast model produced malformed tool calls."""
+        tier = self.choose_tier(messages)
+        response = self.invoke(messages, tier)
+        if tier == FAST and getattr(response, "invalid_tool_calls", None):
+            response = self.invoke(messages, STRONG)
+        return response
+
+    def get_metrics(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            return {tier: [candidate.snapshot() for candidate in candidates] for tier, candidates in self.tiers.items()}
+
+    def render_prometheus(self) -> str:
+        """Per-candidate health and cost (get_metrics) in the Prometheus text exposition format."""
+        metrics = self.get_metrics()
+        lines: List[str] = []
+        for name, kind, help_text, field in ROUTER_METRICS:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for tier, snapshots in metrics.items():
+                for snapshot in snapshots:
+                    labels = (("model", f"{snapshot['provider']}:{snapshot['model_name']}"), ("tier", tier))
+                    lines.append(f"{name}{_format_labels(labels)} {float(snapshot[field])}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,162 @@
+"""
+State shared by every worker process of the API (`uvicorn main:app --workers N`),
+kept in one SQLite file in WAL mode so readers never block each other.
+
+Workers keep their own in-memory copies (event caches, model health) and only
+coordinate through this store:
+- versions: counters bumped when a cached resource changes. EventCache compares
+  them on read, so a push notification or a write handled by one worker
+  invalidates that calendar in every worker's cache.
+- values with an optional expiry: watched calendars, model cooldowns after a
+  rate limit.
+- token buckets: per-user request rate limits.
+- leases: background work that must run in one worker only (channel renewal).
+- conversations: the last messages of each (user, thread) for follow-up questions.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_SHARED_STATE_PATH = "data/shared_state.db"
+# Identifies this process as a lease owner
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SharedState:
+    """SQLite-backed state shared between processes. One instance (connection) per process; thread-safe."""
+
+    def __init__(self, path: str = DEFAULT_SHARED_STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit; read-modify-write operations take the write lock with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS versions (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL);"
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "user_id TEXT NOT NULL, thread_id TEXT NOT NULL, messages TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, thread_id));"
+        )
+
+    def _write(self, statements) -> Any:
+        """Run `statements(conn)` in one immediate (write-locked) transaction and return its result."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _one(self, sql: str, args: tuple) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()
+
+    # ---- versions ----
+
+    def version(self, key: str) -> int:
+        row = self._one("SELECT value FROM versions WHERE key = ?", (key,))
+        return row[0] if row else 0
+
+    def bump(self, key: str) -> int:
+        """Increment a version counter and return the new value."""
+        def statements(conn):
+            conn.execute("INSERT INTO versions (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,))
+            return conn.execute("SELECT value FROM versions WHERE key = ?", (key,)).fetchone()[0]
+        return self._write(statements)
+
+    # ---- values ----
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._one("SELECT value, expires FROM kv WHERE key = ?", (key,))
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        expires = time.time() + ttl_seconds if ttl_seconds is not None else None
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, json.dumps(value), expires))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)).rowcount
+
+    # ---- rate limits ----
+
+    def take(self, bucket: str, rate_per_second: float, capacity: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens from a token bucket refilled at `rate_per_second` up to `capacity`.
+        Returns 0 when allowed, else the seconds to wait before `cost` tokens are available."""
+        def statements(conn):
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (bucket,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate_per_second)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate_per_second if rate_per_second > 0 else float("inf")
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (bucket, tokens, now))
+            return wait
+        return self._write(statements)
+
+    # ---- leases ----
+
+    def acquire_lease(self, name: str, ttl_seconds: float, owner: str = PROCESS_ID) -> bool:
+        """Take or extend a named lease. True if `owner` holds it for the next `ttl_seconds`."""
+        def statements(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)", (name, owner, now + ttl_seconds))
+            return True
+        return self._write(statements)
+
+    def release_lease(self, name: str, owner: str = PROCESS_ID) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    # ---- conversations ----
+
+    def load_conversation(self, user_id: Optional[str], thread_id: str) -> List[Dict[str, Any]]:
+        row = self._one("SELECT messages FROM conversations WHERE user_id = ? AND thread_id = ?", (user_id or "", thread_id))
+        return json.loads(row[0]) if row else []
+
+    def append_conversation(self, user_id: Optional[str], thread_id: str, messages: List[Dict[str, Any]], keep: int) -> None:
+        """Append messages to a thread and keep its last `keep`, in one transaction, so concurrent
+        requests on the same thread (in any worker) never drop each other's turns."""
+        def statements(conn):
+            row = conn.execute("SELECT messages FROM conversations WHERE user_id = ? AND thread_id = ?", (user_id or "", thread_id)).fetchone()
+            kept = (json.loads(row[0]) if row else []) + messages
+            conn.execute(
+                "INSERT OR REPLACE INTO conversations (user_id, thread_id, messages, updated_at) VALUES (?, ?, ?, ?)",
+                (user_id or "", thread_id, json.dumps(kept[-keep:] if keep else []), time.time()),
+            )
+        self._write(statements)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
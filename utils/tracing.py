@@ -0,0 +1,192 @@
+"""
+Lightweight in-process tracing and Prometheus-style metrics.
+
+Spans wrap LangGraph nodes, LLM calls, tool invocations and Google Calendar HTTP
+calls. Every span feeds a latency histogram; when a request trace is active
+(debug mode) the span is also appended to that trace. Overhead per span is a
+couple of perf_counter() calls, a lock and a bisect, so it stays on in production.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds, covering fast cache hits up to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+SPAN_METRIC = "scheduler_span_duration_seconds"
+TOKENS_METRIC = "scheduler_llm_tokens_total"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile (upper bound of the bucket holding it)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.help: Dict[str, str] = {
+            SPAN_METRIC: "Duration of traced operations (graph nodes, LLM calls, tools, Calendar API calls).",
+            TOKENS_METRIC: "LLM tokens consumed, by model and direction.",
+        }
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1.0) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain-dict copy of all series, for benchmarks and debugging."""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: {key: {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p99": h.quantile(0.99)} for key, h in series.items()}
+                    for name, series in self.histograms.items()
+                },
+                "counters": {name: dict(series) for name, series in self.counters.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self.histograms.items():
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    running = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        running += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(bound)))} {running}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for name, series in self.counters.items():
+                lines.append(f"# HELP {name} {self.help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+registry = MetricsRegistry()
+
+# Spans of the current request, only set while a debug trace is being collected
+_current_trace: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar("current_trace", default=None)
+_trace_origin: contextvars.ContextVar[float] = contextvars.ContextVar("trace_origin", default=0.0)
+
+
+@contextmanager
+def collect_trace() -> Iterator[List[Dict[str, Any]]]:
+    """Collect every span of the enclosed work into a list (used for debug responses)."""
+    spans: List[Dict[str, Any]] = []
+    trace_token = _current_trace.set(spans)
+    origin_token = _trace_origin.set(time.perf_counter())
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(trace_token)
+        _trace_origin.reset(origin_token)
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """Time an operation. The yielded dict can be filled with extra attributes (e.g. token counts)."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        registry.observe(SPAN_METRIC, {"kind": kind, "name": name, "status": status}, duration)
+        spans = _current_trace.get()
+        if spans is not None:
+            spans.append({
+                "kind": kind,
+                "name": name,
+                "status": status,
+                "start_ms": round((start - _trace_origin.get()) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **attributes,
+            })
+
+
+def traced(kind: str, name: Optional[str] = None):
+    """Decorator form of span(); the span name defaults to the function name."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_tokens(model: str, input_tokens: int, output_tokens: int) -> None:
+    if input_tokens:
+        registry.inc(TOKENS_METRIC, {"model": model, "direction": "input"}, input_tokens)
+    if output_tokens:
+        registry.inc(TOKENS_METRIC, {"model": model, "direction": "output"}, output_tokens)